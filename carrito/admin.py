@@ -1,35 +1,212 @@
-from django.contrib import admin
-from .models import Producto, Orden, OrdenItem
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils.html import format_html
+
+from .models import (
+    AlertaStock, MovimientoStock, Orden, OrdenItem, Producto, Reserva, VentaDiaria, VentaProductoDiaria,
+)
+from .paginacion import PaginadorEstimado
+
+
+class StockActionForm(ActionForm):
+    cantidad = forms.IntegerField(required=False, label="Cantidad")
 
 
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
-    list_display = ("nombre", "precio", "stock", "creado")
+    list_display = ("nombre", "precio", "stock", "stock_total", "stock_fragmentado", "umbral_stock", "creado")
     list_editable = ("precio", "stock")
     prepopulated_fields = {"slug": ("nombre",)}
     search_fields = ("nombre",)
     ordering = ("nombre",)
+    action_form = StockActionForm
+    actions = ["sumar_stock", "restar_stock", "fijar_stock"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).con_stock_total()
+
+    @admin.display(description="Stock total", ordering="stock_total")
+    def stock_total(self, obj):
+        # Con stock fragmentado, 'stock' es solo lo de la fila (lo que se repone)
+        return obj.stock_total
+
+    # Acciones masivas: un UPDATE para todos los seleccionados (+ su INSERT en el libro)
+
+    def _cantidad(self, request):
+        try:
+            cantidad = self.action_form.base_fields["cantidad"].clean(request.POST.get("cantidad"))
+        except ValidationError:
+            cantidad = None
+        if cantidad is None:
+            self.message_user(request, "Indicá la cantidad junto a la acción.", messages.ERROR)
+        return cantidad
+
+    @admin.action(description="Sumar la cantidad al stock")
+    def sumar_stock(self, request, queryset):
+        cantidad = self._cantidad(request)
+        if cantidad is not None:
+            cambiados = queryset.sumar_stock(cantidad)
+            self.message_user(request, f"Stock actualizado en {cambiados} productos.", messages.SUCCESS)
+
+    @admin.action(description="Restar la cantidad del stock")
+    def restar_stock(self, request, queryset):
+        cantidad = self._cantidad(request)
+        if cantidad is not None:
+            seleccionados = queryset.count()
+            cambiados = queryset.sumar_stock(-cantidad, motivo="ajuste")
+            self.message_user(request, f"Stock actualizado en {cambiados} productos.", messages.SUCCESS)
+            if cambiados < seleccionados:
+                self.message_user(
+                    request, f"{seleccionados - cambiados} no tenían stock suficiente y no se tocaron.",
+                    messages.WARNING,
+                )
+
+    @admin.action(description="Fijar el stock en la cantidad")
+    def fijar_stock(self, request, queryset):
+        cantidad = self._cantidad(request)
+        if cantidad is not None:
+            try:
+                cambiados = queryset.fijar_stock(cantidad)
+            except ValidationError as e:
+                self.message_user(request, e.messages[0], messages.ERROR)
+                return
+            self.message_user(request, f"Stock fijado en {cantidad} para {cambiados} productos.", messages.SUCCESS)
 
 
 class OrdenItemInline(admin.TabularInline):
     model = OrdenItem
     extra = 0
     readonly_fields = ("precio",)
+    # Un <select> con todo el catálogo por fila no escala
+    autocomplete_fields = ("producto",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("producto")
+
+
+def _por_orden(agregado):
+    """Subquery correlacionada: el COUNT del paginador la descarta (no es un JOIN + GROUP BY)."""
+    items = OrdenItem.objects.filter(orden=OuterRef("pk")).order_by().values("orden")
+    return Coalesce(Subquery(items.annotate(v=agregado).values("v"), output_field=IntegerField()), Value(0))
 
 
 @admin.register(Orden)
 class OrdenAdmin(admin.ModelAdmin):
-    list_display = ("id", "nombre", "apellido", "dni", "metodo_pago", "estado", "total", "creado")
+    list_display = (
+        "id", "nombre", "apellido", "dni", "metodo_pago", "estado", "items", "unidades", "total", "creado",
+    )
     list_filter = ("estado", "metodo_pago", "creado")
     inlines = [OrdenItemInline]
     readonly_fields = ("total", "creado", "estado")
+    autocomplete_fields = ("usuario",)
     date_hierarchy = "creado"
-    search_fields = ("nombre", "apellido", "dni", "usuario__username")
+    search_fields = ("=id", "nombre", "apellido", "dni", "usuario__username")
     ordering = ("-creado",)
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    actions = ["cancelar_ordenes"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            cantidad_items=_por_orden(Count("pk")),
+            cantidad_unidades=_por_orden(Sum("cantidad")),
+        )
+
+    @admin.display(description="Items", ordering="cantidad_items")
+    def items(self, obj):
+        url = reverse("admin:carrito_ordenitem_changelist") + f"?orden__id__exact={obj.pk}"
+        return format_html('<a href="{}">{}</a>', url, obj.cantidad_items)
+
+    @admin.display(description="Unidades", ordering="cantidad_unidades")
+    def unidades(self, obj):
+        return obj.cantidad_unidades
+
+    @admin.action(description="Cancelar las órdenes seleccionadas (repone stock)")
+    def cancelar_ordenes(self, request, queryset):
+        seleccionadas = queryset.count()
+        canceladas = queryset.cancelar()
+        self.message_user(request, f"{canceladas} órdenes canceladas.", messages.SUCCESS)
+        if canceladas < seleccionadas:
+            self.message_user(
+                request, f"{seleccionadas - canceladas} ya estaban canceladas y no se tocaron.", messages.WARNING
+            )
 
 
 @admin.register(OrdenItem)
 class OrdenItemAdmin(admin.ModelAdmin):
-    list_display = ("orden", "producto", "cantidad", "precio")
-    list_filter = ("orden",)
+    list_display = ("orden", "producto", "cantidad", "precio", "subtotal")
+    list_select_related = ("orden", "producto")
+    # Sin list_filter por orden (cargaba todas las órdenes): se busca por número
+    # o se llega desde la columna "Items" de OrdenAdmin (?orden__id__exact=)
+    search_fields = ("=orden__id", "producto__nombre")
+    autocomplete_fields = ("orden", "producto")
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+
+@admin.register(Reserva)
+class ReservaAdmin(admin.ModelAdmin):
+    list_display = ("producto", "cantidad", "sesion", "expira")
+    list_select_related = ("producto",)
+    search_fields = ("producto__nombre", "sesion")
+    ordering = ("expira",)
+
+
+class _VentaAgregadaAdmin(admin.ModelAdmin):
+    """Solo lectura: los agregados los escriben Orden.confirmar y reconstruir_ventas."""
+    date_hierarchy = "fecha"
+    list_filter = ("estado", "metodo_pago")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VentaDiaria)
+class VentaDiariaAdmin(_VentaAgregadaAdmin):
+    list_display = ("fecha", "metodo_pago", "estado", "ordenes", "unidades", "ingresos")
+
+
+@admin.register(VentaProductoDiaria)
+class VentaProductoDiariaAdmin(_VentaAgregadaAdmin):
+    list_display = ("fecha", "producto", "metodo_pago", "estado", "ordenes", "unidades", "ingresos")
+    list_select_related = ("producto",)
+    search_fields = ("producto__nombre",)
+
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    """Libro de solo lectura: lo escriben las ventas, reposiciones, importaciones y ajustes."""
+    list_display = ("creado", "producto", "cantidad", "motivo", "orden")
+    list_filter = ("motivo",)
+    list_select_related = ("producto", "orden")
+    search_fields = ("producto__nombre", "producto__slug")
+    date_hierarchy = "creado"
+    raw_id_fields = ("producto", "orden")
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AlertaStock)
+class AlertaStockAdmin(admin.ModelAdmin):
+    list_display = ("creado", "producto", "stock", "umbral", "resuelta")
+    list_filter = (("resuelta", admin.EmptyFieldListFilter),)
+    list_select_related = ("producto",)
     search_fields = ("producto__nombre",)
+    readonly_fields = ("producto", "stock", "umbral", "creado")
@@ -0,0 +1,319 @@
+"""
+Benchmarks de los caminos calientes del storefront.
+
+Cada escenario es una función (client, contexto) -> callable que hace UN request
+por el test client de Django. El runner (management command "benchmark") los
+corre contra una BD de test sembrada con un catálogo sintético y mide latencia
+(p50/p95), queries por request y allocations.
+
+checkout_concurrente() es el test de carga de un solo SKU (comando
+carga_checkout): muchos checkouts en paralelo sobre el mismo producto, con la
+fila de Producto o con el stock fragmentado.
+
+checkout_procesos() es el test de estrés del comando estres_checkout: varios
+procesos (como los workers de gunicorn) hacen el recorrido HTTP completo,
+agregar al carrito + POST a CheckoutView, contra el mismo archivo SQLite.
+"""
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from . import catalogo
+from .models import Orden, OrdenItem, Producto
+
+DATOS_CHECKOUT = {
+    "nombre": "Bench",
+    "apellido": "Mark",
+    "dni": "30111222",
+    "direccion": "Calle Falsa 123",
+    "metodo_pago": "tarjeta",
+}
+
+
+def sembrar(productos=500, ordenes=200, items_por_orden=3, semilla=42):
+    """Catálogo sintético + historial de órdenes confirmadas (todo con bulk_create)."""
+    rnd = random.Random(semilla)
+    Producto.objects.bulk_create(
+        [
+            Producto(
+                nombre=f"Joya {i:06d}",
+                slug=f"joya-{i:06d}",
+                descripcion="Pieza sintética para benchmarks",
+                precio=Decimal(rnd.randint(1000, 90000)) / 100,
+                stock=1_000_000,
+            )
+            for i in range(productos)
+        ],
+        batch_size=1000,
+    )
+    ids = list(Producto.objects.values_list("id", "precio"))
+    creadas = Orden.objects.bulk_create(
+        [Orden(estado="confirmada", **DATOS_CHECKOUT) for _ in range(ordenes)],
+        batch_size=1000,
+    )
+    items = []
+    for orden in creadas:
+        for pid, precio in rnd.sample(ids, min(items_por_orden, len(ids))):
+            items.append(OrdenItem(orden=orden, producto_id=pid, cantidad=1, precio=precio))
+    OrdenItem.objects.bulk_create(items, batch_size=1000)
+    catalogo.invalidar()
+
+
+def _slugs(n=50):
+    return list(Producto.objects.order_by("?").values_list("slug", flat=True)[:n])
+
+
+def _llenar_carrito(client, slugs, lineas=3):
+    for slug in slugs[:lineas]:
+        client.post(reverse("carrito:carrito-agregar", args=[slug]), {"cantidad": 1})
+
+
+# --- Escenarios: preparan estado fuera de la medición y devuelven el request a medir ---
+
+def escenario_lista(client, ctx):
+    paginas = ctx["paginas"]
+    rnd = ctx["rnd"]
+
+    def request():
+        if ctx["sin_cache"]:
+            catalogo._subir_version()
+        return client.get(reverse("carrito:home"), {"page": rnd.randint(1, paginas)})
+    return request
+
+
+def escenario_detalle(client, ctx):
+    slugs, rnd = ctx["slugs"], ctx["rnd"]
+    return lambda: client.get(reverse("carrito:producto-detalle", args=[rnd.choice(slugs)]))
+
+
+def escenario_carrito(client, ctx):
+    _llenar_carrito(client, ctx["slugs"])
+    return lambda: client.get(reverse("carrito:carrito-detalle"))
+
+
+def escenario_agregar(client, ctx):
+    slugs, rnd = ctx["slugs"], ctx["rnd"]
+    return lambda: client.post(
+        reverse("carrito:carrito-agregar", args=[rnd.choice(slugs)]), {"cantidad": 1}
+    )
+
+
+def escenario_checkout(client, ctx):
+    def request():
+        return client.post(reverse("carrito:checkout"), DATOS_CHECKOUT)
+    # El carrito se vacía en cada checkout: se vuelve a llenar antes de cada medición
+    request.preparar = lambda: _llenar_carrito(client, ctx["slugs"])
+    return request
+
+
+ESCENARIOS = {
+    "lista": escenario_lista,
+    "detalle": escenario_detalle,
+    "carrito": escenario_carrito,
+    "agregar": escenario_agregar,
+    "checkout": escenario_checkout,
+}
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    k = (len(ordenados) - 1) * p / 100
+    f = int(k)
+    c = min(f + 1, len(ordenados) - 1)
+    return ordenados[f] + (ordenados[c] - ordenados[f]) * (k - f)
+
+
+def medir(nombre, client_factory, ctx, iteraciones=50, calentamiento=5, muestras_memoria=5):
+    """
+    Dos pasadas: una de tiempos "limpia" y otra corta instrumentada
+    (queries + tracemalloc), para que la instrumentación no infle la latencia.
+    """
+    client = client_factory()
+    request = ESCENARIOS[nombre](client, ctx)
+    preparar = getattr(request, "preparar", None)
+
+    for _ in range(calentamiento):
+        if preparar:
+            preparar()
+        request()
+
+    tiempos = []
+    for _ in range(iteraciones):
+        if preparar:
+            preparar()
+        t0 = time.perf_counter()
+        response = request()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{nombre}: status {response.status_code}")
+
+    queries, alloc_kb, bloques = [], [], []
+    for _ in range(muestras_memoria):
+        if preparar:
+            preparar()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as capturadas:
+            request()
+        actual, pico = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        queries.append(len(capturadas))
+        alloc_kb.append(pico / 1024)
+        bloques.append(sum(stat.count for stat in snapshot.statistics("filename")))
+
+    return {
+        "escenario": nombre,
+        "iteraciones": iteraciones,
+        "p50_ms": round(_percentil(tiempos, 50), 3),
+        "p95_ms": round(_percentil(tiempos, 95), 3),
+        "media_ms": round(statistics.fmean(tiempos), 3),
+        "queries": max(queries) if queries else 0,
+        "pico_alloc_kb": round(statistics.fmean(alloc_kb), 1) if alloc_kb else 0.0,
+        "bloques_vivos": int(statistics.fmean(bloques)) if bloques else 0,
+    }
+
+
+def checkout_concurrente(producto, ordenes, hilos, cantidad=1):
+    """
+    'ordenes' checkouts de 'cantidad' unidades de 'producto' repartidos en
+    'hilos' threads, cada uno con su conexión. Cada checkout es la misma
+    transacción que CheckoutView.crear_orden (orden + items + confirmar).
+    Los conflictos de lock que devuelve la BD (OperationalError) se
+    reintentan y se cuentan; la latencia incluye los reintentos.
+    """
+    tickets = iter(range(ordenes))
+    candado = threading.Lock()
+    latencias, resultado = [], {"confirmadas": 0, "sin_stock": 0, "reintentos": 0}
+
+    def trabajar():
+        try:
+            while True:
+                with candado:
+                    if next(tickets, None) is None:
+                        return
+                t0 = time.perf_counter()
+                estado = _un_checkout(producto, cantidad)
+                with candado:
+                    latencias.append((time.perf_counter() - t0) * 1000)
+                    resultado["reintentos"] += estado["reintentos"]
+                    resultado["confirmadas" if estado["ok"] else "sin_stock"] += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=trabajar) for _ in range(hilos)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    segundos = time.perf_counter() - t0
+
+    return {
+        **resultado,
+        "segundos": round(segundos, 3),
+        "ordenes_s": round(ordenes / segundos, 1) if segundos else 0.0,
+        "p50_ms": round(_percentil(latencias, 50), 3),
+        "p95_ms": round(_percentil(latencias, 95), 3),
+    }
+
+
+def _un_checkout(producto, cantidad, max_reintentos=50):
+    reintentos = 0
+    while True:
+        try:
+            with transaction.atomic():
+                orden = Orden.objects.create(**DATOS_CHECKOUT)
+                items = OrdenItem.objects.bulk_create([
+                    OrdenItem(orden=orden, producto=producto, cantidad=cantidad, precio=producto.precio)
+                ])
+                orden.confirmar(items=items)
+            return {"ok": True, "reintentos": reintentos}
+        except ValidationError:
+            return {"ok": False, "reintentos": reintentos}
+        except OperationalError:
+            # SQLite: "database is locked"; Postgres: deadlock/serialization
+            reintentos += 1
+            if reintentos > max_reintentos:
+                raise
+            time.sleep(random.uniform(0, 0.002 * reintentos))
+
+
+def checkout_procesos(producto, ordenes, procesos, cantidad=1):
+    """
+    'ordenes' compras de 'cantidad' unidades de 'producto' repartidas en
+    'procesos' procesos, cada una con su propio Client (comprador nuevo):
+    POST agregar al carrito + POST checkout, como en el sitio. Sin
+    reintentos: un "database is locked" cuenta como error.
+    La conexión del proceso actual se cierra antes de lanzar los hijos.
+    """
+    db = connection.settings_dict
+    partes = [ordenes // procesos + (1 if i < ordenes % procesos else 0) for i in range(procesos)]
+    connections.close_all()
+    t0 = time.perf_counter()
+    with multiprocessing.get_context().Pool(
+        procesos, initializer=_iniciar_proceso, initargs=(db["NAME"], db["OPTIONS"])
+    ) as pool:
+        parciales = pool.map(_comprar, [(producto.slug, n, cantidad) for n in partes if n])
+    segundos = time.perf_counter() - t0
+
+    resultado = {"confirmadas": 0, "sin_stock": 0, "errores": 0}
+    latencias = []
+    for parcial in parciales:
+        latencias += parcial.pop("latencias")
+        for clave, valor in parcial.items():
+            resultado[clave] += valor
+    return {
+        **resultado,
+        "segundos": round(segundos, 3),
+        "ordenes_s": round(resultado["confirmadas"] / segundos, 1) if segundos else 0.0,
+        "p50_ms": round(_percentil(latencias, 50), 3),
+        "p95_ms": round(_percentil(latencias, 95), 3),
+    }
+
+
+def _iniciar_proceso(nombre_db, opciones):
+    # Con "spawn" (macOS/Windows) el hijo arranca Django de cero
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    connections["default"].settings_dict.update(NAME=nombre_db, OPTIONS=opciones)
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+    settings.QUERY_BUDGETS = {}
+
+
+def _comprar(args):
+    slug, ordenes, cantidad = args
+    resultado = {"confirmadas": 0, "sin_stock": 0, "errores": 0, "latencias": []}
+    agregar = reverse("carrito:carrito-agregar", args=[slug])
+    checkout = reverse("carrito:checkout")
+    try:
+        for _ in range(ordenes):
+            client = Client()
+            t0 = time.perf_counter()
+            try:
+                client.post(agregar, {"cantidad": cantidad}, secure=True)
+                r = client.post(checkout, {**DATOS_CHECKOUT, "clave_idempotencia": uuid.uuid4().hex}, secure=True)
+            except OperationalError:
+                resultado["errores"] += 1
+                continue
+            resultado["latencias"].append((time.perf_counter() - t0) * 1000)
+            vendida = r.status_code == 302 and resolve(r.url).url_name == "success"
+            resultado["confirmadas" if vendida else "sin_stock"] += 1
+    finally:
+        connections.close_all()
+    return resultado
@@ -0,0 +1,158 @@
+"""
+Búsqueda de productos del storefront.
+
+- SQLite: tabla virtual FTS5 (carrito_producto_fts) con rowid = Producto.id,
+  mantenida por señales en cada save/delete.
+- Postgres: índice GIN sobre el tsvector de nombre + descripción y un índice
+  trigram sobre nombre (acelera el icontains de respaldo). Los mantiene Postgres.
+- Otros motores: icontains sin índice.
+
+Para reconstruir todo: python manage.py reindexar_busqueda
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, Q
+
+FTS_TABLA = "carrito_producto_fts"
+CONFIG_PG = "spanish"
+
+ORDENES = {
+    "precio": ("precio", "pk"),
+    "-precio": ("-precio", "pk"),
+    "nuevos": ("-creado", "-pk"),
+}
+
+_fts_disponible = None
+
+
+def motor() -> str:
+    """'sqlite' (si existe la tabla FTS5), 'postgresql' o 'basico'."""
+    global _fts_disponible
+    if connection.vendor == "postgresql":
+        return "postgresql"
+    if connection.vendor == "sqlite":
+        if _fts_disponible is None:
+            _fts_disponible = FTS_TABLA in connection.introspection.table_names()
+        if _fts_disponible:
+            return "sqlite"
+    return "basico"
+
+
+def _palabras(texto: str):
+    return re.findall(r"\w+", texto or "")
+
+
+def _consulta_fts(texto: str) -> str:
+    # Cada palabra como prefijo entre comillas: el usuario no puede inyectar sintaxis FTS5
+    return " ".join(f'"{w}"*' for w in _palabras(texto))
+
+
+def vector_pg():
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector("nombre", "descripcion", config=CONFIG_PG)
+
+
+# --- Mantenimiento incremental (solo SQLite; Postgres se mantiene solo) ---
+
+def indexar(producto) -> None:
+    if motor() != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLA} WHERE rowid = %s", [producto.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLA}(rowid, nombre, descripcion) VALUES (%s, %s, %s)",
+            [producto.pk, producto.nombre, producto.descripcion],
+        )
+
+
+def desindexar(pk) -> None:
+    if motor() != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLA} WHERE rowid = %s", [pk])
+
+
+def indexar_slugs(slugs) -> None:
+    """Reindexa un lote de productos (importaciones con bulk_create, sin señales)."""
+    if motor() != "sqlite" or not slugs:
+        return
+    marcas = ", ".join(["%s"] * len(slugs))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLA} WHERE rowid IN "
+            f"(SELECT id FROM carrito_producto WHERE slug IN ({marcas}))",
+            list(slugs),
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLA}(rowid, nombre, descripcion) "
+            f"SELECT id, nombre, descripcion FROM carrito_producto WHERE slug IN ({marcas})",
+            list(slugs),
+        )
+
+
+def reconstruir() -> str:
+    """Reconstruye el índice completo; devuelve el motor usado."""
+    usado = motor()
+    with connection.cursor() as cursor:
+        if usado == "sqlite":
+            cursor.execute(f"DELETE FROM {FTS_TABLA}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLA}(rowid, nombre, descripcion) "
+                "SELECT id, nombre, descripcion FROM carrito_producto"
+            )
+            cursor.execute(f"INSERT INTO {FTS_TABLA}({FTS_TABLA}) VALUES ('optimize')")
+        elif usado == "postgresql":
+            cursor.execute("REINDEX INDEX producto_busqueda_gin")
+            cursor.execute("REINDEX INDEX producto_nombre_trgm")
+    return usado
+
+
+# --- Consulta ---
+
+def buscar(queryset, texto="", precio_min=None, precio_max=None, en_stock=False, orden=""):
+    """
+    Aplica texto + filtros + orden sobre 'queryset' (de Producto).
+    Sin 'orden' explícito y con texto, ordena por relevancia.
+    """
+    usado = motor()
+    relevancia = None
+
+    if _palabras(texto):
+        if usado == "sqlite":
+            # JOIN contra la tabla virtual (una sola pasada por el índice FTS5);
+            # extra() porque el ORM no modela tablas virtuales.
+            queryset = queryset.extra(
+                tables=[FTS_TABLA],
+                where=[f"{FTS_TABLA}.rowid = carrito_producto.id", f"{FTS_TABLA} MATCH %s"],
+                params=[_consulta_fts(texto)],
+                # bm25: más negativo = más relevante
+                select={"relevancia": f"{FTS_TABLA}.rank"},
+            )
+            relevancia = "relevancia"
+        elif usado == "postgresql":
+            from django.contrib.postgres.search import SearchQuery, SearchRank
+            consulta = SearchQuery(
+                " & ".join(f"{w}:*" for w in _palabras(texto)), config=CONFIG_PG, search_type="raw"
+            )
+            queryset = queryset.annotate(vector=vector_pg()).filter(
+                Q(vector=consulta) | Q(nombre__icontains=texto.strip())
+            )
+            queryset = queryset.annotate(relevancia=SearchRank(F("vector"), consulta))
+            relevancia = F("relevancia").desc()
+        else:
+            for w in _palabras(texto):
+                queryset = queryset.filter(Q(nombre__icontains=w) | Q(descripcion__icontains=w))
+
+    if precio_min is not None:
+        queryset = queryset.filter(precio__gte=precio_min)
+    if precio_max is not None:
+        queryset = queryset.filter(precio__lte=precio_max)
+    if en_stock:
+        queryset = queryset.en_stock()
+
+    if orden in ORDENES:
+        return queryset.order_by(*ORDENES[orden])
+    if relevancia is not None:
+        return queryset.order_by(relevancia, "nombre", "pk")
+    return queryset.order_by("nombre", "pk")
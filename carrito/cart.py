@@ -1,45 +1,187 @@
 from decimal import Decimal
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from .models import Producto
+from . import catalogo, routers
+from .cart_storage import get_storage
+from .models import Producto, Reserva
 
 
 # --- Excepciones específicas del carrito ---
 class CartError(Exception):
     """Error genérico del carrito."""
 
+    def __init__(self, mensaje="", errores=None):
+        super().__init__(mensaje)
+        # En actualizaciones por lote: {"product_id": motivo} de cada línea rechazada
+        self.errores = errores or {}
+
 
 class StockInsuficienteError(CartError):
     """Se intentó poner una cantidad mayor al stock disponible."""
 
 
 class Cart:
-    SESSION_KEY = "cart"
-
-    def __init__(self, request):
-        self.session = request.session
-        cart = self.session.get(self.SESSION_KEY)
-        if cart is None:
-            cart = {}
-            self.session[self.SESSION_KEY] = cart
+    """
+    Carrito guardado en el storage, con un resumen que se mantiene en cada
+    cambio: unidades, líneas, último precio conocido de cada línea, total y
+    la versión del catálogo en la que esos precios se leyeron de Producto.
+
+    El badge del navbar y cart.total salen del resumen sin consultar la BD;
+    las líneas se revalidan contra Producto (snapshot) solo si la versión del
+    catálogo cambió desde entonces o al mostrar el carrito y en el checkout.
+
+    La versión es catalogo.version(), que vive en el cache: vale entre
+    workers si el cache es compartido (CACHE_URL file o Redis). Con locmem
+    cada worker tiene su contador, que arranca en un valor al azar: una
+    estampa de otro worker no coincide y el resumen se revalida (una query
+    de más, nunca un total viejo). Con SignedCookieCartStorage el resumen
+    (precio por línea) ocupa casi lo mismo que las líneas; si no entra en la
+    cookie se guarda sin él (ver cart_storage).
+    """
+
+    def __init__(self, request, data=None, resumen=None):
+        # Session, cookie firmada o cache según settings.CARRITO_STORAGE
+        self.storage = get_storage(request)
         # dict: { "product_id": {"qty": int} }
-        self.cart = cart
+        if data is None:
+            data, resumen = self.storage.cargar(), self.storage.cargar_resumen()
+        self.cart = data
+        self._resumen = self._normalizar_resumen(resumen)
+        # Snapshot memoizado de las líneas (una sola query a Producto por request)
+        self._items = None
+
+    @classmethod
+    async def acrear(cls, request):
+        """Constructor para vistas async: carga el carrito sin bloquear el event loop."""
+        storage = get_storage(request)
+        return cls(request, data=await storage.acargar(), resumen=await storage.acargar_resumen())
 
     # --- Helpers internos ---
     def _norm_key(self, product_id):
         # Fuerza siempre str de un int (lanza ValueError si no es convertible)
         return str(int(product_id))
 
-    def _mark_modified(self):
-        self.session.modified = True
+    def _mark_modified(self, precios=None, version=None):
+        """
+        Guarda líneas y resumen. 'precios' ({clave: precio}) son los leídos
+        de Producto en la versión 'version' del catálogo para esta operación.
+        """
+        resumen = self._nuevo_resumen(precios, version)
+        self.storage.guardar(self.cart, resumen)
+        self._resumen = resumen
+        self._invalidar()
+
+    def _invalidar(self):
+        """Descarta el snapshot; la próxima lectura vuelve a consultar Producto."""
+        self._items = None
+
+    # --- Resumen ---
+
+    def _normalizar_resumen(self, resumen):
+        # Carritos guardados antes del resumen (o cookie corrupta): se arma
+        # con lo que hay, sin precios; el total se completa al revalidar.
+        if not isinstance(resumen, dict) or not {"unidades", "lineas", "total", "version", "precios"} <= resumen.keys():
+            self._resumen = {"precios": {}, "version": None}
+            return self._nuevo_resumen()
+        return resumen
+
+    def _nuevo_resumen(self, precios=None, version=None):
+        """
+        Recalcula el resumen a partir de las líneas y los precios conocidos
+        (sin IO). La versión pasa a 'version' solo si todas las líneas tienen
+        precio leído en esa versión; si no, queda la más vieja.
+        """
+        frescos = {key: str(precio) for key, precio in (precios or {}).items()}
+        conocidos = {**self._resumen["precios"], **frescos}
+        unidades = lineas = 0
+        total = Decimal("0.00")
+        precios_lineas = {}
+        for key, linea in self.cart.items():
+            try:
+                qty = int(linea.get("qty", 0))
+            except (AttributeError, TypeError, ValueError):
+                continue
+            if qty <= 0:
+                continue
+            unidades += qty
+            lineas += 1
+            if key in conocidos:
+                precios_lineas[key] = conocidos[key]
+                total += Decimal(conocidos[key]) * qty
+        completo = len(precios_lineas) == lineas
+        estampa = self._resumen["version"]
+        if precios is not None and completo and precios_lineas.keys() <= frescos.keys():
+            estampa = version
+        return {
+            "unidades": unidades,
+            "lineas": lineas,
+            "total": str(total) if completo else None,
+            "version": estampa,
+            "precios": precios_lineas,
+        }
+
+    def _resumen_vigente(self, version) -> bool:
+        """True si el total guardado sigue valiendo para la versión actual del catálogo."""
+        r = self._resumen
+        return r["total"] is not None and (r["lineas"] == 0 or r["version"] == version)
+
+    def resumen(self) -> dict:
+        """
+        Unidades, líneas y último total conocido, sin consultar Producto (lo
+        expone a los templates carrito.context_processors.carrito). 'vigente'
+        es False si el catálogo cambió desde que se calculó el total.
+        """
+        r = self._resumen
+        return {
+            "unidades": r["unidades"],
+            "lineas": r["lineas"],
+            "total": None if r["total"] is None else Decimal(r["total"]),
+            "vigente": self._resumen_vigente(catalogo.version()),
+        }
 
     def _get_producto(self, product_id) -> Producto:
         pid = int(product_id)
-        return Producto.objects.get(id=pid)
+        return Producto.objects.con_disponible(excluir_sesion=self.clave_reserva()).get(id=pid)
+
+    def clave_reserva(self, crear=True):
+        """
+        Clave con la que se guardan las reservas de este carrito (la da el storage).
+        Con crear=False no fuerza la creación de la sesión/cookie (lecturas).
+        """
+        return self.storage.clave(crear=crear)
 
     def _get_current_qty(self, product_id) -> int:
         return int(self.cart.get(self._norm_key(product_id), {}).get("qty", 0))
 
+    @staticmethod
+    def _validar_qty(qty) -> int:
+        qty = int(qty)
+        if qty < 0:
+            raise ValidationError("La cantidad no puede ser negativa.")
+        return qty
+
+    def _nueva_cantidad(self, producto, key, qty, override) -> int:
+        """
+        Cantidad final de la línea (lógica común a add y aadd, sin IO).
+        Levanta StockInsuficienteError si supera el disponible.
+        """
+        actual = 0 if override else self._get_current_qty(key)
+        nueva_cantidad = qty if override else (actual + qty)
+        if nueva_cantidad <= 0:
+            return nueva_cantidad
+        disponible = max(producto.disponible, 0)
+        if nueva_cantidad > disponible:
+            raise StockInsuficienteError(
+                f"Solo hay {disponible} unidades disponibles de «{producto.nombre}»."
+            )
+        return nueva_cantidad
+
+    def _deshacer_linea(self, key, anterior):
+        if anterior is None:
+            self.cart.pop(key, None)
+        else:
+            self.cart[key] = anterior
+
     # --- API pública ---
 
     def add(self, product_id, qty=1, override=False):
@@ -49,34 +191,36 @@ class Cart:
         - Si override=True, reemplaza por 'qty' exacto.
 
         Valida stock:
-        - Si la cantidad final requerida supera el stock, levanta StockInsuficienteError.
+        - Si la cantidad final requerida supera el disponible (stock menos
+          reservas de otros carritos), levanta StockInsuficienteError.
 
-        No devuelve nada; si no hay error, deja el carrito actualizado.
+        No devuelve nada; si no hay error, deja el carrito actualizado y la
+        reserva de stock renovada.
         """
         key = self._norm_key(product_id)
-        qty = int(qty)
-
-        if qty < 0:
-            raise ValidationError("La cantidad no puede ser negativa.")
+        qty = self._validar_qty(qty)
 
+        version = catalogo.version()
         producto = self._get_producto(product_id)
-        actual = 0 if override else self._get_current_qty(product_id)
-        nueva_cantidad = qty if override else (actual + qty)
+        nueva_cantidad = self._nueva_cantidad(producto, key, qty, override)
 
         if nueva_cantidad <= 0:
             # Quitar si quedó en 0 o menos
             self.cart.pop(key, None)
+            Reserva.liberar(self.clave_reserva(), producto.id)
             self._mark_modified()
             return
 
-        if nueva_cantidad > producto.stock:
-            raise StockInsuficienteError(
-                f"Solo hay {producto.stock} unidades disponibles de «{producto.nombre}»."
-            )
-
-        # OK: guardar
+        # OK: guardar y apartar el stock
+        anterior = self.cart.get(key)
         self.cart[key] = {"qty": nueva_cantidad}
-        self._mark_modified()
+        try:
+            self._mark_modified({key: producto.precio}, version)
+        except CartError:
+            # El storage no pudo guardarlo (p.ej. cookie llena): volvemos atrás
+            self._deshacer_linea(key, anterior)
+            raise
+        Reserva.reservar(self.clave_reserva(), producto.id, nueva_cantidad)
 
     def set(self, product_id, qty):
         """
@@ -87,19 +231,106 @@ class Cart:
 
     def increment(self, product_id, step=1):
         """
-        Incrementa en 'step' (positivo o negativo) respetando stock.
+        Suma 'step' a la línea respetando stock. Un step negativo levanta
+        ValidationError (como add): para bajar la línea, decrement().
         """
         return self.add(product_id, qty=step, override=False)
 
+    def decrement(self, product_id, step=1):
+        """
+        Resta 'step' a la línea; si llega a 0 (o menos) se quita. Un step
+        negativo levanta ValidationError.
+        """
+        step = self._validar_qty(step)
+        restante = max(self._get_current_qty(product_id) - step, 0)
+        return self.add(product_id, qty=restante, override=True)
+
+    def actualizar_lote(self, cambios):
+        """
+        Aplica varios cambios en una sola pasada. 'cambios' es una lista de
+        (product_id, qty, override) con la misma semántica que add(); un qty
+        negativo sin override descuenta (como decrement).
+
+        Todo o nada: si alguna línea no entra en el disponible levanta
+        StockInsuficienteError (CartError si hay productos inexistentes), con
+        el detalle por línea en .errores, y el carrito queda como estaba.
+
+        Una sola query a Producto (que deja cargado el snapshot), un solo
+        guardado del storage y las reservas en bloque. Devuelve las claves
+        de las líneas tocadas.
+        """
+        normalizados = []
+        for product_id, qty, override in cambios:
+            qty = int(qty)
+            if override:
+                qty = self._validar_qty(qty)
+            normalizados.append((self._norm_key(product_id), qty, override))
+
+        clave = self.clave_reserva()
+        ids = set(self._numeric_keys()) | {int(key) for key, _, _ in normalizados}
+        version = catalogo.version()
+        productos = {
+            p.id: p
+            for p in Producto.objects.con_disponible(excluir_sesion=clave).filter(id__in=ids)
+        }
+
+        anterior, self.cart = self.cart, dict(self.cart)
+        errores = {}
+        tocadas = []
+        for key, qty, override in normalizados:
+            producto = productos.get(int(key))
+            if producto is None:
+                errores[key] = "El producto no existe."
+                continue
+            if qty < 0:
+                qty, override = max(self._get_current_qty(key) + qty, 0), True
+            try:
+                nueva_cantidad = self._nueva_cantidad(producto, key, qty, override)
+            except StockInsuficienteError as e:
+                errores[key] = str(e)
+                continue
+            if nueva_cantidad <= 0:
+                self.cart.pop(key, None)
+            else:
+                self.cart[key] = {"qty": nueva_cantidad}
+            if key not in tocadas:
+                tocadas.append(key)
+
+        if errores:
+            self.cart = anterior
+            faltan_productos = any(int(k) not in productos for k in errores)
+            clase = CartError if faltan_productos else StockInsuficienteError
+            raise clase("No se pudo actualizar el carrito.", errores=errores)
+
+        try:
+            # Se leyeron todas las líneas del carrito: el resumen queda al día
+            self._mark_modified({str(pid): p.precio for pid, p in productos.items()}, version)
+        except CartError:
+            self.cart = anterior
+            raise
+        Reserva.reservar_lote(clave, {
+            int(key): self._get_current_qty(key) for key in tocadas
+        })
+        # Los productos ya están consultados: el snapshot sale sin otra query
+        self._armar_items(self._numeric_keys(), productos, version)
+        return tocadas
+
     def remove(self, product_id):
         key = self._norm_key(product_id)
         if key in self.cart:
             del self.cart[key]
+            Reserva.liberar(self.clave_reserva(), int(key))
             self._mark_modified()
 
-    def clear(self):
-        self.session[self.SESSION_KEY] = {}
-        self.cart = self.session[self.SESSION_KEY]
+    def clear(self, liberar_reservas=True):
+        """
+        Vacía el carrito. Tras un checkout las reservas ya se consumieron en
+        Orden.confirmar, por eso se puede evitar el DELETE extra.
+        """
+        clave = self.clave_reserva(crear=False)
+        if liberar_reservas and clave:
+            Reserva.liberar(clave)
+        self.cart = {}
         self._mark_modified()
 
     def __len__(self):
@@ -114,7 +345,12 @@ class Cart:
 
     @property
     def total(self):
-        # total en dinero
+        """
+        Total en dinero. Sin snapshot cargado sale del resumen mientras la
+        versión del catálogo no haya cambiado; si cambió, revalida.
+        """
+        if self._items is None and self._resumen_vigente(catalogo.version()):
+            return Decimal(self._resumen["total"])
         total = Decimal("0.00")
         for item in self:
             total += item["subtotal"]
@@ -143,13 +379,38 @@ class Cart:
             "cantidad": int,
             "subtotal": Decimal,
             "stock_disponible": int,   # útil para UI
-            "valido": bool             # True si cantidad <= stock actual
+            "valido": bool             # True si cantidad <= disponible actual
         }
+        Los items salen del snapshot memoizado: iterar varias veces en el
+        mismo request (template, total, validaciones) no repite la query.
+        """
+        return iter(self._snapshot())
+
+    def _snapshot(self):
+        """
+        Carga las líneas del carrito una sola vez y las memoiza hasta la
+        próxima mutación (add/set/remove/clear/asegurar_maximo_disponible).
         """
+        if self._items is not None:
+            return self._items
+
         ids = self._numeric_keys()  # <- filtra y limpia
-        if not ids:
-            return
-        productos = {p.id: p for p in Producto.objects.filter(id__in=ids)}
+        version = catalogo.version()
+        productos = {}
+        if ids:
+            qs = Producto.objects.con_disponible(excluir_sesion=self.clave_reserva(crear=False))
+            # El resumen queda estampado con 'version': precios de la primaria
+            with routers.primaria():
+                productos = {p.id: p for p in qs.filter(id__in=ids)}
+        return self._armar_items(ids, productos, version)
+
+    def _armar_items(self, ids, productos, version):
+        """
+        Arma y memoiza las líneas a partir de los productos ya consultados
+        (en la versión 'version' del catálogo) y pone el resumen al día.
+        """
+        items = []
+        dirty = False
         for pid in ids:
             pdata = self.cart.get(str(pid), {})
             try:
@@ -162,18 +423,30 @@ class Cart:
             if not producto:
                 # si el producto ya no existe, limpia la entrada
                 self.cart.pop(str(pid), None)
-                self._mark_modified()
+                dirty = True
                 continue
 
-            valido = qty <= producto.stock
-            yield {
+            disponible = max(producto.disponible, 0)
+            valido = qty <= disponible
+            items.append({
                 "producto": producto,
                 "cantidad": qty,
                 "subtotal": producto.precio * qty,
-                "stock_disponible": producto.stock,
+                "stock_disponible": disponible,
                 "valido": valido,
-            }
+            })
 
+        # Solo se reescribe el storage si algo cambió (líneas, precios o versión)
+        resumen = self._nuevo_resumen({str(pid): p.precio for pid, p in productos.items()}, version)
+        if dirty or resumen != self._resumen:
+            try:
+                self.storage.guardar(self.cart, resumen)
+            except CartError:
+                # Se está leyendo el carrito (GET): no se falla, queda como estaba guardado
+                pass
+            self._resumen = resumen
+        self._items = items
+        return items
 
     def validar_stock_actual(self):
         """
@@ -183,8 +456,12 @@ class Cart:
           - problemas es una lista de strings explicando faltantes.
         No modifica el carrito.
         """
+        return self._problemas(self._snapshot())
+
+    @staticmethod
+    def _problemas(items):
         problemas = []
-        for item in self:
+        for item in items:
             if not item["valido"]:
                 p = item["producto"]
                 problemas.append(
@@ -194,45 +471,111 @@ class Cart:
 
     def asegurar_maximo_disponible(self):
         """
-        Ajusta (reduce) las cantidades que exceden el stock actual.
+        Ajusta (reduce) las cantidades que exceden el stock disponible.
         Devuelve lista de mensajes con los cambios realizados.
         """
         mensajes = []
-        ids = self._numeric_keys()
-        if not ids:
-            return mensajes
-
-        productos = {p.id: p for p in Producto.objects.filter(id__in=ids)}
         changed = False
 
-        for pid in ids:
-            key = str(pid)
-            pdata = self.cart.get(key, {})
-            try:
-                qty = int(pdata.get("qty", 0))
-            except (TypeError, ValueError):
-                qty = 0
-
-            p = productos.get(pid)
-            if not p:
-                # limpia si el producto ya no existe
-                self.cart.pop(key, None)
-                changed = True
+        # El snapshot ya limpió ids inválidos y productos inexistentes
+        for item in self._snapshot():
+            if item["valido"]:
                 continue
-
-            if qty > p.stock:
-                # si no hay nada, eliminar; si hay, capear
-                if p.stock <= 0:
-                    self.cart.pop(key, None)
-                    mensajes.append(f"«{p.nombre}» se quitó: sin stock disponible.")
-                else:
-                    self.cart[key] = {"qty": p.stock}
-                    mensajes.append(
-                        f"«{p.nombre}» ajustado a {p.stock} por stock limitado."
-                    )
-                changed = True
+            p = item["producto"]
+            disponible = item["stock_disponible"]
+            key = str(p.id)
+            # si no hay nada, eliminar; si hay, capear
+            if disponible <= 0:
+                self.cart.pop(key, None)
+                mensajes.append(f"«{p.nombre}» se quitó: sin stock disponible.")
+            else:
+                self.cart[key] = {"qty": disponible}
+                mensajes.append(
+                    f"«{p.nombre}» ajustado a {disponible} por stock limitado."
+                )
+            Reserva.reservar(self.clave_reserva(), p.id, disponible)
+            changed = True
 
         if changed:
             self._mark_modified()
 
         return mensajes
+
+    # --- API async (vistas ASGI) ---
+    # Misma semántica que la API sync; el IO (storage, Producto, Reserva) va
+    # por el ORM/cache async. Una vez cargado el snapshot, el template puede
+    # iterar el carrito y pedir cart.total sin tocar la BD.
+
+    async def aclave_reserva(self, crear=True):
+        return await self.storage.aclave(crear=crear)
+
+    async def _amark_modified(self, precios=None, version=None):
+        resumen = self._nuevo_resumen(precios, version)
+        await self.storage.aguardar(self.cart, resumen)
+        self._resumen = resumen
+        self._invalidar()
+
+    async def _asnapshot(self):
+        if self._items is not None:
+            return self._items
+        ids = self._numeric_keys()
+        version = await catalogo.aversion()
+        productos = {}
+        if ids:
+            qs = Producto.objects.con_disponible(excluir_sesion=await self.aclave_reserva(crear=False))
+            with routers.primaria():
+                productos = {p.id: p async for p in qs.filter(id__in=ids)}
+        return self._armar_items(ids, productos, version)
+
+    async def aiter(self):
+        """Las mismas líneas que __iter__, cargadas con el ORM async."""
+        for item in await self._asnapshot():
+            yield item
+
+    __aiter__ = aiter
+
+    async def atotal(self):
+        if self._items is None and self._resumen_vigente(await catalogo.aversion()):
+            return Decimal(self._resumen["total"])
+        total = Decimal("0.00")
+        for item in await self._asnapshot():
+            total += item["subtotal"]
+        return total
+
+    async def avalidar_stock_actual(self):
+        return self._problemas(await self._asnapshot())
+
+    async def aadd(self, product_id, qty=1, override=False):
+        """Versión async de add(): mismas validaciones y mismas excepciones."""
+        key = self._norm_key(product_id)
+        qty = self._validar_qty(qty)
+
+        clave = await self.aclave_reserva()
+        version = await catalogo.aversion()
+        producto = await Producto.objects.con_disponible(excluir_sesion=clave).aget(id=int(product_id))
+        nueva_cantidad = self._nueva_cantidad(producto, key, qty, override)
+
+        if nueva_cantidad <= 0:
+            self.cart.pop(key, None)
+            await Reserva.aliberar(clave, producto.id)
+            await self._amark_modified()
+            return
+
+        anterior = self.cart.get(key)
+        self.cart[key] = {"qty": nueva_cantidad}
+        try:
+            await self._amark_modified({key: producto.precio}, version)
+        except CartError:
+            self._deshacer_linea(key, anterior)
+            raise
+        await Reserva.areservar(clave, producto.id, nueva_cantidad)
+
+    async def aset(self, product_id, qty):
+        return await self.aadd(product_id, qty=qty, override=True)
+
+    async def aremove(self, product_id):
+        key = self._norm_key(product_id)
+        if key in self.cart:
+            del self.cart[key]
+            await Reserva.aliberar(await self.aclave_reserva(), int(key))
+            await self._amark_modified()
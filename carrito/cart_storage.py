@@ -0,0 +1,329 @@
+"""
+Dónde vive el contenido del carrito ({"product_id": {"qty": int}}) y su
+resumen (unidades, líneas, último total conocido; ver Cart.resumen).
+
+Se elige con settings.CARRITO_STORAGE:
+- SessionCartStorage (default): dentro de request.session, como siempre.
+- SignedCookieCartStorage: cookie firmada y compacta ("id:qty,id:qty"),
+  sin escribir en la BD al modificar el carrito.
+- CacheCartStorage: en el cache de Django, con el id del carrito en cookie.
+  Necesita un cache compartido entre workers (file o Redis, ver CACHE_URL):
+  con locmem cada worker tiene sus carritos (check carrito.E001).
+
+Las cookies se escriben en CartStorageMiddleware, al salir la respuesta.
+
+Cada storage tiene además acargar/aguardar/aclave para las vistas async:
+por defecto delegan en la versión sync (los de cookie no hacen IO) y los que
+sí tocan BD o cache las implementan con la API async de Django.
+"""
+import secrets
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+REQUEST_ATTR = "_cart_storage"
+
+
+def get_storage(request):
+    """Un único storage por request (lo comparten todas las instancias de Cart)."""
+    storage = getattr(request, REQUEST_ATTR, None)
+    if storage is None:
+        clase = import_string(getattr(settings, "CARRITO_STORAGE", "carrito.cart_storage.SessionCartStorage"))
+        storage = clase(request)
+        setattr(request, REQUEST_ATTR, storage)
+    return storage
+
+
+class CartStorage:
+    def __init__(self, request):
+        self.request = request
+
+    def cargar(self) -> dict:
+        raise NotImplementedError
+
+    def guardar(self, data: dict, resumen: dict = None) -> None:
+        raise NotImplementedError
+
+    def cargar_resumen(self):
+        """El resumen guardado junto con el carrito, o None (carritos viejos)."""
+        return None
+
+    def clave(self, crear=True):
+        """Identificador estable del carrito (lo usan las reservas de stock)."""
+        raise NotImplementedError
+
+    def persistir(self, response) -> None:
+        """Hook del middleware para escribir cookies; por defecto no hace nada."""
+
+    async def acargar(self) -> dict:
+        return self.cargar()
+
+    async def aguardar(self, data: dict, resumen: dict = None) -> None:
+        self.guardar(data, resumen)
+
+    async def acargar_resumen(self):
+        return self.cargar_resumen()
+
+    async def aclave(self, crear=True):
+        return self.clave(crear=crear)
+
+
+class SessionCartStorage(CartStorage):
+    """
+    La clave de las reservas se guarda en la sesión (no es la session_key):
+    login() rota la session_key pero conserva los datos, así que después de
+    loguearse las reservas del carrito siguen siendo de este comprador.
+    """
+    SESSION_KEY = "cart"
+    RESUMEN_KEY = "cart_resumen"
+    CLAVE_KEY = "cart_clave"
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.session = request.session
+
+    def cargar(self):
+        # Solo lectura: mirar el carrito no crea ni modifica la sesión
+        return self.session.get(self.SESSION_KEY) or {}
+
+    def guardar(self, data, resumen=None):
+        self.session[self.SESSION_KEY] = data
+        self.session[self.RESUMEN_KEY] = resumen
+        self.session.modified = True
+
+    def cargar_resumen(self):
+        return self.session.get(self.RESUMEN_KEY)
+
+    def _clave(self, guardada, crear):
+        if guardada:
+            return guardada, False
+        # Carritos de antes: sus reservas están a nombre de la session_key
+        clave = self.session.session_key or (secrets.token_hex(16) if crear else None)
+        return clave, crear and clave is not None
+
+    def clave(self, crear=True):
+        clave, nueva = self._clave(self.session.get(self.CLAVE_KEY), crear)
+        if nueva:
+            self.session[self.CLAVE_KEY] = clave
+        return clave
+
+    async def acargar(self):
+        return (await self.session.aget(self.SESSION_KEY)) or {}
+
+    async def aguardar(self, data, resumen=None):
+        await self.session.aset(self.SESSION_KEY, data)
+        await self.session.aset(self.RESUMEN_KEY, resumen)
+
+    async def acargar_resumen(self):
+        return await self.session.aget(self.RESUMEN_KEY)
+
+    async def aclave(self, crear=True):
+        clave, nueva = self._clave(await self.session.aget(self.CLAVE_KEY), crear)
+        if nueva:
+            await self.session.aset(self.CLAVE_KEY, clave)
+        return clave
+
+
+class _CookieCartStorage(CartStorage):
+    """Base para los storages que identifican el carrito con una cookie propia."""
+
+    cookie_salt = "carrito"
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.cookie_name = getattr(settings, "CARRITO_COOKIE_NOMBRE", "carrito")
+        self._cid = None
+        self._dirty = False
+
+    def _nuevo_cid(self):
+        return secrets.token_hex(16)
+
+    def clave(self, crear=True):
+        if self._cid is None and crear:
+            self._cid = self._nuevo_cid()
+            self._dirty = True
+        return self._cid
+
+    def valor_cookie(self) -> str:
+        raise NotImplementedError
+
+    def persistir(self, response):
+        if not self._dirty:
+            return
+        response.set_signed_cookie(
+            self.cookie_name,
+            self.valor_cookie(),
+            salt=self.cookie_salt,
+            max_age=getattr(settings, "CARRITO_COOKIE_DIAS", 30) * 24 * 3600,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite="Lax",
+        )
+
+    def _leer_cookie(self):
+        try:
+            return self.request.get_signed_cookie(self.cookie_name, salt=self.cookie_salt)
+        except (KeyError, signing.BadSignature):
+            return None
+
+
+class SignedCookieCartStorage(_CookieCartStorage):
+    """
+    Todo el carrito en una cookie firmada: "<cid>|<id>:<qty>,<id>:<qty>|<resumen>".
+    Acotada por CARRITO_COOKIE_MAX_BYTES (los navegadores cortan en ~4 KB),
+    contando la cookie entera: nombre, cid, firma y escapes.
+
+    El resumen lleva el precio de cada línea, así que ocupa más o menos lo
+    mismo que las líneas. Es un cache: si no entra se guardan solo las
+    líneas (el total se recalcula con una query) y el límite de productos
+    lo ponen las líneas.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self._data = {}
+        self._resumen = None
+        crudo = self._leer_cookie()
+        if crudo:
+            cid, _, resto = crudo.partition("|")
+            lineas, _, resumen = resto.partition("|")
+            self._cid = cid or None
+            self._data = self.desempacar(lineas)
+            self._resumen = self.desempacar_resumen(resumen)
+
+    @staticmethod
+    def empacar(data: dict) -> str:
+        return ",".join(f"{int(pid)}:{int(v.get('qty', 0))}" for pid, v in data.items())
+
+    @staticmethod
+    def desempacar(lineas: str) -> dict:
+        data = {}
+        for parte in lineas.split(","):
+            pid, _, qty = parte.partition(":")
+            try:
+                data[str(int(pid))] = {"qty": int(qty)}
+            except ValueError:
+                continue  # entrada corrupta: se descarta
+        return data
+
+    @staticmethod
+    def empacar_resumen(resumen) -> str:
+        """"<version>:<unidades>:<lineas>:<total>:<id>=<precio>;..." (vacío sin resumen)."""
+        if not resumen:
+            return ""
+        precios = ";".join(f"{int(pid)}={precio}" for pid, precio in resumen["precios"].items())
+        version = "" if resumen["version"] is None else resumen["version"]
+        total = "" if resumen["total"] is None else resumen["total"]
+        return f"{version}:{resumen['unidades']}:{resumen['lineas']}:{total}:{precios}"
+
+    @staticmethod
+    def desempacar_resumen(crudo: str):
+        try:
+            version, unidades, lineas, total, precios = crudo.split(":", 4)
+            return {
+                "version": int(version) if version else None,
+                "unidades": int(unidades),
+                "lineas": int(lineas),
+                "total": total or None,
+                "precios": {
+                    str(int(pid)): precio
+                    for pid, _, precio in (parte.partition("=") for parte in precios.split(";") if parte)
+                },
+            }
+        except ValueError:
+            return None  # cookie vieja o corrupta: Cart lo recalcula
+
+    def cargar(self):
+        return self._data
+
+    def cargar_resumen(self):
+        return self._resumen
+
+    def bytes_cookie(self, data, resumen) -> int:
+        """Lo que ocupa "nombre=valor" en el Set-Cookie, con la firma y los escapes."""
+        valor = signing.get_cookie_signer(salt=self.cookie_name + self.cookie_salt).sign(
+            self._valor(data, resumen)
+        )
+        cookie = SimpleCookie()
+        cookie[self.cookie_name] = valor
+        return len(cookie[self.cookie_name].OutputString(attrs=[]))
+
+    def guardar(self, data, resumen=None):
+        maximo = getattr(settings, "CARRITO_COOKIE_MAX_BYTES", 3000)
+        self.clave()
+        if resumen and self.bytes_cookie(data, resumen) > maximo:
+            resumen = None
+        if self.bytes_cookie(data, resumen) > maximo:
+            from .cart import CartError
+            raise CartError("El carrito está lleno: quitá algún producto para agregar otro.")
+        self._data = data
+        self._resumen = resumen
+        self._dirty = True
+
+    def _valor(self, data, resumen):
+        return f"{self._cid}|{self.empacar(data)}|{self.empacar_resumen(resumen)}"
+
+    def valor_cookie(self):
+        return self._valor(self._data, self._resumen)
+
+
+class CacheCartStorage(_CookieCartStorage):
+    """
+    El carrito vive en el cache (Redis/archivos); la cookie solo lleva el id.
+    Líneas y resumen van en dos claves que se leen y escriben juntas.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self._cid = self._leer_cookie() or None
+        self._data = None
+        self._resumen = None
+
+    def _cache_key(self):
+        return f"carrito:{self._cid}"
+
+    def _resumen_key(self):
+        return f"carrito:{self._cid}:resumen"
+
+    def _recibir(self, valores):
+        self._data = valores.get(self._cache_key()) or {}
+        self._resumen = valores.get(self._resumen_key())
+
+    def _valores(self, data, resumen):
+        self._data = data
+        self._resumen = resumen
+        self.clave()
+        return {self._cache_key(): data, self._resumen_key(): resumen}
+
+    def cargar(self):
+        if self._data is None:
+            self._recibir(cache.get_many([self._cache_key(), self._resumen_key()]) if self._cid else {})
+        return self._data
+
+    def cargar_resumen(self):
+        self.cargar()
+        return self._resumen
+
+    def guardar(self, data, resumen=None):
+        cache.set_many(self._valores(data, resumen), timeout=self._timeout())
+
+    def _timeout(self):
+        return getattr(settings, "CARRITO_COOKIE_DIAS", 30) * 24 * 3600
+
+    async def acargar(self):
+        if self._data is None:
+            self._recibir(await cache.aget_many([self._cache_key(), self._resumen_key()]) if self._cid else {})
+        return self._data
+
+    async def acargar_resumen(self):
+        await self.acargar()
+        return self._resumen
+
+    async def aguardar(self, data, resumen=None):
+        await cache.aset_many(self._valores(data, resumen), timeout=self._timeout())
+
+    def valor_cookie(self):
+        return self._cid
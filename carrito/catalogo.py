@@ -0,0 +1,144 @@
+"""
+Cache del catálogo (páginas de ProductoListaView y detalle de cada producto).
+
+Cada página renderizada se guarda bajo una clave que incluye la "versión del
+catálogo". Cualquier cambio en Producto (save/delete, list_editable del admin,
+descuentos o reposiciones de stock) sube la versión, así que las claves viejas
+dejan de usarse y vencen solas por timeout.
+
+El detalle usa la versión del propio producto (Producto.version): un cambio en
+un producto no invalida el detalle de los demás.
+
+La versión vive en el cache, así que tiene que ser compartido entre workers
+(file o Redis, ver CACHE_URL): con locmem cada proceso tiene su contador y
+solo se entera del cambio el worker que lo hizo.
+"""
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+VERSION_KEY = "catalogo:version"
+HITS_KEY = "catalogo:hits"
+MISSES_KEY = "catalogo:misses"
+
+
+def cache_compartido(alias: str = "default") -> bool:
+    """False si el cache es de este proceso (locmem): los otros workers no lo ven."""
+    return not isinstance(caches[alias], LocMemCache)
+
+
+def _incr(key: str, inicial: int = 0) -> int:
+    # add() es atómico: solo crea la clave si no existía
+    cache.add(key, inicial, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # La clave se evictó entre add() e incr()
+        cache.set(key, inicial + 1, timeout=None)
+        return inicial + 1
+
+
+def _version_inicial() -> int:
+    # Al azar y no 1: lo estampado con otro contador (el resumen del carrito
+    # escrito por otro worker con locmem, o antes de que se vaciara el cache)
+    # no coincide por casualidad con la versión actual
+    return secrets.randbelow(2**31) + 1
+
+
+def version() -> int:
+    v = cache.get(VERSION_KEY)
+    if v is None:
+        inicial = _version_inicial()
+        cache.add(VERSION_KEY, inicial, timeout=None)
+        v = cache.get(VERSION_KEY, inicial)
+    return v
+
+
+def _subir_version():
+    _incr(VERSION_KEY, _version_inicial())
+
+
+def invalidar() -> None:
+    """
+    Sube la versión del catálogo cuando la transacción actual confirma
+    (si no hay transacción, en el momento).
+    """
+    transaction.on_commit(_subir_version)
+
+
+def _pagina(pagina) -> str:
+    # Hash del token entero: los cursores de nombres con el mismo prefijo
+    # comparten los primeros caracteres y no pueden caer en la misma clave
+    return hashlib.md5(str(pagina).encode()).hexdigest()
+
+
+def clave_pagina(pagina) -> str:
+    return f"catalogo:v{version()}:pagina:{_pagina(pagina)}"
+
+
+def clave_detalle(producto) -> str:
+    return f"producto:{producto.pk}:{producto.version}"
+
+
+def obtener(clave: str):
+    html = cache.get(clave)
+    _incr(HITS_KEY if html is not None else MISSES_KEY)
+    return html
+
+
+def guardar(clave: str, html: str) -> None:
+    cache.set(clave, html, timeout=getattr(settings, "CATALOGO_CACHE_SEGUNDOS", 600))
+
+
+# --- Versiones async (carrito/views_async.py): misma lógica con la API async del cache ---
+
+async def _aincr(key: str, inicial: int = 0) -> int:
+    await cache.aadd(key, inicial, timeout=None)
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, inicial + 1, timeout=None)
+        return inicial + 1
+
+
+async def aversion() -> int:
+    v = await cache.aget(VERSION_KEY)
+    if v is None:
+        inicial = _version_inicial()
+        await cache.aadd(VERSION_KEY, inicial, timeout=None)
+        v = await cache.aget(VERSION_KEY, inicial)
+    return v
+
+
+async def aclave_pagina(pagina) -> str:
+    return f"catalogo:v{await aversion()}:pagina:{_pagina(pagina)}"
+
+
+async def aobtener(clave: str):
+    html = await cache.aget(clave)
+    await _aincr(HITS_KEY if html is not None else MISSES_KEY)
+    return html
+
+
+async def aguardar(clave: str, html: str) -> None:
+    await cache.aset(clave, html, timeout=getattr(settings, "CATALOGO_CACHE_SEGUNDOS", 600))
+
+
+def estadisticas() -> dict:
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "version": version(),
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else 0.0,
+    }
+
+
+def reiniciar_estadisticas() -> None:
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,32 @@
+"""Chequeos de configuración de la app (python manage.py check --deploy)."""
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+from django.utils.module_loading import import_string
+
+from . import catalogo
+from .cart_storage import CacheCartStorage
+
+
+@register(Tags.caches, deploy=True)
+def cache_compartido(app_configs, **kwargs):
+    if catalogo.cache_compartido():
+        return []
+    return [Warning(
+        "El cache es locmem: cada worker tiene su propia versión del catálogo y "
+        "sirve páginas y precios viejos hasta CATALOGO_CACHE_SEGUNDOS.",
+        hint="Configurá CACHE_URL=file:///ruta/compartida o redis://host:6379/0.",
+        id="carrito.W001",
+    )]
+
+
+@register(Tags.caches)
+def carrito_en_cache(app_configs, **kwargs):
+    storage = import_string(getattr(settings, "CARRITO_STORAGE", "carrito.cart_storage.SessionCartStorage"))
+    if settings.DEBUG or catalogo.cache_compartido() or not issubclass(storage, CacheCartStorage):
+        return []
+    return [Error(
+        "CacheCartStorage con cache locmem: cada worker guarda sus propios carritos y "
+        "se pierden o se duplican según qué worker atienda el request.",
+        hint="Configurá CACHE_URL=file:///ruta/compartida o redis://host:6379/0, o usá otro CARRITO_STORAGE.",
+        id="carrito.E001",
+    )]
@@ -0,0 +1,12 @@
+from django.utils.functional import SimpleLazyObject
+
+from .cart import Cart
+
+
+def carrito(request):
+    """
+    cart_resumen en todos los templates (badge del navbar): unidades, líneas
+    y último total conocido, leídos del storage del carrito sin consultar
+    Producto. Es lazy: si la página no lo usa, no se carga el carrito.
+    """
+    return {"cart_resumen": SimpleLazyObject(lambda: Cart(request).resumen())}
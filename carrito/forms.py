@@ -14,14 +14,34 @@ class AgregarAlCarritoForm(forms.Form):
 
         # Si tenemos un producto, validamos el stock disponible
         if self.producto:
-            if cantidad > self.producto.stock:
+            if cantidad > self.producto.existencias:
                 raise forms.ValidationError(
-                    f"Solo hay {self.producto.stock} unidades disponibles de «{self.producto.nombre}»."
+                    f"Solo hay {self.producto.existencias} unidades disponibles de «{self.producto.nombre}»."
                 )
 
         return cantidad
 
 
+class BusquedaForm(forms.Form):
+    ORDENES = [
+        ("", "Relevancia"),
+        ("precio", "Menor precio"),
+        ("-precio", "Mayor precio"),
+        ("nuevos", "Más nuevos"),
+    ]
+
+    q = forms.CharField(required=False, max_length=100,
+                        widget=forms.TextInput(attrs={"class": "form-control", "placeholder": "Buscar joyas…"}))
+    precio_min = forms.DecimalField(required=False, min_value=0, decimal_places=2,
+                                    widget=forms.NumberInput(attrs={"class": "form-control", "placeholder": "Desde"}))
+    precio_max = forms.DecimalField(required=False, min_value=0, decimal_places=2,
+                                    widget=forms.NumberInput(attrs={"class": "form-control", "placeholder": "Hasta"}))
+    en_stock = forms.BooleanField(required=False, label="Solo con stock",
+                                  widget=forms.CheckboxInput(attrs={"class": "form-check-input"}))
+    orden = forms.ChoiceField(required=False, choices=ORDENES,
+                              widget=forms.Select(attrs={"class": "form-select"}))
+
+
 class OrdenForm(forms.ModelForm):
     class Meta:
         model = Orden
@@ -0,0 +1,109 @@
+"""
+Derivados de Producto.imagen: versiones chicas en formatos modernos.
+
+Para "productos/anillo.png" se generan, por cada ancho de ANCHOS menor al
+original y por cada formato soportado por Pillow:
+
+    productos/derivados/anillo.png-320w.webp
+    productos/derivados/anillo.png-320w.avif
+    ...
+
+El nombre lleva la extensión del original: anillo.png y anillo.jpg no se
+pisan los derivados. Al cambiar la imagen se borran los de la anterior.
+
+Lo generado queda registrado en Producto.imagen_derivados, así el template
+tag {% imagen_responsive %} arma el srcset sin tocar el disco.
+"""
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+# Cubre 40px (checkout) / 56-64px (carrito) / ~300px (cards) / 400px (detalle) a 1x y 2x
+ANCHOS = (80, 160, 320, 640, 960)
+
+# Orden = preferencia en <picture>
+FORMATOS = [f for f in ("avif", "webp") if features.check(f)]
+
+CALIDAD = {"avif": 55, "webp": 78}
+
+CARPETA = "derivados"
+
+# Sube cuando cambian los nombres de los derivados: los manifiestos viejos se regeneran
+ESQUEMA = 2
+
+
+def ruta_derivado(nombre: str, ancho: int, formato: str) -> str:
+    origen = PurePosixPath(nombre)
+    return str(origen.parent / CARPETA / f"{origen.name}-{ancho}w.{formato}")
+
+
+def rutas(manifiesto: dict) -> list:
+    """Archivos generados según el manifiesto (vacío si es de un esquema anterior)."""
+    if manifiesto.get("esquema") != ESQUEMA:
+        return []
+    return [
+        ruta_derivado(manifiesto["origen"], ancho, formato)
+        for ancho in manifiesto.get("anchos", [])
+        for formato in manifiesto.get("formatos", [])
+    ]
+
+
+def borrar(manifiesto: dict) -> None:
+    # Los de esquemas anteriores no se tocan: sin extensión podrían ser de otra imagen
+    for ruta in rutas(manifiesto):
+        default_storage.delete(ruta)
+
+
+def generar(nombre: str) -> dict:
+    """
+    Genera los derivados de la imagen 'nombre' (ruta dentro del storage) y
+    devuelve el manifiesto a guardar en Producto.imagen_derivados.
+    Es una función suelta (picklable) para poder correrla en un pool de procesos.
+    """
+    with default_storage.open(nombre, "rb") as f:
+        original = Image.open(f)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    if original.mode not in ("RGB", "RGBA"):
+        transparente = original.mode in ("LA", "PA") or "transparency" in original.info
+        original = original.convert("RGBA" if transparente else "RGB")
+
+    # Siempre al menos el ancho más chico, aunque el original sea menor
+    anchos = [a for a in ANCHOS if a < original.width] or [ANCHOS[0]]
+
+    manifiesto = {"origen": nombre, "anchos": anchos, "formatos": list(FORMATOS), "esquema": ESQUEMA}
+    for ancho in anchos:
+        alto = max(1, round(original.height * ancho / original.width))
+        copia = original.resize((ancho, alto), Image.LANCZOS)
+        for formato in FORMATOS:
+            buffer = BytesIO()
+            copia.save(buffer, format=formato.upper(), quality=CALIDAD[formato])
+            ruta = ruta_derivado(nombre, ancho, formato)
+            if default_storage.exists(ruta):
+                default_storage.delete(ruta)
+            default_storage.save(ruta, ContentFile(buffer.getvalue()))
+    return manifiesto
+
+
+def vigentes(producto) -> bool:
+    """Los derivados registrados son de la imagen actual (y del esquema actual)."""
+    manifiesto = producto.imagen_derivados or {}
+    nombre = producto.imagen.name if producto.imagen else ""
+    return bool(nombre) and manifiesto.get("origen") == nombre and manifiesto.get("esquema") == ESQUEMA
+
+
+def necesita_derivados(producto) -> bool:
+    return bool(producto.imagen) and not vigentes(producto)
+
+
+def srcset(producto, formato: str) -> str:
+    manifiesto = producto.imagen_derivados or {}
+    nombre = manifiesto.get("origen")
+    return ", ".join(
+        f"{default_storage.url(ruta_derivado(nombre, ancho, formato))} {ancho}w"
+        for ancho in manifiesto.get("anchos", [])
+    )
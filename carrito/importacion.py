@@ -0,0 +1,218 @@
+"""
+Importación/exportación masiva del catálogo (CSV o JSONL), por lotes y con
+memoria constante: se lee y escribe fila a fila y solo hay un lote en memoria.
+
+Columnas: slug (obligatoria, es la clave), nombre, descripcion, precio, stock.
+Se pueden mandar solo algunas (p. ej. slug,precio,stock para un refresh de
+temporada): las que faltan no se tocan en los productos existentes. Los
+productos nuevos necesitan al menos nombre y precio.
+
+En productos con stock fragmentado (modo alta demanda) 'stock' es el de la
+fila: se suma a lo que queda en los fragmentos.
+
+Cada lote se compara contra la BD y solo se escriben las altas y los
+cambios, con un único INSERT ... ON CONFLICT (slug) DO UPDATE.
+
+Lo usan los comandos importar_catalogo y exportar_catalogo.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.db import transaction
+
+from . import busqueda, catalogo
+from .models import MovimientoStock, Producto
+
+CAMPOS = ("slug", "nombre", "descripcion", "precio", "stock")
+CAMPOS_TEXTO = {"nombre", "descripcion"}
+
+LOTE = 1000
+
+
+class FilaInvalida(ValueError):
+    """Una fila del archivo no se puede importar (se informa y se saltea)."""
+
+
+def formato_de(nombre: str, formato: str = None) -> str:
+    if formato:
+        return formato
+    return "jsonl" if nombre.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def leer_filas(archivo, formato: str):
+    """Generador de (número de línea, dict) sobre un archivo de texto abierto."""
+    if formato == "csv":
+        lector = csv.DictReader(archivo)
+        for fila in lector:
+            yield lector.line_num, fila
+        return
+    for numero, linea in enumerate(archivo, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            yield numero, None
+            continue
+        yield numero, fila
+
+
+def normalizar(fila) -> dict:
+    """Valida y convierte una fila; levanta FilaInvalida con el motivo."""
+    if not isinstance(fila, dict):
+        raise FilaInvalida("no es un objeto JSON/CSV válido")
+    datos = {}
+    for campo in CAMPOS:
+        valor = fila.get(campo)
+        if valor is None or (isinstance(valor, str) and not valor.strip() and campo != "descripcion"):
+            continue
+        if campo == "slug" or campo in CAMPOS_TEXTO:
+            # En JSONL pueden venir números ("slug": 1234); listas, objetos o booleanos no
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                valor = str(valor)
+            elif not isinstance(valor, str):
+                raise FilaInvalida(f"{campo} inválido: {valor!r}")
+        datos[campo] = valor.strip() if isinstance(valor, str) and campo != "descripcion" else valor
+
+    if not datos.get("slug"):
+        raise FilaInvalida("falta slug")
+    try:
+        validate_slug(datos["slug"])
+    except ValidationError:
+        raise FilaInvalida(f"slug inválido: {datos['slug']!r}")
+    if "precio" in datos:
+        texto = str(datos["precio"])
+        if "," in texto and "." not in texto:
+            texto = texto.replace(",", ".")  # "1500,50"
+        try:
+            datos["precio"] = Decimal(texto).quantize(Decimal("0.01"))
+        except InvalidOperation:
+            raise FilaInvalida(f"precio inválido: {fila.get('precio')!r}")
+        if datos["precio"] < 0:
+            raise FilaInvalida("precio negativo")
+    if "stock" in datos:
+        try:
+            datos["stock"] = int(datos["stock"])
+        except (TypeError, ValueError):
+            raise FilaInvalida(f"stock inválido: {fila.get('stock')!r}")
+        if datos["stock"] < 0:
+            raise FilaInvalida("stock negativo")
+    if len(datos.get("nombre", "")) > Producto._meta.get_field("nombre").max_length:
+        raise FilaInvalida("nombre demasiado largo")
+    return datos
+
+
+def _lotes(iterable, tamaño):
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamaño)):
+        yield lote
+
+
+def importar(filas, lote=LOTE, dry_run=False, al_cambiar=None, al_error=None) -> dict:
+    """
+    Importa las filas (iterable de (número, dict)). Devuelve el resumen
+    {"altas", "cambios", "iguales", "errores"}.
+
+    al_cambiar(slug, {campo: (antes, después)}) se llama por cada alta
+    (antes = None) o cambio; al_error(número, motivo) por cada fila salteada.
+    Con dry_run no se escribe nada: sirve para ver el diff.
+    """
+    resumen = {"altas": 0, "cambios": 0, "iguales": 0, "errores": 0}
+    hubo_escrituras = False
+
+    for filas_lote in _lotes(filas, lote):
+        # Último valor gana si un slug se repite en el lote
+        pendientes = {}
+        for numero, fila in filas_lote:
+            try:
+                datos = normalizar(fila)
+            except FilaInvalida as e:
+                resumen["errores"] += 1
+                if al_error:
+                    al_error(numero, str(e))
+                continue
+            pendientes.setdefault(datos["slug"], {"numero": numero}).update(datos)
+
+        existentes = Producto.objects.only(*CAMPOS).in_bulk(list(pendientes), field_name="slug")
+        escribir, columnas, movimientos = [], set(), {}
+        for slug, datos in pendientes.items():
+            numero = datos.pop("numero")
+            actual = existentes.get(slug)
+            if actual is None:
+                faltan = [c for c in ("nombre", "precio") if c not in datos]
+                if faltan:
+                    resumen["errores"] += 1
+                    if al_error:
+                        al_error(numero, f"{slug}: producto nuevo sin {', '.join(faltan)}")
+                    continue
+                diff = {campo: (None, valor) for campo, valor in datos.items() if campo != "slug"}
+                resumen["altas"] += 1
+            else:
+                diff = {
+                    campo: (getattr(actual, campo), valor)
+                    for campo, valor in datos.items()
+                    if campo != "slug" and getattr(actual, campo) != valor
+                }
+                if not diff:
+                    resumen["iguales"] += 1
+                    continue
+                resumen["cambios"] += 1
+            if al_cambiar:
+                al_cambiar(slug, diff)
+            if "stock" in diff:
+                antes, despues = diff["stock"]
+                movimientos[slug] = despues - (antes or 0)
+            # El INSERT lleva la fila completa (NOT NULL); el UPDATE solo las columnas del archivo
+            base = {campo: getattr(actual, campo) for campo in CAMPOS} if actual else {}
+            escribir.append(Producto(**{**base, **datos}))
+            columnas.update(datos)
+
+        if escribir and not dry_run:
+            _escribir_lote(escribir, columnas - {"slug"}, movimientos)
+            hubo_escrituras = True
+
+    if hubo_escrituras:
+        catalogo.invalidar()
+    return resumen
+
+
+def _escribir_lote(productos, columnas, movimientos):
+    with transaction.atomic():
+        Producto.objects.bulk_create(
+            productos,
+            update_conflicts=True,
+            unique_fields=["slug"],
+            # bulk_create aplica auto_now, pero el UPDATE solo toca estas columnas
+            update_fields=sorted(columnas | {"actualizado"}),
+        )
+        # bulk_create no dispara post_save: el índice de búsqueda se mantiene acá
+        if columnas & CAMPOS_TEXTO:
+            busqueda.indexar_slugs([p.slug for p in productos])
+        # Ni save() ni los UPDATE de stock: el libro de movimientos también va acá.
+        # El delta es contra lo leído al armar el lote; conciliar_stock corrige si hubo ventas en el medio.
+        if movimientos:
+            ids = dict(Producto.objects.filter(slug__in=movimientos).values_list("slug", "pk"))
+            MovimientoStock.registrar({ids[slug]: delta for slug, delta in movimientos.items()}, "importacion")
+
+
+def exportar(salida, formato: str, lote=LOTE) -> int:
+    """Escribe todo el catálogo en 'salida' leyendo por chunks (cursor del servidor en Postgres)."""
+    filas = Producto.objects.order_by("pk").values_list(*CAMPOS).iterator(chunk_size=lote)
+    total = 0
+    if formato == "csv":
+        escritor = csv.writer(salida)
+        escritor.writerow(CAMPOS)
+        for fila in filas:
+            escritor.writerow(fila)
+            total += 1
+    else:
+        for fila in filas:
+            datos = dict(zip(CAMPOS, fila))
+            datos["precio"] = str(datos["precio"])
+            salida.write(json.dumps(datos, ensure_ascii=False) + "\n")
+            total += 1
+    return total
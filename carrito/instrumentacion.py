@@ -0,0 +1,152 @@
+"""
+Instrumentación de SQL por request: cantidad de queries, tiempo en BD,
+queries repetidas (huella) y presupuesto de queries por vista.
+
+La usa QueryBudgetMiddleware; las estadísticas se acumulan en memoria del
+proceso y se ven en /instrumentacion/ (solo staff). Las del pool de
+conexiones de Postgres (DB_POOL) se ven en /instrumentacion/pool/.
+"""
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+
+class QueryBudgetExcedido(AssertionError):
+    """Una vista hizo más queries que las permitidas en QUERY_BUDGETS."""
+
+
+_NUMEROS = re.compile(r"\b\d+\b")
+_LISTAS = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+# Control de transacciones: no son queries de la vista (SQLite manda BEGIN explícito)
+_TRANSACCION = re.compile(
+    r'^(?:(?:RELEASE )?SAVEPOINT|ROLLBACK TO SAVEPOINT|BEGIN|COMMIT|ROLLBACK)\b', re.IGNORECASE
+)
+
+
+def huella(sql: str) -> str:
+    """Normaliza el SQL para agrupar queries iguales con distintos parámetros."""
+    sql = _LISTAS.sub("(...)", sql)
+    sql = _NUMEROS.sub("?", sql)
+    return " ".join(sql.split())
+
+
+class RegistroSQL:
+    """execute_wrapper que cuenta y cronometra las queries de un request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.segundos = 0.0
+        self.huellas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            if not _TRANSACCION.match(sql):
+                self.queries += 1
+                self.huellas[huella(sql)] += 1
+
+    @property
+    def ms(self) -> float:
+        return self.segundos * 1000
+
+    def duplicadas(self) -> dict:
+        return {h: n for h, n in self.huellas.items() if n > 1}
+
+
+# --- Estadísticas agregadas del proceso ---
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def acumular(vista: str, registro: RegistroSQL, total_ms: float) -> None:
+    with _lock:
+        s = _stats.setdefault(vista, {
+            "requests": 0, "queries": 0, "queries_max": 0,
+            "db_ms": 0.0, "total_ms": 0.0, "duplicadas": Counter(),
+        })
+        s["requests"] += 1
+        s["queries"] += registro.queries
+        s["queries_max"] = max(s["queries_max"], registro.queries)
+        s["db_ms"] += registro.ms
+        s["total_ms"] += total_ms
+        s["duplicadas"].update(registro.duplicadas())
+
+
+def estadisticas() -> dict:
+    with _lock:
+        return {
+            vista: {
+                "requests": s["requests"],
+                "queries_promedio": round(s["queries"] / s["requests"], 2),
+                "queries_max": s["queries_max"],
+                "db_ms_promedio": round(s["db_ms"] / s["requests"], 3),
+                "total_ms_promedio": round(s["total_ms"] / s["requests"], 3),
+                "presupuesto": presupuesto(vista),
+                "duplicadas": dict(s["duplicadas"].most_common(10)),
+            }
+            for vista, s in sorted(_stats.items())
+        }
+
+
+def reiniciar() -> None:
+    with _lock:
+        _stats.clear()
+
+
+def presupuesto(vista: str):
+    return getattr(settings, "QUERY_BUDGETS", {}).get(vista)
+
+
+def verificar_presupuesto(vista: str, registro: RegistroSQL):
+    """Devuelve el mensaje de error si se pasó del presupuesto (o None)."""
+    limite = presupuesto(vista)
+    if limite is None or registro.queries <= limite:
+        return None
+    detalle = "; ".join(f"{n}x {h[:120]}" for h, n in registro.duplicadas().items())
+    return (
+        f"{vista}: {registro.queries} queries (presupuesto {limite})"
+        + (f". Repetidas: {detalle}" if detalle else "")
+    )
+
+
+def estadisticas_pools() -> dict:
+    """
+    Estado del pool de psycopg de cada BD (uno por proceso: con varios workers
+    de gunicorn, cada uno tiene el suyo). Los contadores son desde que se abrió.
+    """
+    datos = {}
+    for alias in connections:
+        conn = connections[alias]
+        if conn.vendor != "postgresql" or not conn.settings_dict["OPTIONS"].get("pool"):
+            datos[alias] = {"pool": False}
+            continue
+        s = conn.pool.get_stats()  # psycopg_pool omite los contadores en cero
+        conexiones = s.get("connections_num", 0)
+        pedidos = s.get("requests_num", 0)
+        datos[alias] = {
+            "pool": True,
+            "min": s.get("pool_min"),
+            "max": s.get("pool_max"),
+            "abiertas": s.get("pool_size", 0),
+            "en_uso": s.get("pool_size", 0) - s.get("pool_available", 0),
+            "esperando": s.get("requests_waiting", 0),
+            "pedidos": pedidos,
+            "pedidos_encolados": s.get("requests_queued", 0),
+            "espera_ms_promedio": round(s.get("requests_wait_ms", 0) / pedidos, 2) if pedidos else None,
+            "timeouts": s.get("requests_errors", 0),
+            "conexiones_creadas": conexiones,
+            "conexion_ms_promedio": round(s.get("connections_ms", 0) / conexiones, 2) if conexiones else None,
+            "errores_conexion": s.get("connections_errors", 0),
+            # Conexiones que no pasaron el health check (CONN_HEALTH_CHECKS) o volvieron rotas
+            "perdidas": s.get("connections_lost", 0),
+            "devueltas_rotas": s.get("returns_bad", 0),
+        }
+    return datos
@@ -0,0 +1,106 @@
+import json
+import platform
+import random
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from carrito import benchmarks
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de las vistas calientes (lista, detalle, carrito, agregar, checkout) "
+        "sobre una BD de test sembrada. Reporta p50/p95, queries y allocations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--productos", type=int, default=500)
+        parser.add_argument("--ordenes", type=int, default=200)
+        parser.add_argument("--iteraciones", type=int, default=50)
+        parser.add_argument(
+            "--escenarios", default=",".join(benchmarks.ESCENARIOS),
+            help="Lista separada por comas (default: todos).",
+        )
+        parser.add_argument("--sin-cache", action="store_true",
+                            help="Invalida el cache del catálogo antes de cada request de la lista.")
+        parser.add_argument("--json", dest="salida_json",
+                            help="Archivo donde guardar el resultado ('-' = stdout).")
+
+    def handle(self, *args, **options):
+        escenarios = [e.strip() for e in options["escenarios"].split(",") if e.strip()]
+        desconocidos = set(escenarios) - set(benchmarks.ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+        # BD de test descartable: nunca se siembra sobre la BD real
+        setup_test_environment()
+        nombre_original = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(SECURE_SSL_REDIRECT=False, DEBUG=False):
+                resultados = self._correr(escenarios, options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+
+        reporte = {
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _commit_actual(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "motor": connection.vendor,
+            "parametros": {
+                "productos": options["productos"],
+                "ordenes": options["ordenes"],
+                "iteraciones": options["iteraciones"],
+                "sin_cache": options["sin_cache"],
+            },
+            "resultados": resultados,
+        }
+
+        self._imprimir_tabla(resultados)
+        destino = options["salida_json"]
+        if destino == "-":
+            self.stdout.write(json.dumps(reporte, indent=2, ensure_ascii=False))
+        elif destino:
+            with open(destino, "w", encoding="utf-8") as f:
+                json.dump(reporte, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Resultado guardado en {destino}"))
+
+    def _correr(self, escenarios, options):
+        benchmarks.sembrar(productos=options["productos"], ordenes=options["ordenes"])
+        ctx = {
+            "rnd": random.Random(1234),
+            "slugs": benchmarks._slugs(),
+            "paginas": max(1, options["productos"] // 12),
+            "sin_cache": options["sin_cache"],
+        }
+        return [
+            benchmarks.medir(nombre, Client, ctx, iteraciones=options["iteraciones"])
+            for nombre in escenarios
+        ]
+
+    def _imprimir_tabla(self, resultados):
+        self.stdout.write(f"{'escenario':<10} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'pico KB':>9}")
+        for r in resultados:
+            self.stdout.write(
+                f"{r['escenario']:<10} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                f"{r['queries']:>8} {r['pico_alloc_kb']:>9.1f}"
+            )
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from carrito import benchmarks
+from carrito.models import OrdenItem, Producto
+
+MODOS = ("fila", "fragmentado")
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de carga de un solo SKU: checkouts concurrentes sobre el mismo producto con "
+        "el descuento en la fila de Producto vs. con stock fragmentado. Verifica que no se sobrevenda."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ordenes", type=int, default=400)
+        parser.add_argument("--hilos", type=int, default=16)
+        parser.add_argument("--fragmentos", type=int, default=8)
+        parser.add_argument("--stock", type=int,
+                            help="Stock inicial (default: 90%% de lo pedido, para forzar el agotado).")
+        parser.add_argument("--modos", default=",".join(MODOS))
+        parser.add_argument("--json", dest="salida_json", help="Archivo donde guardar el resultado ('-' = stdout).")
+
+    def handle(self, *args, **options):
+        modos = [m.strip() for m in options["modos"].split(",") if m.strip()]
+        if set(modos) - set(MODOS):
+            raise CommandError(f"Modos válidos: {', '.join(MODOS)}")
+        stock = options["stock"] if options["stock"] is not None else options["ordenes"] * 9 // 10
+
+        # BD de test descartable; en SQLite tiene que ser un archivo (TEST NAME) para los threads
+        setup_test_environment()
+        nombre_original = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            resultados = [self._correr(modo, stock, options) for modo in modos]
+        finally:
+            connection.close()
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(
+            f"{'modo':<12} {'órdenes/s':>10} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'ok':>6} {'agotado':>8} {'reintentos':>11}"
+        )
+        for r in resultados:
+            self.stdout.write(
+                f"{r['modo']:<12} {r['ordenes_s']:>10.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                f"{r['confirmadas']:>6} {r['sin_stock']:>8} {r['reintentos']:>11}"
+            )
+        destino = options["salida_json"]
+        if destino == "-":
+            self.stdout.write(json.dumps(resultados, indent=2))
+        elif destino:
+            with open(destino, "w", encoding="utf-8") as f:
+                json.dump(resultados, f, indent=2)
+
+    def _correr(self, modo, stock, options):
+        producto = Producto.objects.create(nombre=f"Lanzamiento {modo}", slug=f"lanzamiento-{modo}",
+                                           precio=1000, stock=stock)
+        if modo == "fragmentado":
+            producto.fragmentar_stock(options["fragmentos"])
+
+        resultado = benchmarks.checkout_concurrente(producto, options["ordenes"], options["hilos"])
+
+        # Sin sobreventa: lo vendido + lo que queda = stock inicial, y nunca más de lo que había
+        producto = Producto.objects.con_stock_total().get(pk=producto.pk)
+        vendidas = OrdenItem.objects.filter(
+            producto=producto, orden__estado="confirmada"
+        ).aggregate(s=Sum("cantidad"))["s"] or 0
+        if vendidas + producto.stock_total != stock or vendidas != resultado["confirmadas"]:
+            raise CommandError(
+                f"{modo}: inconsistencia (vendidas {vendidas}, quedan {producto.stock_total}, inicial {stock})"
+            )
+        return {"modo": modo, "stock_inicial": stock, "vendidas": vendidas, **resultado}
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from carrito import catalogo
+
+
+class Command(BaseCommand):
+    help = "Muestra los contadores de hit/miss del cache del catálogo (y opcionalmente lo invalida)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--invalidar", action="store_true", help="Sube la versión del catálogo.")
+        parser.add_argument("--reiniciar", action="store_true", help="Pone en cero los contadores.")
+
+    def handle(self, *args, **options):
+        if options["invalidar"]:
+            catalogo.invalidar()
+        if options["reiniciar"]:
+            catalogo.reiniciar_estadisticas()
+
+        stats = catalogo.estadisticas()
+        self.stdout.write(
+            f"versión {stats['version']} · hits {stats['hits']} · misses {stats['misses']} "
+            f"· ratio {stats['hit_ratio']:.2%}"
+        )
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from carrito.models import MovimientoStock, Producto
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el stock de cada producto (fila + fragmentos) con la suma de su libro de "
+        "movimientos. Con --corregir agrega un movimiento de ajuste por cada diferencia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corregir", action="store_true")
+
+    def handle(self, *args, **options):
+        saldo = (
+            MovimientoStock.objects.filter(producto=OuterRef("pk"))
+            .order_by().values("producto").annotate(s=Sum("cantidad")).values("s")
+        )
+        # Stock y saldo en la misma query: los dos se escriben en la misma transacción
+        diferencias = (
+            Producto.objects.con_stock_total()
+            .annotate(saldo=Coalesce(Subquery(saldo, output_field=IntegerField()), Value(0)))
+            .exclude(saldo=F("stock_total"))
+            .order_by("pk")
+            .values_list("pk", "slug", "stock_total", "saldo")
+        )
+
+        ajustes = {}
+        for pid, slug, stock, libro in diferencias.iterator(chunk_size=2000):
+            self.stdout.write(f"{slug}: stock {stock}, libro {libro} ({stock - libro:+d})")
+            ajustes[pid] = stock - libro
+
+        if not ajustes:
+            self.stdout.write(self.style.SUCCESS("Stock y libro de movimientos coinciden."))
+            return
+        if options["corregir"]:
+            with transaction.atomic():
+                MovimientoStock.registrar(ajustes, "ajuste")
+            self.stdout.write(self.style.SUCCESS(f"{len(ajustes)} ajustes registrados."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(ajustes)} productos con diferencias (--corregir para ajustar)."))
@@ -0,0 +1,85 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+
+from carrito import benchmarks
+from carrito.models import OrdenItem, Producto
+
+# "basico": SQLite tal cual (journal DELETE, transacciones DEFERRED, timeout de 5 s)
+PERFILES = {
+    "basico": {"init_command": "PRAGMA journal_mode=DELETE", "timeout": 5},
+    "produccion": None,  # DATABASES["default"]["OPTIONS"] (ver SQLITE_PRODUCCION en settings)
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de estrés del checkout en SQLite: varios procesos compran el mismo producto "
+        "por HTTP (agregar al carrito + CheckoutView.post) a la vez. Verifica que no se "
+        "sobrevenda y reporta órdenes/s y errores 'database is locked' por perfil."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ordenes", type=int, default=400)
+        parser.add_argument("--procesos", type=int, default=8)
+        parser.add_argument("--stock", type=int,
+                            help="Stock inicial (default: 90%% de lo pedido, para forzar el agotado).")
+        parser.add_argument("--perfiles", default="produccion,basico")
+        parser.add_argument("--json", dest="salida_json", help="Archivo donde guardar el resultado ('-' = stdout).")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("estres_checkout es para SQLite; en Postgres usá carga_checkout.")
+        perfiles = [p.strip() for p in options["perfiles"].split(",") if p.strip()]
+        if set(perfiles) - set(PERFILES):
+            raise CommandError(f"Perfiles válidos: {', '.join(PERFILES)}")
+        if options["procesos"] < 1:
+            raise CommandError("--procesos tiene que ser al menos 1.")
+        stock = options["stock"] if options["stock"] is not None else options["ordenes"] * 9 // 10
+
+        resultados = [self._correr(perfil, stock, options) for perfil in perfiles]
+
+        self.stdout.write(
+            f"{'perfil':<12} {'órdenes/s':>10} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'ok':>6} {'agotado':>8} {'errores':>8}"
+        )
+        for r in resultados:
+            self.stdout.write(
+                f"{r['perfil']:<12} {r['ordenes_s']:>10.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                f"{r['confirmadas']:>6} {r['sin_stock']:>8} {r['errores']:>8}"
+            )
+        destino = options["salida_json"]
+        if destino == "-":
+            self.stdout.write(json.dumps(resultados, indent=2))
+        elif destino:
+            with open(destino, "w", encoding="utf-8") as f:
+                json.dump(resultados, f, indent=2)
+
+    def _correr(self, perfil, stock, options):
+        # BD de test descartable (archivo: la comparten los procesos), una por perfil:
+        # el journal WAL queda grabado en el archivo
+        db = connection.settings_dict
+        nombre_original, opciones_originales = db["NAME"], db["OPTIONS"]
+        db["OPTIONS"] = PERFILES[perfil] or opciones_originales
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            producto = Producto.objects.create(nombre="Lanzamiento", slug="lanzamiento", precio=1000, stock=stock)
+            resultado = benchmarks.checkout_procesos(producto, options["ordenes"], options["procesos"])
+
+            # Sin sobreventa: lo vendido + lo que queda = stock inicial
+            producto.refresh_from_db()
+            vendidas = OrdenItem.objects.filter(
+                producto=producto, orden__estado="confirmada"
+            ).aggregate(s=Sum("cantidad"))["s"] or 0
+            if vendidas + producto.stock != stock or vendidas != resultado["confirmadas"] or producto.stock < 0:
+                raise CommandError(
+                    f"{perfil}: inconsistencia (vendidas {vendidas}, quedan {producto.stock}, inicial {stock})"
+                )
+        finally:
+            connection.close()
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            db["OPTIONS"] = opciones_originales
+        return {"perfil": perfil, "stock_inicial": stock, "vendidas": vendidas, **resultado}
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from carrito import importacion
+
+
+class Command(BaseCommand):
+    help = "Exporta el catálogo a CSV o JSONL leyendo por chunks (mismo formato que importar_catalogo)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", nargs="?", default="-", help="Ruta de salida, o - para stdout (default).")
+        parser.add_argument("--formato", choices=["csv", "jsonl"], help="Por defecto, según la extensión.")
+        parser.add_argument("--lote", type=int, default=importacion.LOTE, help="Filas por chunk (default %(default)s).")
+
+    def handle(self, *args, **options):
+        formato = importacion.formato_de(options["archivo"], options["formato"])
+        if options["archivo"] == "-":
+            importacion.exportar(self.stdout, formato, lote=options["lote"])
+            return
+        with open(options["archivo"], "w", encoding="utf-8", newline="") as salida:
+            total = importacion.exportar(salida, formato, lote=options["lote"])
+        self.stderr.write(self.style.SUCCESS(f"{total} productos exportados a {options['archivo']}."))
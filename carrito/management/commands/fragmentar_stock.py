@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from carrito.models import Producto
+
+
+class Command(BaseCommand):
+    help = (
+        "Modo alta demanda: reparte el stock de los productos en N fragmentos para que "
+        "los checkouts concurrentes no se bloqueen sobre la misma fila (o lo consolida)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("slugs", nargs="+")
+        parser.add_argument("--fragmentos", type=int, default=8)
+        parser.add_argument("--consolidar", action="store_true",
+                            help="Vuelve al modo normal: todo el stock en la fila del producto.")
+
+    def handle(self, *args, **options):
+        productos = Producto.objects.in_bulk(options["slugs"], field_name="slug")
+        faltan = set(options["slugs"]) - set(productos)
+        if faltan:
+            raise CommandError(f"No existen: {', '.join(sorted(faltan))}")
+
+        for slug, producto in productos.items():
+            if options["consolidar"]:
+                producto.consolidar_stock()
+            else:
+                producto.fragmentar_stock(options["fragmentos"])
+            fragmentos = producto.fragmentos.count()
+            self.stdout.write(
+                f"{slug}: stock {producto.existencias} "
+                + (f"en {fragmentos} fragmentos" if fragmentos else "en la fila")
+            )
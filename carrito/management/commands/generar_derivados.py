@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from carrito import catalogo, imagenes
+from carrito.models import Producto
+
+
+class Command(BaseCommand):
+    help = "Genera (backfill) las miniaturas AVIF/WebP de Producto.imagen usando un pool de procesos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--forzar", action="store_true", help="Regenera aunque ya existan.")
+        parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        qs = Producto.objects.exclude(imagen="").exclude(imagen__isnull=True).only(
+            "id", "imagen", "imagen_derivados"
+        )
+        pendientes, anteriores = {}, {}
+        for p in qs.iterator():
+            if options["forzar"] or imagenes.necesita_derivados(p):
+                pendientes[p.id] = p.imagen.name
+                anteriores[p.id] = p.imagen_derivados or {}
+        if not pendientes:
+            self.stdout.write("No hay imágenes pendientes.")
+            return
+
+        listos, errores, cambiados = 0, 0, 0
+        ahora = timezone.now()
+        # initializer=django.setup: necesario si el sistema arranca procesos con "spawn"
+        with ProcessPoolExecutor(max_workers=options["procesos"], initializer=django.setup) as pool:
+            futuros = {pool.submit(imagenes.generar, nombre): pid for pid, nombre in pendientes.items()}
+            for futuro in as_completed(futuros):
+                pid = futuros[futuro]
+                nombre = pendientes[pid]
+                try:
+                    manifiesto = futuro.result()
+                except (OSError, ValueError) as e:
+                    errores += 1
+                    self.stderr.write(f"Producto {pid} ({nombre}): {e}")
+                    continue
+                # Como en signals._generar_derivados: si la imagen cambió mientras tanto, gana la nueva
+                if not Producto.objects.filter(pk=pid, imagen=nombre).update(
+                    imagen_derivados=manifiesto, actualizado=ahora
+                ):
+                    cambiados += 1
+                    continue
+                listos += 1
+                if anteriores[pid].get("origen") != nombre:
+                    imagenes.borrar(anteriores[pid])
+
+        if listos:
+            catalogo.invalidar()
+        self.stdout.write(self.style.SUCCESS(
+            f"Derivados generados para {listos} productos ({errores} con error, "
+            f"{cambiados} con la imagen cambiada mientras tanto)."
+        ))
@@ -0,0 +1,61 @@
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from carrito import importacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa productos desde CSV o JSONL (slug, nombre, descripcion, precio, stock) "
+        "con upserts por lote sobre slug. Con --dry-run solo muestra el diff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta del archivo, o - para leer de stdin.")
+        parser.add_argument("--formato", choices=["csv", "jsonl"], help="Por defecto, según la extensión.")
+        parser.add_argument("--lote", type=int, default=importacion.LOTE, help="Filas por lote (default %(default)s).")
+        parser.add_argument("--dry-run", action="store_true", help="No escribe nada: muestra altas y cambios.")
+        parser.add_argument("--mostrar", type=int, default=50,
+                            help="Máximo de líneas de diff a mostrar en --dry-run (0 = todas).")
+
+    def handle(self, *args, **options):
+        formato = importacion.formato_de(options["archivo"], options["formato"])
+        mostrados = 0
+
+        def al_cambiar(slug, diff):
+            nonlocal mostrados
+            if not options["dry_run"] or (options["mostrar"] and mostrados >= options["mostrar"]):
+                return
+            mostrados += 1
+            if all(antes is None for antes, _ in diff.values()):
+                self.stdout.write(self.style.SUCCESS(f"+ {slug}"))
+            else:
+                cambios = ", ".join(f"{campo}: {antes} -> {despues}" for campo, (antes, despues) in diff.items())
+                self.stdout.write(f"~ {slug}: {cambios}")
+
+        def al_error(numero, motivo):
+            self.stderr.write(f"Línea {numero}: {motivo}")
+
+        try:
+            # stdin no es nuestro: se usa pero no se cierra
+            fuente = nullcontext(sys.stdin) if options["archivo"] == "-" else open(
+                options["archivo"], encoding="utf-8-sig", newline=""
+            )
+        except OSError as e:
+            raise CommandError(f"No se pudo abrir {options['archivo']}: {e}")
+        with fuente as archivo:
+            resumen = importacion.importar(
+                importacion.leer_filas(archivo, formato),
+                lote=options["lote"],
+                dry_run=options["dry_run"],
+                al_cambiar=al_cambiar,
+                al_error=al_error,
+            )
+
+        prefijo = "[dry-run] " if options["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefijo}{resumen['altas']} altas, {resumen['cambios']} cambios, "
+            f"{resumen['iguales']} sin cambios, {resumen['errores']} con error."
+        ))
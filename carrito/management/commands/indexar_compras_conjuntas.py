@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from carrito import recomendaciones
+
+
+class Command(BaseCommand):
+    help = (
+        "Actualiza el índice de 'comprados juntos' con las órdenes confirmadas o canceladas "
+        "desde la última corrida (para cron). Con --reconstruir lo rehace desde todo el historial."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reconstruir", action="store_true", help="Vaciar el índice y recorrer todas las órdenes.")
+        parser.add_argument("--lote", type=int, default=recomendaciones.LOTE, help="Órdenes por transacción.")
+
+    def handle(self, *args, **options):
+        if options["reconstruir"]:
+            ordenes = recomendaciones.reconstruir(options["lote"])
+        else:
+            ordenes = recomendaciones.actualizar(options["lote"])
+        self.stdout.write(self.style.SUCCESS(f"{ordenes} órdenes procesadas."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from carrito.models import Reserva
+
+
+class Command(BaseCommand):
+    help = "Borra las reservas de stock vencidas (pensado para correr por cron)."
+
+    def handle(self, *args, **options):
+        borradas, _ = Reserva.objects.vencidas().delete()
+        self.stdout.write(self.style.SUCCESS(f"Reservas vencidas eliminadas: {borradas}"))
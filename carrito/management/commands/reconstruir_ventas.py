@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from carrito import reportes
+
+
+class Command(BaseCommand):
+    help = "Recalcula los agregados de ventas (VentaDiaria/VentaProductoDiaria) desde las órdenes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Fecha AAAA-MM-DD (default: todo el historial).")
+        parser.add_argument("--hasta", help="Fecha AAAA-MM-DD (inclusive).")
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options["desde"]) if options["desde"] else None
+            hasta = date.fromisoformat(options["hasta"]) if options["hasta"] else None
+        except ValueError:
+            raise CommandError("Las fechas van como AAAA-MM-DD.")
+        filas = reportes.reconstruir(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(f"Agregados reconstruidos: {filas} filas producto/día."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from carrito import busqueda
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de productos (FTS5 en SQLite, GIN en Postgres)."
+
+    def handle(self, *args, **options):
+        usado = busqueda.reconstruir()
+        if usado == "basico":
+            self.stdout.write(self.style.WARNING("Este motor no tiene índice de búsqueda: se usa icontains."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Índice de búsqueda reconstruido ({usado})."))
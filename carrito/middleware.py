@@ -0,0 +1,190 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import instrumentacion, routers
+from .cart_storage import REQUEST_ATTR
+
+logger = logging.getLogger(__name__)
+
+
+class _SyncAsyncMiddleware:
+    """
+    Base para middlewares que funcionan igual bajo WSGI y ASGI: con vistas
+    async no obligan a Django a pasar el request por un thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.procesar(request)
+
+    def procesar(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+class CartStorageMiddleware(_SyncAsyncMiddleware):
+    """
+    Escribe la cookie del carrito cuando el storage lo pide
+    (SignedCookieCartStorage / CacheCartStorage). Con sesiones no hace nada.
+    """
+
+    def procesar(self, request):
+        return self._persistir(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._persistir(request, await self.get_response(request))
+
+    def _persistir(self, request, response):
+        storage = getattr(request, REQUEST_ATTR, None)
+        if storage is not None:
+            storage.persistir(response)
+        return response
+
+
+class ReplicaMiddleware(_SyncAsyncMiddleware):
+    """
+    Habilita las lecturas en réplica durante el request (ver carrito.routers)
+    y, si el request escribió, deja la cookie que pega al navegador a la
+    primaria por REPLICAS_PEGADO_SEGUNDOS. Las vistas con usar_primaria=True
+    leen siempre de default. Sin réplicas no hace nada.
+    """
+
+    def procesar(self, request):
+        if not routers.replicas():
+            return self.get_response(request)
+        token = routers.iniciar(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            estado = routers.terminar(token)
+        return self._pegar(response, estado)
+
+    async def __acall__(self, request):
+        if not routers.replicas():
+            return await self.get_response(request)
+        token = routers.iniciar(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            estado = routers.terminar(token)
+        return self._pegar(response, estado)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Vistas que leen todo de la primaria aunque sean GET (checkout)
+        if getattr(getattr(view_func, "view_class", None), "usar_primaria", False):
+            routers.pegar_a_primaria()
+
+    def _pegar(self, response, estado):
+        if estado.escribio:
+            response.set_cookie(
+                routers.COOKIE, "1",
+                max_age=getattr(settings, "REPLICAS_PEGADO_SEGUNDOS", 30),
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class QueryBudgetMiddleware(_SyncAsyncMiddleware):
+    """
+    Cuenta y cronometra el SQL de cada request y lo expone en los headers
+    Server-Timing / X-DB-Queries. Acumula estadísticas por vista y aplica
+    QUERY_BUDGETS: con QUERY_BUDGET_ESTRICTO (lo prenden los tests que miden
+    presupuestos) levanta QueryBudgetExcedido y el test falla; si no, deja un
+    warning en el log y el header X-DB-Presupuesto. En producción no tiene que
+    levantar: la vista ya confirmó sus cambios y el cliente vería un 500 de
+    algo que se guardó.
+    """
+
+    def _instrumentar(self, stack, registro):
+        # Crear los wrappers no abre conexiones: solo las de los alias que se usen
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(registro))
+
+    def procesar(self, request):
+        registro = instrumentacion.RegistroSQL()
+        inicio = time.perf_counter()
+        with ExitStack() as stack:
+            self._instrumentar(stack, registro)
+            response = self.get_response(request)
+        return self._cerrar(request, response, registro, inicio)
+
+    async def __acall__(self, request):
+        # Bajo ASGI el ORM async corre en el thread del request (sync_to_async
+        # thread-sensitive): los wrappers se instalan y se sacan ahí, sobre
+        # las conexiones de ese thread.
+        registro = instrumentacion.RegistroSQL()
+        inicio = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(self._instrumentar)(stack, registro)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._cerrar(request, response, registro, inicio)
+
+    def _cerrar(self, request, response, registro, inicio):
+        total_ms = (time.perf_counter() - inicio) * 1000
+
+        match = getattr(request, "resolver_match", None)
+        vista = match.view_name if match else request.path
+
+        response["X-DB-Queries"] = str(registro.queries)
+        response["Server-Timing"] = (
+            f'db;dur={registro.ms:.2f};desc="{registro.queries} queries", total;dur={total_ms:.2f}'
+        )
+        instrumentacion.acumular(vista, registro, total_ms)
+
+        error = instrumentacion.verificar_presupuesto(vista, registro)
+        if error:
+            if getattr(settings, "QUERY_BUDGET_ESTRICTO", False):
+                raise instrumentacion.QueryBudgetExcedido(error)
+            logger.warning(error)
+            response["X-DB-Presupuesto"] = "excedido"
+        return response
+
+
+class WhiteNoiseAsyncMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise es solo sync: en la cadena ASGI obligaría a Django a correr
+    todo lo que viene detrás en un thread. Esta variante sirve los estáticos
+    igual que WhiteNoise y, para el resto, sigue en async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0004_remove_producto_carrito_pro_slug_2c4946_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sesion', models.CharField(max_length=64)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('expira', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='orden',
+            name='apellido',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='orden',
+            name='direccion',
+            field=models.TextField(),
+        ),
+        migrations.AlterField(
+            model_name='orden',
+            name='dni',
+            field=models.CharField(max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='orden',
+            name='metodo_pago',
+            field=models.CharField(choices=[('tarjeta', 'Tarjeta de crédito/débito'), ('mercadopago', 'MercadoPago'), ('efectivo', 'Efectivo/Pago en sucursal')], max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='orden',
+            name='nombre',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['slug'], name='carrito_pro_slug_2c4946_idx'),
+        ),
+        migrations.AddField(
+            model_name='reserva',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='carrito.producto'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['producto', 'expira'], name='carrito_res_product_3cedb8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['expira'], name='carrito_res_expira_4883ab_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=models.UniqueConstraint(fields=('sesion', 'producto'), name='reserva_unica_por_sesion'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:06
+
+from django.db import migrations, models
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE carrito_producto_fts USING fts5("
+                "nombre, descripcion, tokenize='unicode61 remove_diacritics 2')"
+            )
+        except Exception:
+            # SQLite compilado sin FTS5: la búsqueda cae a icontains
+            return
+        schema_editor.execute(
+            "INSERT INTO carrito_producto_fts(rowid, nombre, descripcion) "
+            "SELECT id, nombre, descripcion FROM carrito_producto"
+        )
+    elif vendor == "postgresql":
+        from django.contrib.postgres.indexes import GinIndex, OpClass
+        from django.contrib.postgres.search import SearchVector
+        from django.db.models.functions import Upper
+
+        Producto = apps.get_model("carrito", "Producto")
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.add_index(Producto, GinIndex(
+            SearchVector("nombre", "descripcion", config="spanish"),
+            name="producto_busqueda_gin",
+        ))
+        schema_editor.add_index(Producto, GinIndex(
+            # icontains en Postgres compila a UPPER(nombre) LIKE UPPER(...)
+            OpClass(Upper("nombre"), name="gin_trgm_ops"),
+            name="producto_nombre_trgm",
+        ))
+
+
+def borrar_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS carrito_producto_fts")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS producto_busqueda_gin")
+        schema_editor.execute("DROP INDEX IF EXISTS producto_nombre_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0006_producto_nombre_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['precio'], name='producto_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['-creado'], name='producto_creado_idx'),
+        ),
+        migrations.RunPython(crear_indices_busqueda, borrar_indices_busqueda),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0007_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='imagen_derivados',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
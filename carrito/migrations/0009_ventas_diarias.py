@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:26
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0008_producto_imagen_derivados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('metodo_pago', models.CharField(max_length=30)),
+                ('estado', models.CharField(max_length=12)),
+                ('ordenes', models.IntegerField(default=0)),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'venta diaria',
+                'verbose_name_plural': 'ventas diarias',
+                'ordering': ['-fecha', 'metodo_pago', 'estado'],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'metodo_pago', 'estado'), name='venta_diaria_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaProductoDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('metodo_pago', models.CharField(max_length=30)),
+                ('estado', models.CharField(max_length=12)),
+                ('ordenes', models.IntegerField(default=0)),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ventas_diarias', to='carrito.producto')),
+            ],
+            options={
+                'verbose_name': 'venta diaria por producto',
+                'verbose_name_plural': 'ventas diarias por producto',
+                'ordering': ['-fecha', 'producto'],
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='venta_producto_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'producto', 'metodo_pago', 'estado'), name='venta_producto_diaria_unica')],
+            },
+        ),
+    ]
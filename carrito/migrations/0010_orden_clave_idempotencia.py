@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0009_ventas_diarias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orden',
+            name='clave_idempotencia',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
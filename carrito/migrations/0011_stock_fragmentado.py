@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0010_orden_clave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='stock_fragmentado',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StockFragmento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveSmallIntegerField()),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fragmentos', to='carrito.producto')),
+            ],
+            options={
+                'verbose_name': 'fragmento de stock',
+                'verbose_name_plural': 'fragmentos de stock',
+                'ordering': ['producto', 'numero'],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'numero'), name='stock_fragmento_unico'), models.CheckConstraint(condition=models.Q(('stock__gte', 0)), name='stock_fragmento_no_negativo')],
+            },
+        ),
+    ]
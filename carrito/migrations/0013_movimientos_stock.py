@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def stock_inicial(apps, schema_editor):
+    """Punto de partida del libro: un movimiento 'inicial' con el stock actual de cada producto."""
+    Producto = apps.get_model("carrito", "Producto")
+    StockFragmento = apps.get_model("carrito", "StockFragmento")
+    MovimientoStock = apps.get_model("carrito", "MovimientoStock")
+    fragmentos = dict(
+        StockFragmento.objects.order_by().values("producto").annotate(s=Sum("stock")).values_list("producto", "s")
+    )
+    lote = []
+    for pid, stock in Producto.objects.values_list("pk", "stock").iterator(chunk_size=2000):
+        total = stock + (fragmentos.get(pid) or 0)
+        if total:
+            lote.append(MovimientoStock(producto_id=pid, cantidad=total, motivo="inicial"))
+        if len(lote) >= 2000:
+            MovimientoStock.objects.bulk_create(lote)
+            lote = []
+    MovimientoStock.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0012_producto_actualizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='umbral_stock',
+            field=models.PositiveIntegerField(default=0, help_text='Genera una alerta cuando el stock baja de este valor (0 = sin alerta).'),
+        ),
+        migrations.CreateModel(
+            name='AlertaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField()),
+                ('umbral', models.PositiveIntegerField()),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('resuelta', models.DateTimeField(blank=True, null=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas', to='carrito.producto')),
+            ],
+            options={
+                'verbose_name': 'alerta de stock',
+                'verbose_name_plural': 'alertas de stock',
+                'ordering': ['-creado'],
+                'indexes': [models.Index(fields=['producto', 'resuelta'], name='alerta_producto_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField()),
+                ('motivo', models.CharField(choices=[('inicial', 'Stock inicial'), ('venta', 'Venta'), ('cancelacion', 'Cancelación'), ('reposicion', 'Reposición'), ('importacion', 'Importación'), ('ajuste', 'Ajuste')], max_length=12)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('orden', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to='carrito.orden')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='carrito.producto')),
+            ],
+            options={
+                'verbose_name': 'movimiento de stock',
+                'verbose_name_plural': 'movimientos de stock',
+                'ordering': ['-creado', '-id'],
+                'indexes': [models.Index(fields=['producto', 'creado'], name='movimiento_producto_idx')],
+            },
+        ),
+        migrations.RunPython(stock_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0013_movimientos_stock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompraConjunta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntaje', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'compra conjunta',
+                'verbose_name_plural': 'compras conjuntas',
+            },
+        ),
+        migrations.AddField(
+            model_name='orden',
+            name='en_compras_conjuntas',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='orden',
+            index=models.Index(condition=models.Q(models.Q(('en_compras_conjuntas', False), ('estado', 'confirmada')), models.Q(('en_compras_conjuntas', True), ('estado', 'cancelada')), _connector='OR'), fields=['id'], name='orden_compras_pendientes_idx'),
+        ),
+        migrations.AddField(
+            model_name='compraconjunta',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compras_conjuntas', to='carrito.producto'),
+        ),
+        migrations.AddField(
+            model_name='compraconjunta',
+            name='relacionado',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comprado_con', to='carrito.producto'),
+        ),
+        migrations.AddIndex(
+            model_name='compraconjunta',
+            index=models.Index(fields=['producto', '-puntaje'], name='compra_conjunta_top_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='compraconjunta',
+            constraint=models.UniqueConstraint(fields=('producto', 'relacionado'), name='compra_conjunta_unica'),
+        ),
+    ]
@@ -1,11 +1,115 @@
 # models.py
+import logging
+import random
+from datetime import timedelta
 from decimal import Decimal
 from django.conf import settings
 from django.db import models, transaction
-from django.db.models import F, Q, Sum, DecimalField
+from django.db.models import F, Q, Sum, DecimalField, Case, When, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Now
 from django.urls import reverse
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 
+from . import catalogo
+
+# Para los .update() de stock, que no pasan por auto_now
+AHORA = Now()
+
+logger = logging.getLogger(__name__)
+
+
+def _reservado_subquery(excluir_sesion=None):
+    """Unidades reservadas (vigentes) del producto de la fila externa."""
+    reservas = Reserva.objects.activas().filter(producto=OuterRef("pk"))
+    if excluir_sesion:
+        reservas = reservas.exclude(sesion=excluir_sesion)
+    total = (
+        reservas.order_by()
+        .values("producto")
+        .annotate(s=Sum("cantidad"))
+        .values("s")
+    )
+    return Coalesce(Subquery(total, output_field=models.IntegerField()), Value(0))
+
+
+def _stock_total():
+    """
+    Stock de la fila más el de sus fragmentos. La subquery solo se evalúa
+    para los productos en modo alta demanda (stock_fragmentado).
+    """
+    fragmentos = (
+        StockFragmento.objects.filter(producto=OuterRef("pk"))
+        .order_by()
+        .values("producto")
+        .annotate(s=Sum("stock"))
+        .values("s")
+    )
+    return Case(
+        When(
+            stock_fragmentado=True,
+            then=F("stock") + Coalesce(Subquery(fragmentos, output_field=models.IntegerField()), Value(0)),
+        ),
+        default=F("stock"),
+        output_field=models.IntegerField(),
+    )
+
+
+class ProductoQuerySet(models.QuerySet):
+    def con_stock_total(self):
+        """Anota 'stock_total' (fila + fragmentos, ver StockFragmento)."""
+        return self.annotate(stock_total=_stock_total())
+
+    def con_disponible(self, excluir_sesion=None):
+        """
+        Anota 'stock_total', 'reservado' (reservas vigentes de otras sesiones)
+        y 'disponible' = stock_total - reservado, en la misma query.
+        """
+        return self.con_stock_total().annotate(reservado=_reservado_subquery(excluir_sesion)).annotate(
+            disponible=F("stock_total") - F("reservado")
+        )
+
+    def en_stock(self):
+        return self.filter(
+            Q(stock__gt=0)
+            | Q(stock_fragmentado=True)
+            & Exists(StockFragmento.objects.filter(producto=OuterRef("pk"), stock__gt=0))
+        )
+
+    def _bloquear(self):
+        # Sin las anotaciones del queryset original (FOR UPDATE + subqueries con SUM)
+        return Producto.objects.filter(pk__in=self.values("pk")).select_for_update().order_by("pk")
+
+    def sumar_stock(self, cantidad: int, motivo: str = "reposicion") -> int:
+        """
+        Suma 'cantidad' (negativa = resta) al stock de la fila de todos los
+        productos del queryset con un solo UPDATE, más su INSERT en el libro.
+        Los que quedarían negativos no se tocan. Devuelve cuántos cambió.
+        """
+        cantidad = int(cantidad)
+        with transaction.atomic():
+            ids = list(self._bloquear().filter(stock__gte=max(-cantidad, 0)).values_list("pk", flat=True))
+            Producto.objects.filter(pk__in=ids).update(stock=F("stock") + cantidad, actualizado=AHORA)
+            MovimientoStock.registrar({pid: cantidad for pid in ids}, motivo)
+            catalogo.invalidar()
+        return len(ids)
+
+    def fijar_stock(self, cantidad: int, motivo: str = "ajuste") -> int:
+        """
+        Pone el stock de la fila en 'cantidad' (en los fragmentados se suma a
+        los fragmentos) con un solo UPDATE; el libro registra la diferencia de cada uno.
+        """
+        cantidad = int(cantidad)
+        if cantidad < 0:
+            raise ValidationError("El stock no puede ser negativo.")
+        with transaction.atomic():
+            anteriores = dict(self._bloquear().values_list("pk", "stock"))
+            Producto.objects.filter(pk__in=anteriores).update(stock=cantidad, actualizado=AHORA)
+            MovimientoStock.registrar({pid: cantidad - stock for pid, stock in anteriores.items()}, motivo)
+            catalogo.invalidar()
+        return len(anteriores)
+
+
 class Producto(models.Model):
     nombre = models.CharField(max_length=120)              # obligatorio
     slug = models.SlugField(unique=True)
@@ -13,14 +117,32 @@ class Producto(models.Model):
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     imagen = models.ImageField(upload_to="productos/", blank=True, null=True)
+    # Manifiesto de miniaturas/formatos generados (ver carrito/imagenes.py)
+    imagen_derivados = models.JSONField(default=dict, blank=True, editable=False)
     creado = models.DateTimeField(auto_now_add=True)
+    # auto_now cubre save(); los UPDATE de stock lo setean a mano (ver AHORA)
+    actualizado = models.DateTimeField(auto_now=True)
+    # Modo alta demanda: el stock vive repartido en StockFragmento (ver fragmentar_stock)
+    stock_fragmentado = models.BooleanField(default=False, editable=False)
+    umbral_stock = models.PositiveIntegerField(
+        default=0, help_text="Genera una alerta cuando el stock baja de este valor (0 = sin alerta)."
+    )
+
+    objects = ProductoQuerySet.as_manager()
 
     class Meta:
         ordering = ["nombre"]
         constraints = [
             models.CheckConstraint(check=Q(stock__gte=0), name="producto_stock_no_negativo"),
         ]
-        indexes = [models.Index(fields=["slug"])]
+        indexes = [
+            models.Index(fields=["slug"]),
+            # Paginación por cursor del catálogo: WHERE (nombre, id) > (...) ORDER BY nombre, id
+            models.Index(fields=["nombre", "id"], name="producto_nombre_id_idx"),
+            # Filtros/orden de la búsqueda (rango de precio, "más nuevos")
+            models.Index(fields=["precio"], name="producto_precio_idx"),
+            models.Index(fields=["-creado"], name="producto_creado_idx"),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -28,29 +150,324 @@ class Producto(models.Model):
     def get_absolute_url(self):
         return reverse("carrito:producto-detalle", args=[self.slug])
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._stock_cargado = instancia.__dict__.get("stock")
+        return instancia
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or "stock" in fields:
+            self._stock_cargado = self.__dict__.get("stock")
+
+    def save(self, *args, **kwargs):
+        """
+        Los cambios de stock hechos con save() (alta, admin, list_editable)
+        quedan en MovimientoStock con la diferencia real contra la BD.
+
+        Si el stock no cambió desde que se leyó (descripción, precio, imagen)
+        no se toma el lock ni se anota nada, y 'stock' queda fuera del UPDATE:
+        no pisa las ventas que pasaron mientras tanto.
+        """
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "stock" not in update_fields:
+            return super().save(*args, **kwargs)
+        if (
+            update_fields is None and not self._state.adding
+            and self.stock == getattr(self, "_stock_cargado", None)
+        ):
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != "stock"
+            ]
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            anterior = 0
+            if not self._state.adding:
+                anterior = (
+                    Producto.objects.select_for_update()
+                    .filter(pk=self.pk).values_list("stock", flat=True).first()
+                ) or 0
+            agregado = self._state.adding
+            super().save(*args, **kwargs)
+            MovimientoStock.registrar(
+                {self.pk: self.stock - anterior}, "inicial" if agregado else "ajuste",
+                umbrales={self.pk: self.umbral_stock},
+            )
+        self._stock_cargado = self.stock
+
+    @property
+    def existencias(self) -> int:
+        """Stock total: el de la fila más el de los fragmentos (si está fragmentado)."""
+        if not self.stock_fragmentado:
+            return self.stock
+        if "stock_total" in self.__dict__:  # anotado por con_stock_total()/con_disponible()
+            return self.stock_total
+        return self.stock + (self.fragmentos.aggregate(s=Sum("stock"))["s"] or 0)
+
+    @property
+    def version(self) -> str:
+        """
+        Cambia con cada save() o movimiento de stock (también el de los
+        fragmentos): es el ETag del detalle y parte de la clave de su cache.
+        """
+        return f"{int(self.actualizado.timestamp() * 1_000_000):x}-{self.existencias}"
+
     def tiene_stock(self, cantidad: int) -> bool:
-        return self.stock >= int(cantidad)
+        return self.existencias >= int(cantidad)
+
+    def stock_disponible(self, excluir_sesion=None) -> int:
+        """Stock menos las reservas vigentes de otras sesiones."""
+        reservado = (
+            Reserva.objects.activas()
+            .filter(producto=self)
+            .exclude(sesion=excluir_sesion or "")
+            .aggregate(s=Sum("cantidad"))["s"]
+        ) or 0
+        return max(self.existencias - reservado, 0)
 
-    def descontar_stock(self, cantidad: int) -> bool:
+    @transaction.atomic
+    def descontar_stock(self, cantidad: int, motivo: str = "ajuste") -> bool:
         cantidad = int(cantidad)
         if cantidad <= 0:
             return True
         updated = (
             Producto.objects
             .filter(pk=self.pk, stock__gte=cantidad)
-            .update(stock=F("stock") - cantidad)
+            .update(stock=F("stock") - cantidad, actualizado=AHORA)
         )
         if updated:
-            self.refresh_from_db(fields=["stock"])
+            MovimientoStock.registrar({self.pk: -cantidad}, motivo, umbrales={self.pk: self.umbral_stock})
+            catalogo.invalidar()
+            self.refresh_from_db(fields=["stock", "actualizado"])
             return True
         return False
 
-    def reponer_stock(self, cantidad: int) -> None:
+    @transaction.atomic
+    def reponer_stock(self, cantidad: int, motivo: str = "reposicion") -> None:
         cantidad = int(cantidad)
         if cantidad <= 0:
             return
-        Producto.objects.filter(pk=self.pk).update(stock=F("stock") + cantidad)
-        self.refresh_from_db(fields=["stock"])
+        Producto.objects.filter(pk=self.pk).update(stock=F("stock") + cantidad, actualizado=AHORA)
+        MovimientoStock.registrar({self.pk: cantidad}, motivo)
+        catalogo.invalidar()
+        self.refresh_from_db(fields=["stock", "actualizado"])
+
+    @transaction.atomic
+    def fragmentar_stock(self, fragmentos: int) -> None:
+        """
+        Modo alta demanda (lanzamientos de pocas piezas con muchos checkouts
+        a la vez): reparte todo el stock en 'fragmentos' filas de
+        StockFragmento y deja la fila del producto en 0. Cada checkout
+        descuenta de un fragmento al azar, así que las transacciones
+        concurrentes no hacen fila sobre la misma fila de Producto.
+
+        Volver a llamarlo rebalancea (suma lo repuesto en la fila).
+        Con fragmentos <= 1 equivale a consolidar_stock().
+        """
+        if fragmentos <= 1:
+            return self.consolidar_stock()
+        total = self._vaciar_fragmentos()
+        base, resto = divmod(total, fragmentos)
+        StockFragmento.objects.bulk_create([
+            StockFragmento(producto=self, numero=i, stock=base + (1 if i < resto else 0))
+            for i in range(fragmentos)
+        ])
+        Producto.objects.filter(pk=self.pk).update(stock=0, stock_fragmentado=True, actualizado=AHORA)
+        catalogo.invalidar()
+        self.refresh_from_db(fields=["stock", "stock_fragmentado", "actualizado"])
+
+    @transaction.atomic
+    def consolidar_stock(self) -> None:
+        """Vuelve al modo normal: suma los fragmentos a la fila y los borra."""
+        total = self._vaciar_fragmentos()
+        Producto.objects.filter(pk=self.pk).update(stock=total, stock_fragmentado=False, actualizado=AHORA)
+        catalogo.invalidar()
+        self.refresh_from_db(fields=["stock", "stock_fragmentado", "actualizado"])
+
+    def _vaciar_fragmentos(self) -> int:
+        """Bloquea fila + fragmentos, borra los fragmentos y devuelve el stock total."""
+        fila = Producto.objects.select_for_update().only("stock").get(pk=self.pk)
+        fragmentos = list(StockFragmento.objects.select_for_update().filter(producto=self))
+        StockFragmento.objects.filter(producto=self).delete()
+        return fila.stock + sum(f.stock for f in fragmentos)
+
+
+class StockFragmento(models.Model):
+    """
+    Parte del stock de un producto en modo alta demanda (ver
+    Producto.fragmentar_stock). El stock del producto es la suma de la fila
+    más sus fragmentos; lo que se repone en la fila se vende igual (es el
+    último recurso de descontar()) y se reparte al volver a fragmentar.
+    """
+    producto = models.ForeignKey(Producto, related_name="fragmentos", on_delete=models.CASCADE)
+    numero = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["producto", "numero"]
+        verbose_name = "fragmento de stock"
+        verbose_name_plural = "fragmentos de stock"
+        constraints = [
+            models.UniqueConstraint(fields=["producto", "numero"], name="stock_fragmento_unico"),
+            models.CheckConstraint(check=Q(stock__gte=0), name="stock_fragmento_no_negativo"),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}#{self.numero}: {self.stock}"
+
+    @classmethod
+    def descontar(cls, pedidos: dict) -> list:
+        """
+        Descuenta {producto_id: cantidad} de los fragmentos con UPDATEs
+        condicionales (stock >= lo que se toma). Para cada producto se empieza
+        por un fragmento al azar; si no alcanza con uno se recorren en orden de
+        id (orden fijo: dos checkouts grandes no se bloquean en cruz) y lo que
+        falte sale de la fila del producto.
+
+        Lo leído al principio puede quedar viejo (otros checkouts descuentan
+        en paralelo) y hacer fallar UPDATEs con stock de sobra en total: antes
+        de dar un producto por faltante se reintenta con sus filas bloqueadas
+        (ver _descontar_bloqueando).
+
+        Devuelve los productos que no alcanzaron; la transacción del llamador
+        tiene que deshacer lo descontado en ese caso.
+        """
+        fragmentos = {}
+        for fid, pid, stock in (
+            cls.objects.filter(producto_id__in=pedidos, stock__gt=0)
+            .order_by("pk").values_list("pk", "producto_id", "stock")
+        ):
+            fragmentos.setdefault(pid, []).append((fid, stock))
+
+        faltantes = []
+        for pid, cantidad in pedidos.items():
+            candidatos = fragmentos.get(pid, [])
+            restante = cantidad
+            if candidatos:
+                fid, stock = random.choice(candidatos)
+                if stock >= cantidad and cls.objects.filter(pk=fid, stock__gte=cantidad).update(
+                    stock=F("stock") - cantidad
+                ):
+                    continue
+            for fid, stock in candidatos:
+                # Lo leído puede estar viejo: se toma lo que había y el UPDATE lo confirma
+                tomar = min(stock, restante)
+                if tomar and cls.objects.filter(pk=fid, stock__gte=tomar).update(stock=F("stock") - tomar):
+                    restante -= tomar
+                if not restante:
+                    break
+            if restante and not Producto.objects.filter(pk=pid, stock__gte=restante).update(
+                stock=F("stock") - restante, actualizado=AHORA
+            ) and not cls._descontar_bloqueando(pid, restante):
+                faltantes.append(pid)
+        return faltantes
+
+    @classmethod
+    def _descontar_bloqueando(cls, pid, cantidad) -> bool:
+        """
+        Último intento de descontar(): bloquea los fragmentos del producto
+        (en orden de id, como el recorrido) y su fila, suma lo que hay de
+        verdad y, si alcanza, descuenta sin condiciones (nadie más puede
+        tocarlos). Devuelve False si ni así alcanza.
+        """
+        fragmentos = list(
+            cls.objects.select_for_update().filter(producto_id=pid, stock__gt=0)
+            .order_by("pk").values_list("pk", "stock")
+        )
+        fila = Producto.objects.select_for_update().filter(pk=pid).values_list("stock", flat=True).first() or 0
+        if sum(stock for _, stock in fragmentos) + fila < cantidad:
+            return False
+        for fid, stock in fragmentos:
+            tomar = min(stock, cantidad)
+            cls.objects.filter(pk=fid).update(stock=F("stock") - tomar)
+            cantidad -= tomar
+            if not cantidad:
+                return True
+        Producto.objects.filter(pk=pid).update(stock=F("stock") - cantidad, actualizado=AHORA)
+        return True
+
+
+# Órdenes que el índice de compras conjuntas todavía no reflejó: confirmadas
+# sin sumar o canceladas ya sumadas (ver carrito/recomendaciones.py)
+PENDIENTES_COMPRAS_CONJUNTAS = (
+    Q(estado="confirmada", en_compras_conjuntas=False) | Q(estado="cancelada", en_compras_conjuntas=True)
+)
+
+
+class OrdenQuerySet(models.QuerySet):
+    LOTE = 500
+
+    def pendientes_compras_conjuntas(self):
+        return self.filter(PENDIENTES_COMPRAS_CONJUNTAS)
+
+    def cancelar(self) -> int:
+        """
+        Cancela las órdenes del queryset que lo admiten (confirmadas y
+        borradores; las ya canceladas se saltean) y devuelve cuántas cambió.
+
+        Una sola transacción, con las órdenes bloqueadas. Las confirmadas se
+        procesan por lotes y cada lote hace un número fijo de queries, tenga
+        las órdenes e items que tenga (ver _cancelar_confirmadas).
+        """
+        with transaction.atomic():
+            filas = list(
+                self.filter(estado__in=Orden.CANCELABLES)
+                .select_for_update().order_by("pk").values_list("pk", "estado")
+            )
+            borradores = [pk for pk, estado in filas if estado == "borrador"]
+            confirmadas = [pk for pk, estado in filas if estado == "confirmada"]
+            for i in range(0, len(borradores), self.LOTE):
+                # Nunca descontaron stock: solo cambia el estado
+                Orden.objects.filter(pk__in=borradores[i:i + self.LOTE]).update(estado="cancelada")
+            for i in range(0, len(confirmadas), self.LOTE):
+                self._cancelar_confirmadas(confirmadas[i:i + self.LOTE])
+        return len(filas)
+
+    @staticmethod
+    def _cancelar_confirmadas(ids):
+        """
+        Un lote de órdenes confirmadas: UPDATE de estado, un único UPDATE con
+        CASE que repone el stock de todos los productos del lote, un INSERT en
+        el libro de movimientos y los agregados de ventas movidos de
+        "confirmada" a "cancelada" (una query por tabla y sentido).
+        """
+        from . import reportes
+
+        ordenes = {o.pk: o for o in Orden.objects.filter(pk__in=ids).only("creado", "metodo_pago", "estado")}
+        items = list(OrdenItem.objects.filter(orden_id__in=ids).only("orden_id", "producto_id", "cantidad", "precio"))
+        Orden.objects.filter(pk__in=ids).update(estado="cancelada")
+
+        por_producto, por_orden = {}, {}
+        for item in items:
+            por_producto[item.producto_id] = por_producto.get(item.producto_id, 0) + item.cantidad
+            clave = (item.orden_id, item.producto_id)
+            por_orden[clave] = por_orden.get(clave, 0) + item.cantidad
+        if not por_producto:
+            return
+
+        # Vuelve a la fila del producto (también en los fragmentados: cuenta igual para el total)
+        Producto.objects.filter(pk__in=por_producto).update(
+            stock=Case(
+                *[When(pk=pid, then=F("stock") + cantidad) for pid, cantidad in por_producto.items()],
+                default=F("stock"),
+                output_field=models.PositiveIntegerField(),
+            ),
+            actualizado=AHORA,
+        )
+        MovimientoStock.objects.bulk_create([
+            MovimientoStock(producto_id=pid, cantidad=cantidad, motivo="cancelacion", orden_id=oid)
+            for (oid, pid), cantidad in por_orden.items()
+        ])
+        AlertaStock.revisar({}, list(por_producto))
+
+        items_por_orden = {}
+        for item in items:
+            items_por_orden.setdefault(item.orden_id, []).append(item)
+        pares = [(ordenes[oid], lista) for oid, lista in items_por_orden.items()]
+        reportes.registrar_lote(pares, signo=-1, estado="confirmada")
+        reportes.registrar_lote(pares, signo=1, estado="cancelada")
+        catalogo.invalidar()
 
 
 class Orden(models.Model):
@@ -88,6 +505,23 @@ class Orden(models.Model):
     total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
     estado = models.CharField(max_length=12, choices=ESTADOS, default="borrador")
 
+    # Clave que manda el form de checkout: un reenvío con la misma clave no crea otra orden
+    clave_idempotencia = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    # True mientras sus productos estén sumados en CompraConjunta
+    en_compras_conjuntas = models.BooleanField(default=False, editable=False)
+
+    # Estados desde los que se puede cancelar (ver OrdenQuerySet.cancelar)
+    CANCELABLES = ("borrador", "confirmada")
+
+    objects = OrdenQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Índice parcial: encontrar las pendientes no recorre el historial
+            models.Index(fields=["id"], condition=PENDIENTES_COMPRAS_CONJUNTAS, name="orden_compras_pendientes_idx"),
+        ]
+
     def __str__(self):
         quien = f"{self.nombre} {self.apellido}".strip() or str(self.usuario) or "Invitado"
         return f"Orden #{self.id} - {quien} ({self.estado})"
@@ -103,25 +537,120 @@ class Orden(models.Model):
         return agg["s"] or Decimal("0.00")
 
     @transaction.atomic
-    def confirmar(self):
-        producto_ids = list(self.items.values_list("producto_id", flat=True))
-        productos_bloqueados = Producto.objects.select_for_update().filter(id__in=producto_ids)
-        productos_map = {p.id: p for p in productos_bloqueados}
+    def confirmar(self, items=None, sesion=None):
+        """
+        Descuenta stock de todos los items con un único UPDATE condicional
+        (CASE por producto) y marca la orden como confirmada.
 
-        faltantes = []
-        for item in self.items.select_related("producto"):
-            prod = productos_map[item.producto_id]
-            if not prod.descontar_stock(item.cantidad):
-                prod.refresh_from_db(fields=["stock"])
-                faltantes.append(f"«{prod.nombre}»: pedido {item.cantidad}, disponible {prod.stock}")
+        Si se pasan 'items' (OrdenItem ya creados, p.ej. recién salidos de
+        bulk_create) no se vuelven a leer de la BD y el total se calcula en
+        Python con los precios que ya conocemos.
+
+        Las reservas vigentes de otras sesiones se respetan; las de 'sesion'
+        se convierten en el descuento y se borran.
+
+        Los productos con stock fragmentado (modo alta demanda) se descuentan
+        de sus fragmentos (StockFragmento.descontar) en lugar de la fila de
+        Producto; para ellos las reservas ajenas se chequean con una lectura
+        previa, sin bloquear: lo que nunca puede pasar es sobrevender.
+        """
+        if items is None:
+            items = list(self.items.select_related("producto"))
+
+        # Cantidad pedida por producto (un producto podría repetirse)
+        pedidos = {}
+        for item in items:
+            pedidos[item.producto_id] = pedidos.get(item.producto_id, 0) + int(item.cantidad)
+
+        if pedidos:
+            productos = self._productos(items)
+            fragmentados = {pid: pedidos[pid] for pid in self._fragmentados(productos, pedidos)}
+            normales = {pid: c for pid, c in pedidos.items() if pid not in fragmentados}
+
+            sid = transaction.savepoint()
+            ok = True
+            if normales:
+                condicion = Q()
+                casos = []
+                for pid, cantidad in normales.items():
+                    condicion |= Q(pk=pid, stock__gte=F("reservado") + cantidad)
+                    casos.append(When(pk=pid, then=F("stock") - cantidad))
+                updated = (
+                    Producto.objects
+                    .alias(reservado=_reservado_subquery(sesion))
+                    .filter(condicion)
+                    .update(
+                        stock=Case(*casos, default=F("stock"), output_field=models.PositiveIntegerField()),
+                        actualizado=AHORA,
+                    )
+                )
+                ok = updated == len(normales)
+            if ok and fragmentados:
+                disponibles = dict(
+                    Producto.objects.con_disponible(excluir_sesion=sesion)
+                    .filter(pk__in=fragmentados).values_list("pk", "disponible")
+                )
+                ok = all(disponibles.get(pid, 0) >= c for pid, c in fragmentados.items())
+                ok = ok and not StockFragmento.descontar(fragmentados)
+            if not ok:
+                # Alguno no alcanzó: revertimos el UPDATE parcial antes de leer el stock real
+                transaction.savepoint_rollback(sid)
+                faltantes = [
+                    f"«{nombre}»: pedido {pedidos[pid]}, disponible {max(disponible, 0)}"
+                    for pid, nombre, disponible in (
+                        Producto.objects.con_disponible(excluir_sesion=sesion)
+                        .filter(pk__in=pedidos)
+                        .values_list("pk", "nombre", "disponible")
+                    )
+                    if disponible < pedidos[pid]
+                ]
+                raise ValidationError("No hay stock suficiente para: " + "; ".join(faltantes))
+            transaction.savepoint_commit(sid)
+            catalogo.invalidar()
 
-        if faltantes:
-            raise ValidationError("No hay stock suficiente para: " + "; ".join(faltantes))
+            # Libro de movimientos: un INSERT para todos los productos de la orden
+            MovimientoStock.registrar(
+                {pid: -cantidad for pid, cantidad in pedidos.items()}, "venta", orden=self,
+                umbrales={pid: p.umbral_stock for pid, p in productos.items()} if productos else None,
+            )
 
-        self.total = self.calcular_total()
+            if sesion:
+                # Las reservas de esta sesión ya se convirtieron en descuento
+                Reserva.objects.filter(sesion=sesion, producto_id__in=pedidos).delete()
+
+        self.total = sum((item.subtotal() for item in items), Decimal("0.00"))
         self.estado = "confirmada"
         self.save(update_fields=["total", "estado"])
 
+        # Agregados de ventas (misma transacción: si algo falla, no quedan a medias)
+        from . import reportes
+        reportes.registrar(self, items)
+
+    def cancelar(self):
+        """Cancela esta orden y repone su stock (si estaba confirmada)."""
+        if self.estado not in self.CANCELABLES:
+            raise ValidationError(f"La orden #{self.pk} no se puede cancelar: está {self.get_estado_display().lower()}.")
+        if not Orden.objects.filter(pk=self.pk).cancelar():
+            # Otro request la canceló entre la lectura y el bloqueo
+            raise ValidationError(f"La orden #{self.pk} ya no se puede cancelar.")
+        self.estado = "cancelada"
+
+    @staticmethod
+    def _productos(items):
+        """{producto_id: Producto} si los items ya traen el producto cargado; si no, None."""
+        if all(OrdenItem.producto.is_cached(item) for item in items):
+            return {item.producto_id: item.producto for item in items}
+        return None
+
+    @staticmethod
+    def _fragmentados(productos, pedidos):
+        """Ids de los productos pedidos que están en modo alta demanda."""
+        if productos is not None:
+            return {pid for pid, p in productos.items() if p.stock_fragmentado}
+        return set(
+            Producto.objects.filter(pk__in=pedidos, stock_fragmentado=True).values_list("pk", flat=True)
+        )
+
 
 class OrdenItem(models.Model):
     orden = models.ForeignKey(Orden, related_name="items", on_delete=models.CASCADE)
@@ -139,3 +668,305 @@ class OrdenItem(models.Model):
         if self._state.adding and (self.precio is None or self.precio == 0):
             self.precio = self.producto.precio
         super().save(*args, **kwargs)
+
+
+class MovimientoStockQuerySet(models.QuerySet):
+    def con_saldo(self):
+        """
+        Anota 'saldo': el stock del producto después de cada movimiento (suma
+        acumulada). Sobre un producto responde "¿cuándo se agotó?":
+        MovimientoStock.objects.filter(producto=p).con_saldo() y el primer saldo 0.
+        """
+        return self.annotate(
+            saldo=models.Window(Sum("cantidad"), partition_by=[F("producto")], order_by=[F("creado"), F("id")])
+        ).order_by("producto", "creado", "id")
+
+
+class MovimientoStock(models.Model):
+    """
+    Libro de movimientos de stock (solo se agrega): cada descuento o
+    reposición deja una fila con el delta, en la misma transacción que el
+    UPDATE. La suma por producto tiene que dar su stock total (fila +
+    fragmentos); el comando conciliar_stock lo verifica.
+    """
+    MOTIVOS = (
+        ("inicial", "Stock inicial"),
+        ("venta", "Venta"),
+        ("cancelacion", "Cancelación"),
+        ("reposicion", "Reposición"),
+        ("importacion", "Importación"),
+        ("ajuste", "Ajuste"),
+    )
+    producto = models.ForeignKey(Producto, related_name="movimientos", on_delete=models.CASCADE)
+    cantidad = models.IntegerField()  # + entra, - sale
+    motivo = models.CharField(max_length=12, choices=MOTIVOS)
+    orden = models.ForeignKey(
+        Orden, related_name="movimientos_stock", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    creado = models.DateTimeField(auto_now_add=True)
+
+    objects = MovimientoStockQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["-creado", "-id"]
+        verbose_name = "movimiento de stock"
+        verbose_name_plural = "movimientos de stock"
+        indexes = [
+            models.Index(fields=["producto", "creado"], name="movimiento_producto_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.cantidad:+d} ({self.motivo})"
+
+    @classmethod
+    def registrar(cls, cambios: dict, motivo: str, orden=None, umbrales=None) -> None:
+        """
+        Anota {producto_id: delta} con un solo INSERT y revisa las alertas de
+        stock bajo de lo que cambió. 'umbrales' ({producto_id: umbral_stock})
+        evita leerlos si el llamador ya tiene los productos cargados.
+        """
+        cambios = {pid: delta for pid, delta in cambios.items() if delta}
+        if not cambios:
+            return
+        cls.objects.bulk_create([
+            cls(producto_id=pid, cantidad=delta, motivo=motivo, orden=orden)
+            for pid, delta in cambios.items()
+        ])
+        bajas = {
+            pid: delta for pid, delta in cambios.items()
+            if delta < 0 and (umbrales is None or umbrales.get(pid))
+        }
+        AlertaStock.revisar(bajas, [pid for pid, delta in cambios.items() if delta > 0])
+
+
+class AlertaStock(models.Model):
+    """
+    El stock de un producto cruzó su umbral_stock hacia abajo. Se calcula
+    solo sobre los productos que acaban de moverse (sin recorrer el catálogo)
+    y se cierra sola cuando una reposición lo vuelve a dejar arriba.
+    """
+    producto = models.ForeignKey(Producto, related_name="alertas", on_delete=models.CASCADE)
+    stock = models.IntegerField()
+    umbral = models.PositiveIntegerField()
+    creado = models.DateTimeField(auto_now_add=True)
+    resuelta = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-creado"]
+        verbose_name = "alerta de stock"
+        verbose_name_plural = "alertas de stock"
+        indexes = [
+            models.Index(fields=["producto", "resuelta"], name="alerta_producto_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.stock} < {self.umbral}"
+
+    @classmethod
+    def revisar(cls, bajas: dict, subas=()) -> None:
+        """
+        bajas: {producto_id: delta negativo}. Hay alerta si el stock quedó
+        debajo del umbral y antes del movimiento (stock - delta) no lo estaba.
+        subas: productos repuestos; se resuelven sus alertas si ya superan el umbral.
+        """
+        if bajas:
+            filas = (
+                Producto.objects.con_stock_total()
+                .filter(pk__in=bajas, umbral_stock__gt=0, stock_total__lt=F("umbral_stock"))
+                .values_list("pk", "stock_total", "umbral_stock")
+            )
+            nuevas = [
+                cls(producto_id=pid, stock=stock, umbral=umbral)
+                for pid, stock, umbral in filas
+                if stock - bajas[pid] >= umbral
+            ]
+            if nuevas:
+                cls.objects.bulk_create(nuevas)
+                for alerta in nuevas:
+                    logger.warning(
+                        "Stock bajo: producto %s quedó en %s (umbral %s)",
+                        alerta.producto_id, alerta.stock, alerta.umbral,
+                    )
+        if subas:
+            repuestos = Producto.objects.con_stock_total().filter(pk__in=subas, stock_total__gte=F("umbral_stock"))
+            cls.objects.filter(producto__in=repuestos, resuelta__isnull=True).update(resuelta=timezone.now())
+
+
+class ReservaQuerySet(models.QuerySet):
+    def activas(self):
+        return self.filter(expira__gt=timezone.now())
+
+    def vencidas(self):
+        return self.filter(expira__lte=timezone.now())
+
+
+class Reserva(models.Model):
+    """
+    Stock apartado temporalmente por un carrito (Cart.clave_reserva: con el
+    carrito en la sesión es una clave guardada en ella, que sobrevive al login).
+    No toca Producto.stock: el disponible se calcula como stock - reservas vigentes.
+    """
+    sesion = models.CharField(max_length=64)
+    producto = models.ForeignKey(Producto, related_name="reservas", on_delete=models.CASCADE)
+    cantidad = models.PositiveIntegerField()
+    expira = models.DateTimeField()
+
+    objects = ReservaQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sesion", "producto"], name="reserva_unica_por_sesion"),
+        ]
+        indexes = [
+            models.Index(fields=["producto", "expira"]),
+            models.Index(fields=["expira"]),
+        ]
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto_id} ({self.sesion})"
+
+    @staticmethod
+    def vencimiento():
+        minutos = getattr(settings, "RESERVA_MINUTOS", 15)
+        return timezone.now() + timedelta(minutes=minutos)
+
+    @classmethod
+    def reservar(cls, sesion: str, producto_id: int, cantidad: int) -> None:
+        """Crea/actualiza la reserva de la sesión y renueva su vencimiento."""
+        cantidad = int(cantidad)
+        if cantidad <= 0:
+            cls.objects.filter(sesion=sesion, producto_id=producto_id).delete()
+            return
+        cls.objects.update_or_create(
+            sesion=sesion,
+            producto_id=producto_id,
+            defaults={"cantidad": cantidad, "expira": cls.vencimiento()},
+        )
+
+    @classmethod
+    def reservar_lote(cls, sesion: str, cantidades: dict) -> None:
+        """
+        reservar() para varios productos: {producto_id: cantidad}. Un DELETE
+        para las que quedan en 0 y un único upsert (INSERT ... ON CONFLICT).
+        """
+        borrar = [pid for pid, cantidad in cantidades.items() if cantidad <= 0]
+        if borrar:
+            cls.objects.filter(sesion=sesion, producto_id__in=borrar).delete()
+        expira = cls.vencimiento()
+        reservas = [
+            cls(sesion=sesion, producto_id=pid, cantidad=cantidad, expira=expira)
+            for pid, cantidad in cantidades.items() if cantidad > 0
+        ]
+        if reservas:
+            cls.objects.bulk_create(
+                reservas,
+                update_conflicts=True,
+                unique_fields=["sesion", "producto"],
+                update_fields=["cantidad", "expira"],
+            )
+
+    @classmethod
+    def liberar(cls, sesion: str, producto_id=None) -> None:
+        qs = cls.objects.filter(sesion=sesion)
+        if producto_id is not None:
+            qs = qs.filter(producto_id=producto_id)
+        qs.delete()
+
+    # --- Versiones async (vistas ASGI, ver carrito/views_async.py) ---
+
+    @classmethod
+    async def areservar(cls, sesion: str, producto_id: int, cantidad: int) -> None:
+        cantidad = int(cantidad)
+        if cantidad <= 0:
+            await cls.objects.filter(sesion=sesion, producto_id=producto_id).adelete()
+            return
+        await cls.objects.aupdate_or_create(
+            sesion=sesion,
+            producto_id=producto_id,
+            defaults={"cantidad": cantidad, "expira": cls.vencimiento()},
+        )
+
+    @classmethod
+    async def aliberar(cls, sesion: str, producto_id=None) -> None:
+        qs = cls.objects.filter(sesion=sesion)
+        if producto_id is not None:
+            qs = qs.filter(producto_id=producto_id)
+        await qs.adelete()
+
+
+class VentaDiaria(models.Model):
+    """
+    Ventas agregadas por día (fecha local de la orden), medio de pago y estado.
+    La mantiene Orden.confirmar de forma incremental (ver carrito/reportes.py);
+    se reconstruye con: python manage.py reconstruir_ventas
+    """
+    fecha = models.DateField()
+    metodo_pago = models.CharField(max_length=30)
+    estado = models.CharField(max_length=12)
+    ordenes = models.IntegerField(default=0)
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+
+    class Meta:
+        ordering = ["-fecha", "metodo_pago", "estado"]
+        verbose_name = "venta diaria"
+        verbose_name_plural = "ventas diarias"
+        constraints = [
+            models.UniqueConstraint(fields=["fecha", "metodo_pago", "estado"], name="venta_diaria_unica"),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.metodo_pago} ({self.estado}): ${self.ingresos}"
+
+
+class VentaProductoDiaria(models.Model):
+    """Como VentaDiaria, abierta por producto ('ordenes' = órdenes que lo incluyen)."""
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, related_name="ventas_diarias", on_delete=models.PROTECT)
+    metodo_pago = models.CharField(max_length=30)
+    estado = models.CharField(max_length=12)
+    ordenes = models.IntegerField(default=0)
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+
+    class Meta:
+        ordering = ["-fecha", "producto"]
+        verbose_name = "venta diaria por producto"
+        verbose_name_plural = "ventas diarias por producto"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fecha", "producto", "metodo_pago", "estado"], name="venta_producto_diaria_unica"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["producto", "fecha"], name="venta_producto_fecha_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.producto_id} ({self.estado}): {self.unidades} u."
+
+
+class CompraConjunta(models.Model):
+    """
+    Índice "comprados juntos": 'puntaje' = órdenes confirmadas que tienen a
+    los dos productos. Una fila por sentido (a->b y b->a). Lo mantiene
+    carrito/recomendaciones.py; se reconstruye con:
+    python manage.py indexar_compras_conjuntas --reconstruir
+    """
+    producto = models.ForeignKey(Producto, related_name="compras_conjuntas", on_delete=models.CASCADE)
+    relacionado = models.ForeignKey(Producto, related_name="comprado_con", on_delete=models.CASCADE)
+    puntaje = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "compra conjunta"
+        verbose_name_plural = "compras conjuntas"
+        constraints = [
+            models.UniqueConstraint(fields=["producto", "relacionado"], name="compra_conjunta_unica"),
+        ]
+        indexes = [
+            # Top-k de un producto: se lee en orden del índice
+            models.Index(fields=["producto", "-puntaje"], name="compra_conjunta_top_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} + {self.relacionado_id}: {self.puntaje}"
@@ -0,0 +1,125 @@
+"""
+Paginación por cursor (keyset) para el catálogo.
+
+En vez de OFFSET + COUNT(*), cada página pide "los siguientes N después de
+(nombre, id)", que se resuelve con el índice compuesto producto_nombre_id_idx.
+La página 500 cuesta lo mismo que la 1.
+
+PaginadorEstimado (admin de tablas grandes) evita el COUNT(*) exacto.
+"""
+import base64
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+def codificar_cursor(producto) -> str:
+    crudo = json.dumps([producto.nombre, producto.pk], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def decodificar_cursor(token: str):
+    try:
+        relleno = "=" * (-len(token) % 4)
+        nombre, pk = json.loads(base64.urlsafe_b64decode(token + relleno))
+        return str(nombre), int(pk)
+    except (ValueError, TypeError):
+        raise Http404("Cursor de paginación inválido.")
+
+
+class PaginaCursor:
+    def __init__(self, object_list, siguiente=None, anterior=None):
+        self.object_list = object_list
+        self.siguiente = siguiente    # token para ?after=
+        self.anterior = anterior      # token para ?before=
+
+    @property
+    def has_next(self):
+        return self.siguiente is not None
+
+    @property
+    def has_previous(self):
+        return self.anterior is not None
+
+
+def paginar_por_cursor(queryset, after=None, before=None, por_pagina=12) -> PaginaCursor:
+    """
+    Devuelve una PaginaCursor ordenada por (nombre, id).
+    - after: token del último item de la página anterior (avanzar).
+    - before: token del primer item de la página siguiente (retroceder).
+    """
+    queryset = queryset.order_by("nombre", "pk")
+
+    if before:
+        nombre, pk = decodificar_cursor(before)
+        filas = list(
+            queryset.filter(Q(nombre__lt=nombre) | Q(nombre=nombre, pk__lt=pk))
+            .order_by("-nombre", "-pk")[:por_pagina + 1]
+        )
+        hay_anterior = len(filas) > por_pagina
+        filas = filas[:por_pagina][::-1]
+        hay_siguiente = True
+    else:
+        if after:
+            nombre, pk = decodificar_cursor(after)
+            queryset = queryset.filter(Q(nombre__gt=nombre) | Q(nombre=nombre, pk__gt=pk))
+        filas = list(queryset[:por_pagina + 1])
+        hay_siguiente = len(filas) > por_pagina
+        filas = filas[:por_pagina]
+        hay_anterior = bool(after)
+
+    if not filas:
+        return PaginaCursor([])
+
+    return PaginaCursor(
+        filas,
+        siguiente=codificar_cursor(filas[-1]) if hay_siguiente else None,
+        anterior=codificar_cursor(filas[0]) if hay_anterior else None,
+    )
+
+
+def estimar_filas(queryset):
+    """
+    Cantidad aproximada de filas sin recorrer la tabla, o None si el motor
+    no sabe estimarla.
+    - Postgres: pg_class.reltuples sin filtros; con filtros, las filas que
+      estima el planner (EXPLAIN).
+    - SQLite: MAX(id) sin filtros (cota superior: no descuenta los borrados).
+    """
+    vendor = connections[queryset.db].vendor
+    filtrado = bool(queryset.query.where)
+    if vendor == "postgresql":
+        if filtrado:
+            plan = json.loads(queryset.order_by().explain(format="json"))
+            return int(plan[0]["Plan"]["Plan Rows"])
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            fila = cursor.fetchone()
+        return fila[0] if fila and fila[0] >= 0 else None  # -1: nunca se hizo ANALYZE
+    if vendor == "sqlite" and not filtrado:
+        return queryset.model._default_manager.using(queryset.db).aggregate(m=Max("pk"))["m"] or 0
+    return None
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginator para el admin de tablas grandes: si la estimación pasa de
+    EXACTO_HASTA filas se usa tal cual en lugar de un COUNT(*) que recorre
+    toda la tabla (o todo el filtro). Por debajo se cuenta de verdad.
+    Va con show_full_result_count = False, que evita el segundo COUNT.
+    """
+    EXACTO_HASTA = 10_000
+
+    @cached_property
+    def count(self):
+        estimado = estimar_filas(self.object_list)
+        if estimado is None or estimado < self.EXACTO_HASTA:
+            return super().count
+        return estimado
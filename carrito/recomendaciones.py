@@ -0,0 +1,95 @@
+"""
+"Comprados juntos" para el detalle de producto, sobre un índice
+precalculado (CompraConjunta) en vez de cruzar OrdenItem en cada request.
+
+- actualizar(): incremental, lo corre el comando indexar_compras_conjuntas
+  (cron). Toma solo las órdenes que el índice todavía no refleja (confirmadas
+  nuevas y canceladas que ya se habían sumado, ver Orden.en_compras_conjuntas)
+  y suma o resta 1 a cada par de productos de cada una.
+- reconstruir(): vacía el índice y lo rehace desde todo el historial,
+  recorriendo las órdenes por tandas.
+- relacionados(): los k productos con stock más comprados junto con uno,
+  en una query por el índice (producto, -puntaje). El detalle pone en su
+  ETag lo que devuelve (no hace falta una versión del índice).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import CompraConjunta, Orden, OrdenItem, Producto
+from .reportes import sumar
+
+LOTE = 1000
+# Órdenes con más productos (mayoristas) no dicen nada de afinidad y explotan en pares
+MAX_PRODUCTOS = 30
+
+
+def _pares(productos):
+    if len(productos) > MAX_PRODUCTOS:
+        return []
+    return [(a, b) for a in productos for b in productos if a != b]
+
+
+@transaction.atomic
+def _procesar_tanda(lote) -> int:
+    """Suma/resta al índice hasta 'lote' órdenes pendientes y las marca. Devuelve cuántas tomó."""
+    ordenes = list(
+        Orden.objects.pendientes_compras_conjuntas()
+        .select_for_update().order_by("id").values_list("id", "estado")[:lote]
+    )
+    if not ordenes:
+        return 0
+
+    productos = defaultdict(set)
+    for orden_id, producto_id in OrdenItem.objects.filter(
+        orden_id__in=[oid for oid, _ in ordenes]
+    ).values_list("orden_id", "producto_id"):
+        productos[orden_id].add(producto_id)
+
+    puntajes = defaultdict(int)
+    for orden_id, estado in ordenes:
+        signo = 1 if estado == "confirmada" else -1
+        for par in _pares(productos[orden_id]):
+            puntajes[par] += signo
+    filas = [
+        {"producto": a, "relacionado": b, "puntaje": delta}
+        for (a, b), delta in puntajes.items() if delta
+    ]
+    for i in range(0, len(filas), LOTE):
+        sumar(CompraConjunta, ["producto", "relacionado"], filas[i:i + LOTE])
+    restados = {a for (a, _), delta in puntajes.items() if delta < 0}
+    if restados:
+        CompraConjunta.objects.filter(producto__in=restados, puntaje__lte=0).delete()
+
+    # Por id: si la orden se canceló mientras tanto, la próxima corrida la resta
+    Orden.objects.filter(id__in=[oid for oid, e in ordenes if e == "confirmada"]).update(en_compras_conjuntas=True)
+    Orden.objects.filter(id__in=[oid for oid, e in ordenes if e != "confirmada"]).update(en_compras_conjuntas=False)
+    return len(ordenes)
+
+
+def actualizar(lote=LOTE) -> int:
+    """Procesa todas las órdenes pendientes, una transacción por tanda. Devuelve cuántas."""
+    total = 0
+    while procesadas := _procesar_tanda(lote):
+        total += procesadas
+    return total
+
+
+def reconstruir(lote=LOTE) -> int:
+    """
+    Rehace el índice desde cero. Mientras corre, el detalle muestra lo que
+    ya se sumó; si se corta, actualizar() sigue desde donde quedó.
+    """
+    with transaction.atomic():
+        CompraConjunta.objects.all().delete()
+        Orden.objects.filter(en_compras_conjuntas=True).update(en_compras_conjuntas=False)
+    return actualizar(lote)
+
+
+def relacionados(producto, k=4):
+    """Los k más comprados junto con 'producto' que tienen stock (queryset, una query)."""
+    return (
+        Producto.objects.en_stock()
+        .filter(comprado_con__producto=producto, comprado_con__puntaje__gt=0)
+        .order_by("-comprado_con__puntaje", "nombre")[:k]
+    )
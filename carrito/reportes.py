@@ -0,0 +1,225 @@
+"""
+Reportes de ventas sobre tablas pre-agregadas (VentaDiaria y
+VentaProductoDiaria): unidades, ingresos y órdenes por día, medio de pago y
+estado, en total y por producto.
+
+- registrar(): lo llama Orden.confirmar; suma la orden a los agregados con un
+  INSERT ... ON CONFLICT DO UPDATE por tabla (incremento atómico, sin leer).
+  registrar_lote() hace lo mismo para muchas órdenes (cancelación masiva).
+- reconstruir(): recalcula un rango de fechas (o todo) desde Orden/OrdenItem.
+- resumen(): lo que consume el reporte mensual, sin tocar Orden/OrdenItem.
+- filas_ordenes(): órdenes + items para la exportación CSV, en streaming.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, Exists, F, OuterRef, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import MovimientoStock, OrdenItem, VentaDiaria, VentaProductoDiaria
+
+# Estados que cuentan en los reportes (los borradores nunca se confirmaron)
+ESTADOS = ("confirmada", "cancelada")
+
+# Una orden cancelada solo se registró si antes se confirmó: un borrador
+# cancelado pasa directo a "cancelada" sin tocar los agregados. Lo que las
+# distingue es la venta en el libro de movimientos.
+_SE_CONFIRMO = Exists(MovimientoStock.objects.filter(orden=OuterRef("orden"), motivo="venta"))
+
+LOTE = 1000
+
+_SUBTOTAL = Sum(F("cantidad") * F("precio"), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def sumar(modelo, claves, filas):
+    """
+    Upsert incremental: cada fila es {campo: valor}; las columnas que no son
+    'claves' se suman a lo que ya hubiera. Una sola query para todas las filas.
+    Lo usan también otros índices incrementales (carrito/recomendaciones.py).
+    """
+    if not filas:
+        return
+    opts = modelo._meta
+    qn = connection.ops.quote_name
+    campos = [opts.get_field(nombre) for nombre in filas[0]]
+    columnas = ", ".join(qn(c.column) for c in campos)
+    valores = ", ".join(["(" + ", ".join(["%s"] * len(campos)) + ")"] * len(filas))
+    conflicto = ", ".join(qn(opts.get_field(c).column) for c in claves)
+    tabla = qn(opts.db_table)
+    sumas = ", ".join(
+        f"{qn(c.column)} = {tabla}.{qn(c.column)} + EXCLUDED.{qn(c.column)}"
+        for c in campos if c.name not in claves
+    )
+    params = [
+        campo.get_db_prep_save(fila[campo.name], connection)
+        for fila in filas
+        for campo in campos
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {tabla} ({columnas}) VALUES {valores} "
+            f"ON CONFLICT ({conflicto}) DO UPDATE SET {sumas}",
+            params,
+        )
+
+
+def registrar(orden, items, signo=1, estado=None):
+    """
+    Suma (signo=1) o resta (signo=-1) la orden en los agregados del estado
+    dado (por defecto, el de la orden). Para mover una orden de estado se
+    resta de uno y se suma en el otro.
+    """
+    registrar_lote([(orden, items)], signo, estado)
+
+
+def _acumular(destino, clave, ordenes, unidades, ingresos):
+    o, u, i = destino.get(clave, (0, 0, Decimal("0.00")))
+    destino[clave] = (o + ordenes, u + unidades, i + ingresos)
+
+
+def registrar_lote(ordenes, signo=1, estado=None):
+    """
+    registrar() para muchas órdenes a la vez: [(orden, items), ...]. Se suma
+    por clave en Python (un upsert no puede tocar dos veces la misma fila) y
+    se escribe con una query por tabla.
+    """
+    por_producto, por_dia = {}, {}
+    for orden, items in ordenes:
+        lineas = {}
+        for item in items:
+            unidades, ingresos = lineas.get(item.producto_id, (0, Decimal("0.00")))
+            lineas[item.producto_id] = (unidades + int(item.cantidad), ingresos + item.subtotal())
+        if not lineas:
+            continue
+        dia = (timezone.localdate(orden.creado), orden.metodo_pago, estado or orden.estado)
+        for pid, (u, i) in lineas.items():
+            _acumular(por_producto, (*dia, pid), 1, u, i)
+        _acumular(
+            por_dia, dia, 1,
+            sum(u for u, _ in lineas.values()),
+            sum((i for _, i in lineas.values()), Decimal("0.00")),
+        )
+
+    sumar(VentaProductoDiaria, ["fecha", "producto", "metodo_pago", "estado"], [
+        {
+            "fecha": fecha, "metodo_pago": metodo, "estado": est, "producto": pid,
+            "ordenes": signo * o, "unidades": signo * u, "ingresos": signo * i,
+        }
+        for (fecha, metodo, est, pid), (o, u, i) in por_producto.items()
+    ])
+    sumar(VentaDiaria, ["fecha", "metodo_pago", "estado"], [
+        {
+            "fecha": fecha, "metodo_pago": metodo, "estado": est,
+            "ordenes": signo * o, "unidades": signo * u, "ingresos": signo * i,
+        }
+        for (fecha, metodo, est), (o, u, i) in por_dia.items()
+    ])
+
+
+def _rango(qs, campo, desde=None, hasta=None):
+    if desde:
+        qs = qs.filter(**{f"{campo}__gte": desde})
+    if hasta:
+        qs = qs.filter(**{f"{campo}__lte": hasta})
+    return qs
+
+
+@transaction.atomic
+def reconstruir(desde: date = None, hasta: date = None) -> int:
+    """
+    Recalcula los agregados del rango [desde, hasta] (fechas locales; sin
+    límites = todo el historial). Devuelve la cantidad de filas por producto.
+
+    Cuenta lo mismo que fue sumando registrar(): las confirmadas y las
+    canceladas que llegaron a confirmarse (los borradores cancelados no).
+    Las canceladas anteriores al libro de movimientos no tienen cómo
+    distinguirse de un borrador y quedan afuera.
+    """
+    _rango(VentaProductoDiaria.objects.all(), "fecha", desde, hasta).delete()
+    _rango(VentaDiaria.objects.all(), "fecha", desde, hasta).delete()
+
+    items = _rango(
+        OrdenItem.objects.filter(orden__estado__in=ESTADOS)
+        .exclude(Q(orden__estado="cancelada") & ~_SE_CONFIRMO)
+        .annotate(fecha=TruncDate("orden__creado")),
+        "fecha", desde, hasta,
+    ).order_by()
+    dimensiones = ("fecha", "orden__metodo_pago", "orden__estado")
+    metricas = {
+        "ordenes": Count("orden", distinct=True),
+        "unidades": Sum("cantidad"),
+        "ingresos": _SUBTOTAL,
+    }
+
+    total = 0
+    lote = []
+    for fila in items.values(*dimensiones, "producto_id").annotate(**metricas).iterator(chunk_size=LOTE):
+        lote.append(VentaProductoDiaria(
+            fecha=fila["fecha"], producto_id=fila["producto_id"],
+            metodo_pago=fila["orden__metodo_pago"], estado=fila["orden__estado"],
+            ordenes=fila["ordenes"], unidades=fila["unidades"], ingresos=fila["ingresos"],
+        ))
+        if len(lote) >= LOTE:
+            total += len(VentaProductoDiaria.objects.bulk_create(lote))
+            lote = []
+    total += len(VentaProductoDiaria.objects.bulk_create(lote))
+
+    VentaDiaria.objects.bulk_create(
+        [
+            VentaDiaria(
+                fecha=fila["fecha"], metodo_pago=fila["orden__metodo_pago"], estado=fila["orden__estado"],
+                ordenes=fila["ordenes"], unidades=fila["unidades"], ingresos=fila["ingresos"],
+            )
+            for fila in items.values(*dimensiones).annotate(**metricas).iterator(chunk_size=LOTE)
+        ],
+        batch_size=LOTE,
+    )
+    return total
+
+
+def resumen(desde: date, hasta: date, top=10) -> dict:
+    """Totales del período por medio de pago/estado, por día y productos más vendidos."""
+    dias = _rango(VentaDiaria.objects.all(), "fecha", desde, hasta).order_by()
+    productos = _rango(VentaProductoDiaria.objects.filter(estado="confirmada"), "fecha", desde, hasta).order_by()
+    metricas = {"ordenes": Sum("ordenes"), "unidades": Sum("unidades"), "ingresos": Sum("ingresos")}
+    return {
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "por_metodo_y_estado": list(
+            dias.values("metodo_pago", "estado").annotate(**metricas).order_by("metodo_pago", "estado")
+        ),
+        "por_dia": list(
+            dias.filter(estado="confirmada").values("fecha").annotate(**metricas).order_by("fecha")
+        ),
+        "productos_mas_vendidos": list(
+            productos.values("producto_id", "producto__nombre")
+            .annotate(**metricas).order_by("-unidades", "producto_id")[:top]
+        ),
+    }
+
+
+CABECERA_ORDENES = (
+    "orden", "creado", "estado", "metodo_pago", "nombre", "apellido", "dni",
+    "total_orden", "producto", "slug", "cantidad", "precio", "subtotal",
+)
+
+
+def filas_ordenes(desde: date = None, hasta: date = None, estado=None, using=None):
+    """
+    Una fila por item (con los datos de su orden), leída con iterator():
+    nunca se arma el queryset entero en memoria. 'using' elige la BD (la
+    exportación la lee de una réplica, ver carrito.routers.db_lectura).
+    """
+    qs = _rango(OrdenItem.objects.using(using), "orden__creado__date", desde, hasta)
+    if estado:
+        qs = qs.filter(orden__estado=estado)
+    filas = qs.order_by("orden_id", "id").values_list(
+        "orden_id", "orden__creado", "orden__estado", "orden__metodo_pago",
+        "orden__nombre", "orden__apellido", "orden__dni", "orden__total",
+        "producto__nombre", "producto__slug", "cantidad", "precio",
+    )
+    for fila in filas.iterator(chunk_size=2000):
+        creado = timezone.localtime(fila[1]).isoformat(timespec="seconds")
+        yield (*fila[:1], creado, *fila[2:], fila[10] * fila[11])
@@ -0,0 +1,112 @@
+"""
+Ruteo de lecturas a réplicas (settings.DATABASE_REPLICAS, armadas desde
+DATABASE_REPLICA_URLS).
+
+- Catálogo y reportes (LECTURAS_EN_REPLICA) se leen de una réplica al azar.
+- Todo lo demás, todas las escrituras y cualquier lectura dentro de una
+  transacción (checkout, Orden.confirmar, select_for_update) van a default.
+- Solo se usan réplicas dentro de un request que no esté "pegado" a la
+  primaria (ReplicaMiddleware): el checkout (usar_primaria) y los
+  POST/PUT/PATCH/DELETE leen de default, y después de escribir el navegador
+  lee de default REPLICAS_PEGADO_SEGUNDOS (cookie): así ve su propia orden y
+  el stock que descontó aunque la réplica venga atrasada.
+- Comandos y shell (fuera de un request) leen siempre de default.
+- Lo que queda guardado bajo la versión actual del catálogo (fragmentos del
+  cache en un miss, el resumen del carrito al revalidarse) se lee dentro de
+  primaria(): una réplica atrasada lo dejaría viejo hasta la próxima versión.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARIA = DEFAULT_DB_ALIAS
+COOKIE = "usar_primaria"
+
+LECTURAS_EN_REPLICA = {
+    "carrito.producto",
+    "carrito.stockfragmento",
+    "carrito.ventadiaria",
+    "carrito.ventaproductodiaria",
+}
+
+SEGURO = ("GET", "HEAD", "OPTIONS")
+
+
+class _Estado:
+    """Estado del request actual (mutable: lo comparten los threads de sync_to_async)."""
+
+    def __init__(self, primaria):
+        self.primaria = primaria
+        self.escribio = False
+
+
+_estado = ContextVar("carrito_replicas", default=None)
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def db_lectura():
+    """Alias para una lectura de catálogo/reportes en este momento."""
+    estado = _estado.get()
+    if (
+        estado is None or estado.primaria or not replicas()
+        or connections[PRIMARIA].in_atomic_block
+    ):
+        return PRIMARIA
+    return random.choice(replicas())
+
+
+def iniciar(request):
+    """Lo llama el middleware al entrar; devuelve el token para terminar()."""
+    primaria = request.method not in SEGURO or COOKIE in request.COOKIES
+    return _estado.set(_Estado(primaria))
+
+
+def terminar(token):
+    estado = _estado.get()
+    _estado.reset(token)
+    return estado
+
+
+def pegar_a_primaria():
+    """El resto del request lee de default."""
+    estado = _estado.get()
+    if estado is not None:
+        estado.primaria = True
+
+
+@contextmanager
+def primaria():
+    """Dentro del bloque, catálogo y reportes se leen de default."""
+    estado = _estado.get()
+    if estado is None or estado.primaria:
+        yield
+        return
+    estado.primaria = True
+    try:
+        yield
+    finally:
+        estado.primaria = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in LECTURAS_EN_REPLICA:
+            return db_lectura()
+        return PRIMARIA
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        # Guardar la sesión (mensajes leídos, etc.) no cambia lo que muestra la réplica
+        if estado is not None and model._meta.label_lower != "sessions.session":
+            estado.escribio = True
+        return PRIMARIA
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaria y réplicas tienen los mismos datos
+        return True
@@ -0,0 +1,51 @@
+import logging
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import busqueda, catalogo, imagenes
+from .models import AHORA, Producto
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_catalogo(sender, **kwargs):
+    # Cubre altas/bajas y las ediciones del admin (incluido list_editable)
+    catalogo.invalidar()
+
+
+@receiver(post_save, sender=Producto)
+def indexar_busqueda(sender, instance, **kwargs):
+    busqueda.indexar(instance)
+
+
+@receiver(post_delete, sender=Producto)
+def desindexar_busqueda(sender, instance, **kwargs):
+    busqueda.desindexar(instance.pk)
+
+
+@receiver(post_save, sender=Producto)
+def generar_derivados_imagen(sender, instance, raw=False, **kwargs):
+    if raw or not imagenes.necesita_derivados(instance):
+        return
+    # Después del commit: codificar tarda y save() corre con el lock de escritura
+    anterior = instance.imagen_derivados or {}
+    transaction.on_commit(partial(_generar_derivados, instance.pk, instance.imagen.name, anterior))
+
+
+def _generar_derivados(pk, nombre, anterior):
+    try:
+        manifiesto = imagenes.generar(nombre)
+    except (OSError, ValueError):
+        # Archivo faltante o ilegible: se sigue sirviendo el original
+        logger.exception("No se pudieron generar derivados para %s", nombre)
+        return
+    # update() para no volver a disparar post_save; si la imagen cambió mientras tanto, gana la nueva
+    if Producto.objects.filter(pk=pk, imagen=nombre).update(imagen_derivados=manifiesto, actualizado=AHORA):
+        catalogo.invalidar()
+        if anterior.get("origen") != nombre:
+            imagenes.borrar(anterior)
@@ -0,0 +1,31 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from carrito import imagenes
+
+register = template.Library()
+
+
+@register.simple_tag
+def imagen_responsive(producto, sizes="100vw", **attrs):
+    """
+    <picture> con srcset AVIF/WebP de los derivados y el original como fallback.
+    Uso: {% imagen_responsive p sizes="64px" class="rounded" style="..." loading="lazy" %}
+    """
+    attrs.setdefault("alt", producto.nombre)
+    img = format_html(
+        '<img src="{}"{}>',
+        producto.imagen.url,
+        format_html_join("", ' {}="{}"', attrs.items()),
+    )
+    if not imagenes.vigentes(producto):
+        # Todavía sin derivados (o desactualizados): solo el original
+        return img
+    manifiesto = producto.imagen_derivados
+
+    fuentes = format_html_join(
+        "",
+        '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((formato, imagenes.srcset(producto, formato), sizes) for formato in manifiesto.get("formatos", [])),
+    )
+    return format_html("<picture>{}{}</picture>", fuentes, img)
@@ -1,3 +1,1239 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.utils.connection import ConnectionDoesNotExist
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import busqueda, catalogo, imagenes, importacion, recomendaciones, reportes, routers
+from .cart import Cart, CartError, StockInsuficienteError
+from .cart_storage import SignedCookieCartStorage
+from .models import (
+    AlertaStock, CompraConjunta, MovimientoStock, Orden, OrdenItem, Producto, Reserva, StockFragmento, VentaDiaria,
+    VentaProductoDiaria,
+)
+from .templatetags.imagenes import imagen_responsive
+from .views_async import ProductoListaAsyncView
+
+DATOS_CHECKOUT = {
+    "nombre": "Ana",
+    "apellido": "Pérez",
+    "dni": "30111222",
+    "direccion": "Calle 123",
+    "metodo_pago": "efectivo",
+}
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, QUERY_BUDGET_ESTRICTO=True)
+class PresupuestoQueriesTests(TestCase):
+    """
+    Recorre las vistas principales con QUERY_BUDGET_ESTRICTO: si alguna se pasa
+    de settings.QUERY_BUDGETS, QueryBudgetMiddleware levanta y el test falla.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = [
+            Producto.objects.create(nombre=f"Anillo {i}", slug=f"anillo-{i}", precio=100 + i, stock=10)
+            for i in range(15)
+        ]
+
+    def _llenar_carrito(self, n=3):
+        for p in self.productos[:n]:
+            self.client.post(reverse("carrito:carrito-agregar", args=[p.slug]), {"cantidad": 1})
+
+    def test_catalogo_y_detalle(self):
+        self.assertEqual(self.client.get(reverse("carrito:home")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("carrito:home"), {"page": 2}).status_code, 200)
+        self.assertEqual(self.client.get(reverse("carrito:buscar"), {"q": "anillo"}).status_code, 200)
+        r = self.client.get(self.productos[0].get_absolute_url())
+        self.assertEqual(r.status_code, 200)
+        self.assertIn("Server-Timing", r)
+
+    def test_carrito_con_varias_lineas(self):
+        self._llenar_carrito(5)
+        r = self.client.get(reverse("carrito:carrito-detalle"))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r["X-DB-Queries"], "2")  # sesión + productos (una sola vez)
+
+    def test_checkout(self):
+        self._llenar_carrito(5)
+        r = self.client.post(reverse("carrito:checkout"), DATOS_CHECKOUT)
+        self.assertEqual(r.status_code, 302)
+        self.productos[0].refresh_from_db()
+        self.assertEqual(self.productos[0].stock, 9)
+
+    @override_settings(QUERY_BUDGET_ESTRICTO=False, QUERY_BUDGETS={"carrito:checkout": 1})
+    def test_sin_estricto_excedido_solo_avisa(self):
+        self._llenar_carrito(1)
+        with self.assertLogs("carrito.middleware", "WARNING"):
+            r = self.client.post(reverse("carrito:checkout"), DATOS_CHECKOUT)
+        # La orden ya se confirmó: el cliente ve la redirección, no un 500
+        self.assertEqual((r.status_code, r["X-DB-Presupuesto"]), (302, "excedido"))
+        self.assertEqual(Orden.objects.get().estado, "confirmada")
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CatalogoCacheTests(TestCase):
+    def setUp(self):
+        self.producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=5)
+
+    def test_admin_y_ventas_invalidan_la_home(self):
+        self.assertContains(self.client.get(reverse("carrito:home")), "$100,00")
+        clave = catalogo.clave_pagina(1)
+
+        self.client.force_login(get_user_model().objects.create_superuser("admin", password="x"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("admin:carrito_producto_changelist"), {
+                "form-TOTAL_FORMS": 1, "form-INITIAL_FORMS": 1,
+                "form-0-id": self.producto.pk, "form-0-precio": "120", "form-0-stock": 5, "_save": "Guardar",
+            })
+        self.assertContains(self.client.get(reverse("carrito:home")), "$120,00")
+        self.assertNotEqual(catalogo.clave_pagina(1), clave)
+
+        clave = catalogo.clave_pagina(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.descontar_stock(1)
+        self.assertNotEqual(catalogo.clave_pagina(1), clave)
+
+    def test_check_deploy_avisa_si_el_cache_es_locmem(self):
+        from .checks import cache_compartido
+
+        self.assertEqual([w.id for w in cache_compartido(None)], ["carrito.W001"])
+        cache_archivos = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp"}}
+        with override_settings(CACHES=cache_archivos):
+            self.assertEqual(cache_compartido(None), [])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CATALOGO_PAGINACION="cursor")
+class CatalogoCursorTests(TestCase):
+    def test_paginas_con_nombres_de_mismo_prefijo(self):
+        # El token codifica [nombre, id]: todos los cursores empiezan igual
+        for i in range(30):
+            Producto.objects.create(nombre=f"Anillo de plata modelo {i:02}", slug=f"anillo-{i}", precio=100, stock=1)
+
+        vistos, params = [], {}
+        for _ in range(5):  # 3 páginas de 12; un cursor que repite página no corta nunca
+            html = self.client.get(reverse("carrito:home"), params).content.decode()
+            vistos += re.findall(r'<h5 class="card-title[^"]*">([^<]+)</h5>', html)
+            siguiente = re.search(r'href="\?after=([^"]+)"', html)
+            if not siguiente:
+                break
+            params = {"after": siguiente.group(1)}
+
+        self.assertEqual(vistos, [f"Anillo de plata modelo {i:02}" for i in range(30)])
+
+
+class SnapshotCarritoTests(TestCase):
+    """Una query a Producto por render del carrito; add/remove/clear la vuelven a pedir."""
+
+    def setUp(self):
+        self.anillo = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=5)
+        self.collar = Producto.objects.create(nombre="Collar", slug="collar", precio=250, stock=5)
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        self.cart = Cart(request)
+
+    def _lineas(self):
+        return [(i["producto"].slug, i["cantidad"]) for i in self.cart]
+
+    def test_una_query_hasta_la_proxima_mutacion(self):
+        self.cart.add(self.anillo.id, 1)
+        self.cart.add(self.collar.id, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self._lineas(), [("anillo", 1), ("collar", 2)])
+            self.assertEqual(self._lineas(), [("anillo", 1), ("collar", 2)])
+            self.assertEqual(self.cart.validar_stock_actual(), (True, []))
+            self.assertEqual(self.cart.total, Decimal("600.00"))
+
+        self.cart.remove(self.collar.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(self._lineas(), [("anillo", 1)])
+            self.assertEqual(self._lineas(), [("anillo", 1)])
+
+        self.cart.add(self.anillo.id, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self._lineas(), [("anillo", 3)])
+
+        self.cart.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._lineas(), [])
+
+
+class CartAsyncTests(TestCase):
+    """La API async del carrito (vistas ASGI) respeta stock y reservas igual que la sync."""
+
+    async def test_aadd_aiter_atotal(self):
+        producto = await Producto.objects.acreate(nombre="Aros", slug="aros", precio=150, stock=3)
+        request = AsyncRequestFactory().get("/")
+        request.session = SessionStore()
+
+        cart = await Cart.acrear(request)
+        await cart.aadd(producto.id, 2)
+        with self.assertRaises(StockInsuficienteError):
+            await cart.aadd(producto.id, 2)
+
+        lineas = [item async for item in cart]
+        self.assertEqual([(i["producto"].pk, i["cantidad"]) for i in lineas], [(producto.pk, 2)])
+        self.assertEqual(await cart.atotal(), Decimal("300.00"))
+        self.assertEqual(await Reserva.objects.filter(producto=producto).acount(), 1)
+
+        # Otra instancia del mismo request ve lo guardado en la sesión
+        otro = await Cart.acrear(request)
+        self.assertEqual(len(otro), 2)
+
+
+def _recargar_urls():
+    import joyeria.urls
+    from . import urls
+
+    importlib.reload(urls)
+    importlib.reload(joyeria.urls)
+    clear_url_caches()
+
+
+class VistasAsyncTests(TestCase):
+    """Las vistas de views_async.py por ASGI (AsyncClient), como con CARRITO_VISTAS_ASYNC=True."""
+
+    def setUp(self):
+        self.addCleanup(_recargar_urls)  # corre después de deshacer los settings
+        ajustes = override_settings(CARRITO_VISTAS_ASYNC=True, SECURE_SSL_REDIRECT=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        _recargar_urls()
+        self.producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=5)
+
+    async def test_catalogo_y_detalle(self):
+        self.assertIs(resolve(reverse("carrito:home")).func.view_class, ProductoListaAsyncView)
+        hits = catalogo.estadisticas()["hits"]
+        for _ in range(2):
+            r = await self.async_client.get(reverse("carrito:home"))
+            self.assertContains(r, "Anillo")
+        self.assertEqual(catalogo.estadisticas()["hits"], hits + 1)
+
+        url = self.producto.get_absolute_url()
+        await self.async_client.get(url)  # setea la cookie CSRF
+        r = await self.async_client.get(url)
+        self.assertContains(r, "<strong>5</strong>")
+        r = await self.async_client.get(url, headers={"if-none-match": r["ETag"]})
+        self.assertEqual(r.status_code, 304)
+
+    async def test_agregar_y_checkout_idempotente(self):
+        r = await self.async_client.post(reverse("carrito:carrito-agregar", args=["anillo"]), {"cantidad": 2})
+        self.assertRedirects(r, reverse("carrito:carrito-detalle"), fetch_redirect_response=False)
+        r = await self.async_client.get(reverse("carrito:carrito-detalle"))
+        self.assertEqual([(i["producto"].slug, i["cantidad"]) for i in r.context["cart"]], [("anillo", 2)])
+        self.assertEqual((await self.async_client.get(reverse("carrito:checkout"))).status_code, 200)
+
+        datos = {**DATOS_CHECKOUT, "clave_idempotencia": uuid.uuid4().hex}
+        primera = await self.async_client.post(reverse("carrito:checkout"), datos)
+        # El reenvío sale por el afirst() de la clave, antes de mirar el carrito (ya vacío)
+        segunda = await self.async_client.post(reverse("carrito:checkout"), datos)
+        orden = await Orden.objects.aget()
+        self.assertEqual(primera["Location"], reverse("carrito:success", args=[orden.pk]))
+        self.assertEqual(segunda["Location"], primera["Location"])
+        await self.producto.arefresh_from_db()
+        self.assertEqual(self.producto.stock, 3)
+
+
+class ResumenCarritoTests(TestCase):
+    """El resumen se mantiene en cada cambio y solo se revalida si cambió el catálogo."""
+
+    def setUp(self):
+        self.anillo = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=5)
+        self.collar = Producto.objects.create(nombre="Collar", slug="collar", precio=250, stock=5)
+        self.request = RequestFactory().get("/")
+        self.request.session = SessionStore()
+
+    def test_resumen_sin_consultar_producto(self):
+        cart = Cart(self.request)
+        cart.add(self.anillo.id, 2)
+        cart.add(self.collar.id, 1)
+        cart.decrement(self.anillo.id)
+
+        with self.assertNumQueries(0):
+            otro = Cart(self.request)
+            self.assertEqual(otro.resumen(), {
+                "unidades": 2, "lineas": 2, "total": Decimal("350.00"), "vigente": True,
+            })
+            self.assertEqual(otro.total, Decimal("350.00"))
+
+        otro.remove(self.collar.id)
+        self.assertEqual(Cart(self.request).resumen()["total"], Decimal("100.00"))
+
+    def test_increment_no_baja_y_decrement_quita_en_cero(self):
+        cart = Cart(self.request)
+        cart.add(self.anillo.id, 2)
+        with self.assertRaises(ValidationError):
+            cart.increment(self.anillo.id, -1)
+        with self.assertRaises(ValidationError):
+            cart.decrement(self.anillo.id, -1)
+        self.assertEqual(cart.resumen()["unidades"], 2)
+
+        cart.decrement(self.anillo.id, 5)
+        self.assertEqual(len(cart), 0)
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_revalida_si_cambio_el_catalogo(self):
+        Cart(self.request).add(self.anillo.id, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.filter(pk=self.anillo.pk).update(precio=120)
+            catalogo.invalidar()
+
+        cart = Cart(self.request)
+        self.assertFalse(cart.resumen()["vigente"])
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.total, Decimal("240.00"))
+        # El snapshot dejó el resumen al día en el storage
+        self.assertEqual(Cart(self.request).resumen()["vigente"], True)
+
+    def test_estampa_de_otro_contador_no_vale(self):
+        Cart(self.request).add(self.anillo.id, 1)
+        self.assertTrue(Cart(self.request).resumen()["vigente"])
+        # Otro worker con su propio locmem: su contador no coincide con la estampa
+        otro_worker = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "otro"}}
+        with override_settings(CACHES=otro_worker):
+            self.assertFalse(Cart(self.request).resumen()["vigente"])
+
+    @override_settings(SECURE_SSL_REDIRECT=False, CARRITO_STORAGE="carrito.cart_storage.SignedCookieCartStorage")
+    def test_badge_con_carrito_en_cookie(self):
+        self.client.post(reverse("carrito:carrito-agregar", args=[self.collar.slug]), {"cantidad": 2})
+        r = self.client.get(self.anillo.get_absolute_url())
+        self.assertContains(r, 'title="Total: $500,00"')
+        self.assertEqual(r.context["cart_resumen"]["unidades"], 2)
+
+
+COOKIE = "carrito.cart_storage.SignedCookieCartStorage"
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CartStorageTests(TestCase):
+    def setUp(self):
+        self.productos = [
+            Producto.objects.create(nombre=f"Anillo {i}", slug=f"anillo-{i}", precio=100 + i, stock=10)
+            for i in range(3)
+        ]
+
+    def _agregar(self, producto, cantidad=1):
+        return self.client.post(reverse("carrito:carrito-agregar", args=[producto.slug]), {"cantidad": cantidad})
+
+    def _lineas(self):
+        r = self.client.get(reverse("carrito:carrito-detalle"))
+        self.assertEqual(r.status_code, 200)
+        return [(i["producto"].slug, i["cantidad"]) for i in r.context["cart"]]
+
+    @override_settings(CARRITO_STORAGE=COOKIE)
+    def test_cookie_ida_y_vuelta(self):
+        self._agregar(self.productos[0], 2)
+        self._agregar(self.productos[1])
+        self.assertEqual(self._lineas(), [("anillo-0", 2), ("anillo-1", 1)])
+        self.assertFalse(self.client.session.get("cart"))
+
+    @override_settings(CARRITO_STORAGE="carrito.cart_storage.CacheCartStorage")
+    def test_cache_ida_y_vuelta(self):
+        self._agregar(self.productos[0], 2)
+        cid = self.client.cookies["carrito"].value.split(":")[0]
+        self.assertEqual(cache.get(f"carrito:{cid}"), {str(self.productos[0].pk): {"qty": 2}})
+        self.assertEqual(self._lineas(), [("anillo-0", 2)])
+
+    def test_cache_locmem_en_produccion_es_un_error(self):
+        from .checks import carrito_en_cache
+
+        self.assertEqual(carrito_en_cache(None), [])
+        with override_settings(CARRITO_STORAGE="carrito.cart_storage.CacheCartStorage"):
+            self.assertEqual([e.id for e in carrito_en_cache(None)], ["carrito.E001"])
+
+    def test_limite_de_la_cookie_con_cid_y_firma(self):
+        storage = SignedCookieCartStorage(RequestFactory().get("/"))
+        storage.clave()
+        lineas = {str(p.pk): {"qty": 1} for p in self.productos}
+        resumen = {"unidades": 3, "lineas": 3, "total": "303.00", "version": 7,
+                   "precios": {str(p.pk): str(p.precio) for p in self.productos}}
+        solo_lineas = storage.bytes_cookie(lineas, None)
+        self.assertGreater(solo_lineas, len(storage.empacar(lineas)) + 32)  # cid + firma
+
+        # Entran las líneas pero no el resumen: se guardan sin él
+        with override_settings(CARRITO_COOKIE_MAX_BYTES=solo_lineas):
+            storage.guardar(lineas, resumen)
+            self.assertIsNone(storage.cargar_resumen())
+            response = HttpResponse()
+            storage.persistir(response)
+            self.assertLessEqual(len(response.cookies["carrito"].OutputString(attrs=[])), solo_lineas)
+
+        with override_settings(CARRITO_COOKIE_MAX_BYTES=solo_lineas - 1):
+            with self.assertRaises(CartError):
+                storage.guardar(lineas, None)
+
+    @override_settings(CARRITO_STORAGE=COOKIE)
+    def test_revalidar_con_la_cookie_llena_no_falla(self):
+        self._agregar(self.productos[0])
+        storage = SignedCookieCartStorage(RequestFactory().get("/"))
+        storage.clave()
+        solo_lineas = storage.bytes_cookie({str(self.productos[0].pk): {"qty": 1}}, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.filter(pk=self.productos[0].pk).update(precio="99999999.99")
+            catalogo.invalidar()
+
+        # El GET revalida y reescribe el carrito: si no entra, se sigue mostrando igual
+        for maximo in (solo_lineas, solo_lineas - 1):
+            with override_settings(CARRITO_COOKIE_MAX_BYTES=maximo):
+                self.assertEqual(self._lineas(), [("anillo-0", 1)])
+
+
+class ReservasTests(TestCase):
+    def setUp(self):
+        self.producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=5)
+
+    def _cart(self):
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        return Cart(request)
+
+    def _disponible(self, cart=None):
+        clave = cart.clave_reserva(crear=False) if cart else None
+        return Producto.objects.con_disponible(excluir_sesion=clave).get().disponible
+
+    @override_settings(RESERVA_MINUTOS=5)
+    def test_otra_sesion_aparta_hasta_que_vence(self):
+        comprador, otro = self._cart(), self._cart()
+        comprador.add(self.producto.id, 3)
+        reserva = Reserva.objects.get()
+        self.assertAlmostEqual(
+            (reserva.expira - timezone.now()).total_seconds(), 5 * 60, delta=5
+        )
+        self.assertEqual((self._disponible(comprador), self._disponible(otro)), (5, 2))
+        with self.assertRaises(StockInsuficienteError):
+            otro.add(self.producto.id, 3)
+
+        Reserva.objects.update(expira=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self._disponible(otro), 5)
+        otro.add(self.producto.id, 3)
+
+    def test_ajustar_a_cero_libera_la_reserva(self):
+        cart = self._cart()
+        cart.add(self.producto.id, 2)
+        Producto.objects.filter(pk=self.producto.pk).update(stock=0)
+        self.assertEqual(cart.asegurar_maximo_disponible(), ["«Anillo» se quitó: sin stock disponible."])
+        self.assertEqual(len(cart), 0)
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_limpiar_reservas(self):
+        self._cart().add(self.producto.id, 1)
+        self._cart().add(self.producto.id, 1)
+        Reserva.objects.filter(pk=Reserva.objects.first().pk).update(expira=timezone.now())
+        call_command("limpiar_reservas", stdout=(salida := io.StringIO()))
+        self.assertIn("Reservas vencidas eliminadas: 1", salida.getvalue())
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_la_reserva_sobrevive_al_login(self):
+        self.client.post(reverse("carrito:carrito-agregar", args=[self.producto.slug]), {"cantidad": 5})
+        antes = self.client.session.session_key
+        self.client.force_login(get_user_model().objects.create_user("ana", password="x"))
+        self.assertNotEqual(self.client.session.session_key, antes)
+
+        # Su propia reserva no le cuenta en contra: puede comprar las 5
+        self.assertEqual(Reserva.objects.get().sesion, self.client.session["cart_clave"])
+        self.assertTrue(self.client.get(reverse("carrito:carrito-detalle")).context["cart_valido"])
+        self.client.post(reverse("carrito:checkout"), DATOS_CHECKOUT)
+        self.assertEqual(Orden.objects.get().estado, "confirmada")
+        self.assertFalse(Reserva.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, QUERY_BUDGET_ESTRICTO=True)
+class CarritoApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.anillo = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=5)
+        cls.collar = Producto.objects.create(nombre="Collar", slug="collar", precio=250, stock=2)
+
+    def _linea(self, metodo, producto, datos=None):
+        url = reverse("carrito:api-carrito-linea", args=[producto.id])
+        return getattr(self.client, metodo)(url, datos or {}, content_type="application/json")
+
+    def test_set_incremento_y_quitar(self):
+        r = self._linea("put", self.anillo, {"cantidad": 2})
+        self.assertEqual(r.status_code, 200)
+        datos = r.json()
+        self.assertEqual(datos["lineas"], [{
+            "producto": self.anillo.id, "slug": "anillo", "nombre": "Anillo", "cantidad": 2,
+            "precio": "100.00", "subtotal": "200.00", "stock_disponible": 5, "valido": True,
+        }])
+        self.assertEqual((datos["cantidad_total"], datos["total"]), (2, "200.00"))
+
+        self.assertEqual(self._linea("patch", self.anillo, {"incremento": -1}).json()["cantidad_total"], 1)
+
+        r = self._linea("delete", self.anillo)
+        self.assertEqual(r.json()["lineas"], [{"producto": self.anillo.id, "cantidad": 0}])
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_lote_es_todo_o_nada(self):
+        url = reverse("carrito:api-carrito")
+        r = self.client.post(url, {"cambios": [
+            {"producto": self.anillo.id, "cantidad": 3},
+            {"producto": self.collar.id, "incremento": 1},
+        ]}, content_type="application/json")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["total"], "550.00")
+        self.assertEqual(Reserva.objects.count(), 2)
+
+        # El collar no alcanza: no se aplica ninguno de los dos cambios
+        r = self.client.post(url, {"cambios": [
+            {"producto": self.anillo.id, "cantidad": 1},
+            {"producto": self.collar.id, "incremento": 5},
+        ]}, content_type="application/json")
+        self.assertEqual(r.status_code, 409)
+        self.assertIn(str(self.collar.id), r.json()["errores"])
+        self.assertEqual(self.client.get(url).json()["cantidad_total"], 4)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BusquedaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        datos = [
+            ("Anillo de oro", "Oro macizo 18k, oro amarillo", 300, 2),
+            ("Collar de plata", "Cadena de plata con un dije bañado en oro, ideal para regalo de cumpleaños", 150, 0),
+            ("Aros de plata", "Plata 925", 90, 5),
+            ("Pulsera de acero", "Acero quirúrgico", 60, 3),
+        ]
+        for nombre, descripcion, precio, stock in datos:
+            Producto.objects.create(
+                nombre=nombre, slug=nombre.lower().replace(" ", "-"), descripcion=descripcion,
+                precio=precio, stock=stock,
+            )
+
+    def _buscar(self, **params):
+        r = self.client.get(reverse("carrito:buscar"), params)
+        self.assertEqual(r.status_code, 200)
+        return [p.nombre for p in r.context["object_list"]]
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "FTS5")
+    def test_relevancia_y_prefijos(self):
+        self.assertEqual(busqueda.motor(), "sqlite")
+        # En el nombre y repetido en la descripción pesa más que una mención al pasar
+        self.assertEqual(self._buscar(q="oro"), ["Anillo de oro", "Collar de plata"])
+        self.assertEqual(self._buscar(q="plat"), ["Aros de plata", "Collar de plata"])
+        self.assertEqual(self._buscar(q='plata" OR "acero'), [])  # sin sintaxis FTS del usuario
+
+    def test_respaldo_sin_indice(self):
+        with mock.patch.object(busqueda, "motor", return_value="basico"):
+            self.assertEqual(self._buscar(q="oro"), ["Anillo de oro", "Collar de plata"])
+            self.assertEqual(self._buscar(q="plata dije"), ["Collar de plata"])
+
+    def test_cada_filtro_acota(self):
+        todos = self._buscar(q="")
+        self.assertEqual(len(todos), 4)
+        self.assertEqual(self._buscar(precio_min=100), ["Anillo de oro", "Collar de plata"])
+        self.assertEqual(self._buscar(precio_max=90), ["Aros de plata", "Pulsera de acero"])
+        self.assertEqual(self._buscar(precio_min=80, precio_max=200), ["Aros de plata", "Collar de plata"])
+        self.assertNotIn("Collar de plata", self._buscar(en_stock="on"))
+        self.assertEqual(len(self._buscar(en_stock="on")), 3)
+        self.assertEqual(self._buscar(q="plata", en_stock="on"), ["Aros de plata"])
+        self.assertEqual(self._buscar(orden="-precio")[0], "Anillo de oro")
+        self.assertEqual(self._buscar(orden="precio")[0], "Pulsera de acero")
+        self.assertEqual(self._buscar(orden="nuevos")[0], "Pulsera de acero")
+        self.assertEqual(self._buscar(precio_min=-1), [])  # form inválido: sin resultados
+
+
+class ImportacionCatalogoTests(TestCase):
+    CSV = "slug,nombre,precio,stock\nanillo,Anillo,100,5\npulsera,Pulsera,\"80,50\",2\nmal slug,X,1,1\n"
+
+    def _importar(self, texto, **kwargs):
+        return importacion.importar(importacion.leer_filas(io.StringIO(texto), "csv"), lote=1, **kwargs)
+
+    def test_upsert_por_slug_y_dry_run(self):
+        Producto.objects.create(nombre="Anillo", slug="anillo", precio=90, stock=5, descripcion="Oro")
+
+        diff = {}
+        resumen = self._importar(self.CSV, dry_run=True, al_cambiar=diff.__setitem__)
+        self.assertEqual(resumen, {"altas": 1, "cambios": 1, "iguales": 0, "errores": 1})
+        self.assertEqual(diff["anillo"], {"precio": (Decimal("90.00"), Decimal("100.00"))})
+        self.assertFalse(Producto.objects.filter(slug="pulsera").exists())
+
+        self._importar(self.CSV)
+        anillo = Producto.objects.get(slug="anillo")
+        self.assertEqual((anillo.precio, anillo.descripcion), (Decimal("100.00"), "Oro"))
+        self.assertEqual(Producto.objects.get(slug="pulsera").precio, Decimal("80.50"))
+
+        # Solo precio: el resto de las columnas no se toca
+        self._importar("slug,precio\nanillo,120\n")
+        anillo.refresh_from_db()
+        self.assertEqual((anillo.precio, anillo.stock, anillo.nombre), (Decimal("120.00"), 5, "Anillo"))
+
+    def test_comando_desde_stdin_no_lo_cierra(self):
+        entrada = io.StringIO(self.CSV)
+        with mock.patch("sys.stdin", entrada):
+            call_command("importar_catalogo", "-", stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(entrada.closed)
+        self.assertEqual(Producto.objects.count(), 2)
+
+    def test_jsonl_con_tipos_equivocados(self):
+        jsonl = "\n".join([
+            '{"slug": 1234, "nombre": 1234, "descripcion": 18, "precio": 100}',
+            '{"slug": "anillo", "nombre": ["Anillo"], "precio": 100}',
+            '{"slug": "collar", "nombre": "Collar", "descripcion": {"es": "Oro"}, "precio": 100}',
+            '{"slug": true, "nombre": "Aros", "precio": 100}',
+            '{"slug": "pulsera", "nombre": "Pulsera", "precio": [1], "stock": {}}',
+        ])
+        errores = {}
+        resumen = importacion.importar(
+            importacion.leer_filas(io.StringIO(jsonl), "jsonl"), al_error=errores.__setitem__,
+        )
+        self.assertEqual((resumen["altas"], resumen["errores"]), (1, 4))
+        self.assertEqual(errores[2], "nombre inválido: ['Anillo']")
+        producto = Producto.objects.get()
+        self.assertEqual((producto.slug, producto.nombre, producto.descripcion), ("1234", "1234", "18"))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ReportesVentasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.anillo = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=50)
+        cls.collar = Producto.objects.create(nombre="Collar", slug="collar", precio=250, stock=50)
+
+    def _comprar(self, lineas, metodo_pago="efectivo"):
+        for producto, cantidad in lineas:
+            self.client.post(reverse("carrito:carrito-agregar", args=[producto.slug]), {"cantidad": cantidad})
+        self.client.post(reverse("carrito:checkout"), {**DATOS_CHECKOUT, "metodo_pago": metodo_pago})
+
+    def _agregados(self):
+        return (
+            sorted(VentaDiaria.objects.values_list("metodo_pago", "ordenes", "unidades", "ingresos")),
+            sorted(VentaProductoDiaria.objects.values_list("producto_id", "metodo_pago", "ordenes", "unidades")),
+        )
+
+    def test_incremental_coincide_con_reconstruir(self):
+        self._comprar([(self.anillo, 2), (self.collar, 1)])
+        self._comprar([(self.anillo, 1)])
+        self._comprar([(self.collar, 3)], metodo_pago="tarjeta")
+
+        incremental = self._agregados()
+        self.assertEqual(incremental[0], [
+            ("efectivo", 2, 4, Decimal("550.00")),
+            ("tarjeta", 1, 3, Decimal("750.00")),
+        ])
+        reportes.reconstruir()
+        self.assertEqual(self._agregados(), incremental)
+
+    def test_borrador_cancelado_no_cuenta_al_reconstruir(self):
+        self._comprar([(self.anillo, 2)])
+        Orden.objects.get().cancelar()
+        borrador = Orden.objects.create(**{**DATOS_CHECKOUT, "metodo_pago": "tarjeta"})
+        OrdenItem.objects.create(orden=borrador, producto=self.collar, cantidad=1, precio=250)
+        borrador.cancelar()
+
+        def agregados():
+            # Mover de estado deja la fila de "confirmada" en cero; reconstruir no la crea
+            return sorted(VentaDiaria.objects.exclude(ordenes=0).values_list("metodo_pago", "estado", "ordenes", "ingresos"))
+
+        incremental = agregados()
+        self.assertEqual(incremental, [("efectivo", "cancelada", 1, Decimal("200.00"))])
+        reportes.reconstruir()
+        self.assertEqual(agregados(), incremental)
+
+    def test_exportacion_csv_en_streaming(self):
+        self._comprar([(self.anillo, 2), (self.collar, 1)])
+        staff = get_user_model().objects.create_user("admin", password="x", is_staff=True)
+        self.client.force_login(staff)
+        r = self.client.get(reverse("carrito:exportar-ordenes"))
+        self.assertTrue(r.streaming)
+        lineas = b"".join(r.streaming_content).decode().splitlines()
+        self.assertEqual(lineas[0].split(",")[:3], ["orden", "creado", "estado"])
+        self.assertEqual(len(lineas), 3)
+        self.assertEqual(self.client.get(reverse("carrito:reporte-ventas")).json()["por_dia"][0]["unidades"], 3)
+
+
+class BenchmarkComandoTests(TestCase):
+    def test_corre_sobre_un_catalogo_chico(self):
+        # Ya estamos en una BD de test: el comando no crea ni destruye la suya
+        comando = "carrito.management.commands.benchmark"
+        salida = io.StringIO()
+        with mock.patch(f"{comando}.setup_test_environment"), mock.patch(f"{comando}.teardown_test_environment"), \
+                mock.patch.object(connection.creation, "create_test_db"), \
+                mock.patch.object(connection.creation, "destroy_test_db"):
+            call_command(
+                "benchmark", "--productos", "12", "--ordenes", "3", "--iteraciones", "2", "--json", "-",
+                stdout=salida,
+            )
+        texto = salida.getvalue()
+        reporte = json.loads(texto[texto.index("{"):])
+        self.assertEqual(
+            [r["escenario"] for r in reporte["resultados"]],
+            ["lista", "detalle", "carrito", "agregar", "checkout"],
+        )
+        self.assertEqual(reporte["parametros"]["productos"], 12)
+        self.assertGreater(reporte["resultados"][-1]["queries"], 0)  # el checkout escribe
+
+
+class ConfirmarOrdenTests(TestCase):
+    """Orden.confirmar descuenta todas las líneas con un solo UPDATE (CASE por producto)."""
+
+    def setUp(self):
+        self.productos = [
+            Producto.objects.create(nombre=nombre, slug=nombre.lower(), precio=100, stock=5)
+            for nombre in ("Anillo", "Collar", "Aros")
+        ]
+
+    def _orden(self, cantidades):
+        orden = Orden.objects.create(**DATOS_CHECKOUT)
+        items = OrdenItem.objects.bulk_create([
+            OrdenItem(orden=orden, producto=p, cantidad=c, precio=p.precio) for p, c in zip(self.productos, cantidades)
+        ])
+        return orden, items
+
+    def _stock(self):
+        return list(Producto.objects.order_by("pk").values_list("stock", flat=True))
+
+    def test_un_update_para_todas_las_lineas(self):
+        orden, items = self._orden([1, 2, 3])
+        with CaptureQueriesContext(connection) as capturadas:
+            orden.confirmar(items=items)
+        updates = [q["sql"] for q in capturadas if q["sql"].startswith('UPDATE "carrito_producto"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("CASE", updates[0])
+        self.assertEqual(self._stock(), [4, 3, 2])
+        self.assertEqual((orden.estado, orden.total), ("confirmada", Decimal("600.00")))
+
+    def test_una_linea_sin_stock_revierte_toda_la_orden(self):
+        orden, items = self._orden([1, 9, 3])
+        with self.assertRaisesMessage(ValidationError, "No hay stock suficiente para: «Collar»: pedido 9, disponible 5"):
+            orden.confirmar(items=items)
+        self.assertEqual(self._stock(), [5, 5, 5])
+        orden.refresh_from_db()
+        self.assertEqual(orden.estado, "borrador")
+        self.assertFalse(MovimientoStock.objects.filter(motivo="venta").exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CheckoutIdempotenteTests(TransactionTestCase):
+    """Doble click / reintentos del checkout: una sola orden y un solo descuento de stock."""
+
+    def setUp(self):
+        self.producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=10)
+        self.client.post(reverse("carrito:carrito-agregar", args=[self.producto.slug]), {"cantidad": 2})
+        self.datos = {**DATOS_CHECKOUT, "clave_idempotencia": uuid.uuid4().hex}
+
+    def test_reenvio_vuelve_a_la_misma_orden(self):
+        primera = self.client.post(reverse("carrito:checkout"), self.datos)
+        segunda = self.client.post(reverse("carrito:checkout"), self.datos)
+        self.assertEqual(segunda["Location"], primera["Location"])
+        self.assertEqual(Orden.objects.count(), 1)
+
+    def test_envios_en_paralelo(self):
+        cookies = self.client.cookies
+        barrera = threading.Barrier(5)
+        destinos = []
+
+        def enviar():
+            cliente = Client()
+            cliente.cookies = cookies  # misma sesión = mismo carrito
+            barrera.wait()
+            try:
+                destinos.append(cliente.post(reverse("carrito:checkout"), self.datos)["Location"])
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=enviar) for _ in range(5)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        orden = Orden.objects.get()
+        self.assertEqual(destinos, [reverse("carrito:success", args=[orden.pk])] * 5)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 8)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class StockFragmentadoTests(TestCase):
+    """Modo alta demanda: el stock vive en fragmentos y se suma al leer."""
+
+    def setUp(self):
+        self.producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=10)
+        self.producto.fragmentar_stock(4)
+
+    def _en_fragmentos(self):
+        return sum(StockFragmento.objects.filter(producto=self.producto).values_list("stock", flat=True))
+
+    def test_checkout_descuenta_de_los_fragmentos(self):
+        self.assertEqual((self.producto.stock, self._en_fragmentos()), (0, 10))
+        self.assertEqual(Producto.objects.con_disponible().get().disponible, 10)
+        self.assertIn(self.producto, Producto.objects.en_stock())
+        self.assertContains(self.client.get(self.producto.get_absolute_url()), "<strong>10</strong>")
+
+        self.client.post(reverse("carrito:carrito-agregar", args=[self.producto.slug]), {"cantidad": 3})
+        self.client.post(reverse("carrito:checkout"), DATOS_CHECKOUT)
+        self.assertEqual(Orden.objects.get().estado, "confirmada")
+        self.assertEqual(self._en_fragmentos(), 7)
+
+        # Pedido mayor que cualquier fragmento: junta de varios sin pasarse
+        orden = Orden.objects.create(**DATOS_CHECKOUT)
+        item = OrdenItem.objects.create(orden=orden, producto=self.producto, cantidad=8)
+        with self.assertRaises(ValidationError):
+            orden.confirmar(items=[item])
+        self.assertEqual(self._en_fragmentos(), 7)
+        item.cantidad = 7
+        orden.confirmar(items=[item])
+        self.assertEqual(self._en_fragmentos(), 0)
+
+    def test_lectura_vieja_no_da_faltante_con_stock_de_sobra(self):
+        def otro_checkout(candidatos):
+            # Entre la lectura y los UPDATEs otra venta deja el primer fragmento en 2
+            StockFragmento.objects.filter(pk=candidatos[0][0]).update(stock=2)
+            return candidatos[0]
+
+        with mock.patch("carrito.models.random.choice", otro_checkout):
+            self.assertEqual(StockFragmento.descontar({self.producto.pk: 8}), [])
+        self.assertEqual(self._en_fragmentos(), 1)
+        self.assertEqual(StockFragmento.descontar({self.producto.pk: 2}), [self.producto.pk])
+
+    def test_consolidar_vuelve_a_la_fila(self):
+        Producto.objects.filter(pk=self.producto.pk).update(stock=2)  # reposición en la fila
+        self.producto.consolidar_stock()
+        self.assertEqual((self.producto.stock, self.producto.stock_fragmentado), (12, False))
+        self.assertFalse(StockFragmento.objects.exists())
+
+
+class StockFragmentadoConcurrenteTests(TransactionTestCase):
+    def test_checkouts_en_paralelo_venden_todo_sin_pasarse(self):
+        producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=12)
+        producto.fragmentar_stock(3)
+        barrera = threading.Barrier(6)
+        errores = []
+
+        def comprar():
+            try:
+                orden = Orden.objects.create(**DATOS_CHECKOUT)
+                item = OrdenItem.objects.create(orden=orden, producto=producto, cantidad=2, precio=100)
+                barrera.wait()
+                with transaction.atomic():
+                    orden.confirmar(items=[item])
+            except ValidationError as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=comprar) for _ in range(6)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual(Orden.objects.filter(estado="confirmada").count(), 6)
+        self.assertEqual(Producto.objects.con_stock_total().get().stock_total, 0)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class DetalleCondicionalTests(TestCase):
+    def setUp(self):
+        self.producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=5)
+        self.url = self.producto.get_absolute_url()
+
+    def test_304_hasta_que_cambia_el_stock(self):
+        etag = self.client.get(self.url)["ETag"]  # la primera respuesta setea la cookie CSRF
+        etag = self.client.get(self.url)["ETag"]
+        r = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 304)
+
+        # Un descuento de stock (UPDATE, sin save()) cambia la versión
+        self.producto.descontar_stock(1)
+        r = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, "<strong>4</strong>")
+        self.assertNotEqual(r["ETag"], etag)
+
+    def test_relacionado_agotado_invalida_el_etag(self):
+        collar = Producto.objects.create(nombre="Collar", slug="collar", precio=250, stock=1)
+        CompraConjunta.objects.create(producto=self.producto, relacionado=collar, puntaje=1)
+        self.client.get(self.url)
+        r = self.client.get(self.url)
+        self.assertContains(r, "Comprados juntos")
+        etag = r["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Se vende el último collar: el anillo no cambió, pero la página sí
+        Producto.objects.filter(pk=collar.pk).update(stock=0)
+        r = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertNotContains(r, "Comprados juntos")
+
+    def test_sin_304_con_mensajes_pendientes(self):
+        etag = self.client.get(self.url)["ETag"]
+        etag = self.client.get(self.url)["ETag"]
+        # Pedir de más deja un mensaje de error y vuelve al detalle
+        self.client.post(reverse("carrito:carrito-agregar", args=[self.producto.slug]), {"cantidad": 50})
+        r = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertNotIn("ETag", r)
+        self.assertContains(r, "Solo hay 5 unidades")
+
+
+class DerivadosImagenTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        ajustes = override_settings(MEDIA_ROOT=media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _imagen(self, nombre, formato):
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 300), "gold").save(buffer, format=formato)
+        return SimpleUploadedFile(nombre, buffer.getvalue())
+
+    def test_se_generan_despues_del_commit(self):
+        with self.captureOnCommitCallbacks() as pendientes:
+            producto = Producto.objects.create(
+                nombre="Anillo", slug="anillo", precio=100, stock=5, imagen=self._imagen("anillo.png", "PNG")
+            )
+            # Dentro de la transacción no se codifica nada: se sirve el original
+            self.assertEqual(producto.imagen_derivados, {})
+            self.assertNotIn("<picture>", imagen_responsive(producto))
+
+        for callback in pendientes:
+            callback()
+        producto.refresh_from_db()
+        self.assertEqual(producto.imagen_derivados["anchos"], [80, 160, 320])
+        html = imagen_responsive(producto)
+        self.assertIn("<picture>", html)
+        self.assertIn(f'<img src="{producto.imagen.url}"', html)
+
+    def test_mismo_nombre_otra_extension_y_reemplazo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            png = Producto.objects.create(
+                nombre="Anillo", slug="anillo", precio=100, stock=5, imagen=self._imagen("anillo.png", "PNG")
+            )
+            jpg = Producto.objects.create(
+                nombre="Anillo oro", slug="anillo-oro", precio=100, stock=5, imagen=self._imagen("anillo.jpg", "JPEG")
+            )
+        png.refresh_from_db()
+        jpg.refresh_from_db()
+        de_png, de_jpg = imagenes.rutas(png.imagen_derivados), imagenes.rutas(jpg.imagen_derivados)
+        self.assertTrue(de_png)
+        self.assertFalse(set(de_png) & set(de_jpg))
+        self.assertTrue(all(default_storage.exists(r) for r in de_png + de_jpg))
+
+        # Al reemplazar la imagen se borran los derivados de la anterior (y solo esos)
+        png.imagen = self._imagen("anillo-nuevo.png", "PNG")
+        with self.captureOnCommitCallbacks(execute=True):
+            png.save()
+        png.refresh_from_db()
+        self.assertFalse(any(default_storage.exists(r) for r in de_png))
+        self.assertTrue(all(default_storage.exists(r) for r in de_jpg + imagenes.rutas(png.imagen_derivados)))
+
+    def test_backfill_no_pisa_una_imagen_cambiada(self):
+        with self.captureOnCommitCallbacks():  # sin ejecutar: quedan pendientes para el comando
+            anillo = Producto.objects.create(
+                nombre="Anillo", slug="anillo", precio=100, stock=5, imagen=self._imagen("anillo.png", "PNG")
+            )
+            collar = Producto.objects.create(
+                nombre="Collar", slug="collar", precio=100, stock=5, imagen=self._imagen("collar.png", "PNG")
+            )
+
+        def cambiar_y_esperar(futuros):
+            # El admin reemplaza la imagen del collar mientras el pool codifica la anterior
+            Producto.objects.filter(pk=collar.pk).update(imagen="productos/collar-nuevo.png")
+            return as_completed(futuros)
+
+        salida = io.StringIO()
+        comando = "carrito.management.commands.generar_derivados"
+        with mock.patch(f"{comando}.ProcessPoolExecutor", ThreadPoolExecutor), \
+                mock.patch(f"{comando}.as_completed", cambiar_y_esperar):
+            call_command("generar_derivados", "--procesos", "1", stdout=salida)
+
+        anillo.refresh_from_db()
+        collar.refresh_from_db()
+        self.assertEqual(anillo.imagen_derivados["anchos"], [80, 160, 320])
+        self.assertEqual((collar.imagen.name, collar.imagen_derivados), ("productos/collar-nuevo.png", {}))
+        self.assertIn("1 con la imagen cambiada", salida.getvalue())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MovimientosStockTests(TestCase):
+    def setUp(self):
+        self.producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=10, umbral_stock=3)
+
+    def _comprar(self, cantidad):
+        self.client.post(reverse("carrito:carrito-agregar", args=[self.producto.slug]), {"cantidad": cantidad})
+        self.client.post(reverse("carrito:checkout"), DATOS_CHECKOUT)
+
+    def test_libro_y_alertas_incrementales(self):
+        self._comprar(6)
+        self.assertFalse(AlertaStock.objects.exists())
+        with self.assertLogs("carrito.models", "WARNING"):
+            self._comprar(2)  # 4 -> 2: cruza el umbral
+        self._comprar(1)  # ya estaba debajo: no repite
+        alerta = AlertaStock.objects.get()
+        self.assertEqual((alerta.stock, alerta.umbral, alerta.resuelta), (2, 3, None))
+
+        self.producto.reponer_stock(5)
+        alerta.refresh_from_db()
+        self.assertIsNotNone(alerta.resuelta)
+
+        movimientos = MovimientoStock.objects.filter(producto=self.producto).con_saldo()
+        self.assertEqual(
+            [(m.motivo, m.cantidad, m.saldo) for m in movimientos],
+            [("inicial", 10, 10), ("venta", -6, 4), ("venta", -2, 2), ("venta", -1, 1), ("reposicion", 5, 6)],
+        )
+        self.assertEqual(movimientos[1].orden, Orden.objects.order_by("pk").first())
+
+    def test_editar_sin_tocar_stock(self):
+        cargado = Producto.objects.get(pk=self.producto.pk)
+        self.producto.descontar_stock(3, motivo="venta")  # mientras el admin tiene el form abierto
+
+        cargado.descripcion = "Oro 18k"
+        cargado.save()
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.stock, self.producto.descripcion), (7, "Oro 18k"))
+        self.assertEqual(MovimientoStock.objects.filter(motivo="ajuste").count(), 0)
+
+        cargado.stock = 9
+        cargado.save()
+        self.assertEqual(MovimientoStock.objects.get(motivo="ajuste").cantidad, 2)  # contra la BD, no contra el form
+
+    def test_conciliar_stock(self):
+        Producto.objects.filter(pk=self.producto.pk).update(stock=12)  # cambio por fuera del libro
+        salida = io.StringIO()
+        call_command("conciliar_stock", stdout=salida)
+        self.assertIn("anillo: stock 12, libro 10 (+2)", salida.getvalue())
+
+        call_command("conciliar_stock", "--corregir", stdout=io.StringIO())
+        salida = io.StringIO()
+        call_command("conciliar_stock", stdout=salida)
+        self.assertIn("coinciden", salida.getvalue())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CancelacionOrdenesTests(TestCase):
+    def setUp(self):
+        self.anillo = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=20)
+        self.collar = Producto.objects.create(nombre="Collar", slug="collar", precio=250, stock=20)
+        for lineas in ([(self.anillo, 2), (self.collar, 1)], [(self.anillo, 3)], [(self.collar, 4)]):
+            for producto, cantidad in lineas:
+                self.client.post(reverse("carrito:carrito-agregar", args=[producto.slug]), {"cantidad": cantidad})
+            self.client.post(reverse("carrito:checkout"), DATOS_CHECKOUT)
+        Orden.objects.create(**DATOS_CHECKOUT)  # borrador
+
+    def test_cancelacion_masiva(self):
+        with self.assertNumQueries(14):  # fijo por lote, no por orden/item
+            self.assertEqual(Orden.objects.all().cancelar(), 4)
+        self.assertFalse(Orden.objects.exclude(estado="cancelada").exists())
+        self.anillo.refresh_from_db()
+        self.collar.refresh_from_db()
+        self.assertEqual((self.anillo.stock, self.collar.stock), (20, 20))
+        self.assertEqual(MovimientoStock.objects.filter(motivo="cancelacion").count(), 4)
+
+        # Agregados: todo pasó a "cancelada" y coincide con reconstruir()
+        por_estado = dict(VentaDiaria.objects.values_list("estado", "ordenes"))
+        self.assertEqual(por_estado, {"confirmada": 0, "cancelada": 3})
+        antes = sorted(VentaProductoDiaria.objects.filter(estado="cancelada").values_list("producto", "unidades"))
+        reportes.reconstruir()
+        self.assertEqual(
+            sorted(VentaProductoDiaria.objects.filter(estado="cancelada").values_list("producto", "unidades")), antes
+        )
+
+        # Guardas: una cancelada no se vuelve a cancelar ni repone dos veces
+        self.assertEqual(Orden.objects.all().cancelar(), 0)
+        with self.assertRaises(ValidationError):
+            Orden.objects.first().cancelar()
+        self.anillo.refresh_from_db()
+        self.assertEqual(self.anillo.stock, 20)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AdminTablasGrandesTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser("admin", password="x"))
+        self.productos = [
+            Producto.objects.create(nombre=f"Anillo {i}", slug=f"anillo-{i}", precio=100, stock=10) for i in range(3)
+        ]
+
+    def _ordenes(self, n):
+        for _ in range(n):
+            orden = Orden.objects.create(estado="confirmada", **DATOS_CHECKOUT)
+            OrdenItem.objects.bulk_create([OrdenItem(orden=orden, producto=p, cantidad=1, precio=p.precio) for p in self.productos])
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as capturadas:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(capturadas)
+
+    def test_listados_sin_n_mas_1(self):
+        for url in (reverse("admin:carrito_orden_changelist"), reverse("admin:carrito_ordenitem_changelist")):
+            self._ordenes(2)
+            pocas = self._queries(url)
+            self._ordenes(10)
+            self.assertEqual(self._queries(url), pocas, url)
+        r = self.client.get(reverse("admin:carrito_orden_changelist"))
+        self.assertContains(r, f"?orden__id__exact={Orden.objects.first().pk}")
+
+    def test_acciones_de_stock_en_lote(self):
+        url = reverse("admin:carrito_producto_changelist")
+        seleccion = [p.pk for p in self.productos[:2]]
+        with self.assertNumQueries(10):  # fijo, no depende de cuántos se seleccionan
+            self.client.post(url, {"action": "sumar_stock", "index": 0, "cantidad": 5, "_selected_action": seleccion})
+        self.client.post(url, {"action": "fijar_stock", "index": 0, "cantidad": 3, "_selected_action": seleccion[:1]})
+        stocks = dict(Producto.objects.values_list("pk", "stock"))
+        self.assertEqual([stocks[p.pk] for p in self.productos], [3, 15, 10])
+        call_command("conciliar_stock", stdout=(salida := io.StringIO()))
+        self.assertIn("coinciden", salida.getvalue())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, DATABASE_REPLICAS=["inexistente"])
+class ReplicasLecturaTests(TransactionTestCase):
+    """La réplica no existe: toda lectura que llegue a ella falla."""
+
+    def test_ruteo(self):
+        router = routers.ReplicaRouter()
+        token = routers.iniciar(RequestFactory().get("/"))
+        try:
+            self.assertEqual(router.db_for_read(Producto), "inexistente")
+            self.assertEqual(router.db_for_read(Orden), "default")
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Producto), "default")
+            self.assertEqual(router.db_for_write(Producto), "default")
+        finally:
+            self.assertTrue(routers.terminar(token).escribio)
+        # Fuera de un request (comandos, shell) todo va a default
+        self.assertEqual(router.db_for_read(Producto), "default")
+
+    def test_despues_de_comprar_lee_de_la_primaria(self):
+        producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=5)
+        r = self.client.post(reverse("carrito:carrito-agregar", args=[producto.slug]), {"cantidad": 1})
+        self.assertIn(routers.COOKIE, r.cookies)
+        self.assertEqual(self.client.get(reverse("carrito:checkout")).status_code, 200)
+        r = self.client.post(reverse("carrito:checkout"), DATOS_CHECKOUT)
+        self.assertEqual(r.status_code, 302)
+        r = self.client.get(producto.get_absolute_url())
+        self.assertContains(r, "<strong>4</strong>")
+
+        # Sin la cookie, el catálogo se lee de la réplica
+        del self.client.cookies[routers.COOKIE]
+        with self.assertRaises(ConnectionDoesNotExist):
+            self.client.get(producto.get_absolute_url())
+
+    def test_lo_que_se_cachea_se_lee_de_la_primaria(self):
+        producto = Producto.objects.create(nombre="Anillo", slug="anillo", precio=100, stock=5)
+        self.client.post(reverse("carrito:carrito-agregar", args=[producto.slug]), {"cantidad": 1})
+        del self.client.cookies[routers.COOKIE]
+        Producto.objects.filter(pk=producto.pk).update(precio=120)
+        catalogo.invalidar()
+
+        # Miss del catálogo y revalidación del resumen: nada pasa por la réplica
+        self.assertContains(self.client.get(reverse("carrito:home")), "$120,00")
+        r = self.client.get(reverse("carrito:carrito-detalle"))
+        self.assertEqual(r.context["cart_resumen"]["total"], Decimal("120.00"))
+
+
+@unittest.skipUnless(connection.vendor == "sqlite" and settings.SQLITE_PRODUCCION, "perfil SQLite de producción")
+class SqliteProduccionTests(TestCase):
+    def test_pragmas_y_begin_immediate(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_TIMEOUT * 1000)
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+
+class PoolConexionesTests(TestCase):
+    def test_configuracion_desde_el_entorno(self):
+        from joyeria import settings as proyecto
+
+        db = {"ENGINE": "django.db.backends.postgresql", "CONN_MAX_AGE": 600, "OPTIONS": {}}
+        with mock.patch.object(proyecto, "DB_POOL", True):
+            proyecto._configurar_postgres(db)
+        self.assertEqual((db["CONN_MAX_AGE"], db["CONN_HEALTH_CHECKS"]), (0, True))
+        self.assertEqual(db["OPTIONS"]["pool"], proyecto.DB_POOL_OPCIONES)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_vista_de_estadisticas_solo_staff(self):
+        url = reverse("carrito:instrumentacion-pool")
+        self.assertEqual(self.client.get(url).status_code, 302)  # al login del admin
+        staff = get_user_model().objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).json()["default"], {"pool": False})
+
+
+class ComprasConjuntasTests(TestCase):
+    def setUp(self):
+        self.anillo, self.collar, self.aros, self.pulsera = [
+            Producto.objects.create(nombre=nombre, slug=nombre.lower(), precio=100, stock=20)
+            for nombre in ("Anillo", "Collar", "Aros", "Pulsera")
+        ]
+
+    def _orden(self, *productos):
+        orden = Orden.objects.create(**DATOS_CHECKOUT)
+        items = OrdenItem.objects.bulk_create([
+            OrdenItem(orden=orden, producto=p, cantidad=1, precio=p.precio) for p in productos
+        ])
+        orden.confirmar(items=items)
+        return orden
+
+    def _relacionados(self, producto):
+        return [p.slug for p in recomendaciones.relacionados(producto)]
+
+    def test_incremental_y_cancelaciones(self):
+        self._orden(self.anillo, self.collar)
+        self._orden(self.anillo, self.collar, self.aros)
+        self.assertEqual(recomendaciones.actualizar(), 2)
+        self.assertEqual(recomendaciones.actualizar(), 0)  # nada nuevo
+
+        self._orden(self.anillo, self.pulsera)
+        self.assertEqual(recomendaciones.actualizar(), 1)  # solo la nueva
+        self.assertEqual(
+            CompraConjunta.objects.get(producto=self.anillo, relacionado=self.collar).puntaje, 2
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(self._relacionados(self.anillo), ["collar", "aros", "pulsera"])
+
+        Orden.objects.filter(pk=Orden.objects.order_by("pk").last().pk).cancelar()
+        self.assertEqual(recomendaciones.actualizar(), 1)
+        self.assertEqual(self._relacionados(self.anillo), ["collar", "aros"])
+        self.assertFalse(CompraConjunta.objects.filter(relacionado=self.pulsera).exists())
+
+        # Sin stock no se recomienda
+        Producto.objects.filter(pk=self.aros.pk).update(stock=0)
+        self.assertEqual(self._relacionados(self.anillo), ["collar"])
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_reconstruir_y_detalle(self):
+        self._orden(self.anillo, self.collar)
+        self._orden(self.collar, self.aros)
+        recomendaciones.actualizar()
+        antes = sorted(CompraConjunta.objects.values_list("producto", "relacionado", "puntaje"))
+
+        call_command("indexar_compras_conjuntas", "--reconstruir", "--lote", "1", stdout=io.StringIO())
+        self.assertEqual(sorted(CompraConjunta.objects.values_list("producto", "relacionado", "puntaje")), antes)
+
+        r = self.client.get(self.collar.get_absolute_url())
+        self.assertContains(r, "Comprados juntos")
+        self.assertEqual([p.slug for p in r.context["relacionados"]], ["anillo", "aros"])
@@ -1,18 +1,38 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
-    ProductoListaView, ProductoDetalleView,
+    ProductoListaView, ProductoBusquedaView, ProductoDetalleView,
     CarritoDetalleView, CarritoAgregarView, CarritoQuitarView,
     CheckoutView, CheckoutSuccessView,
+    instrumentacion_view, pool_view, reporte_ventas_view, exportar_ordenes_view,
 )
+from .views_api import CarritoApiView, CarritoLineaApiView
 
 app_name = "carrito"
 
+if settings.CARRITO_VISTAS_ASYNC:
+    # Mismas URLs y templates, con las vistas async (servir con ASGI)
+    from .views_async import (
+        ProductoListaAsyncView as ProductoListaView,
+        ProductoDetalleAsyncView as ProductoDetalleView,
+        CarritoDetalleAsyncView as CarritoDetalleView,
+        CarritoAgregarAsyncView as CarritoAgregarView,
+        CheckoutAsyncView as CheckoutView,
+    )
+
 urlpatterns = [
     path("",                      ProductoListaView.as_view(),   name="home"),
+    path("buscar/",               ProductoBusquedaView.as_view(), name="buscar"),
     path("p/<slug:slug>/",       ProductoDetalleView.as_view(), name="producto-detalle"),
     path("carrito/",             CarritoDetalleView.as_view(),  name="carrito-detalle"),
     path("carrito/add/<slug:slug>/",    CarritoAgregarView.as_view(), name="carrito-agregar"),
     path("carrito/remove/<slug:slug>/", CarritoQuitarView.as_view(),  name="carrito-quitar"),
     path("checkout/",            CheckoutView.as_view(),        name="checkout"),
     path("success/<int:pk>/",    CheckoutSuccessView.as_view(), name="success"),  # <— cambio
+    path("api/carrito/",                        CarritoApiView.as_view(),      name="api-carrito"),
+    path("api/carrito/<int:producto_id>/",      CarritoLineaApiView.as_view(), name="api-carrito-linea"),
+    path("instrumentacion/",     instrumentacion_view,          name="instrumentacion"),
+    path("instrumentacion/pool/", pool_view,                    name="instrumentacion-pool"),
+    path("reportes/ventas/",     reporte_ventas_view,           name="reporte-ventas"),
+    path("reportes/ordenes.csv", exportar_ordenes_view,         name="exportar-ordenes"),
 ]
@@ -1,31 +1,205 @@
+import csv
+import hashlib
+import re
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.views.generic import ListView, DetailView, TemplateView, View
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
 from django.core.exceptions import ValidationError
-from django.db import transaction
-
+from django.db import IntegrityError, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+
+from . import busqueda, catalogo, instrumentacion, recomendaciones, reportes, routers
+from .paginacion import paginar_por_cursor
 from .models import Producto, Orden, OrdenItem
-from .cart import Cart, StockInsuficienteError
-from .forms import AgregarAlCarritoForm, OrdenForm
+from .cart import Cart, CartError
+from .forms import AgregarAlCarritoForm, BusquedaForm, OrdenForm
 
 
 class ProductoListaView(ListView):
+    """
+    Catálogo paginado. La grilla de cada página se cachea por número de página
+    y versión del catálogo: en un hit no se toca la BD (ni el COUNT del paginador).
+    Mensajes y badge del carrito quedan fuera del fragmento cacheado.
+
+    Con CATALOGO_PAGINACION = "cursor" se pagina por (nombre, id) con
+    ?after= / ?before= en lugar de ?page=.
+    """
     model = Producto
     paginate_by = 12
     template_name = "carrito/producto_list.html"
+    fragment_template_name = "carrito/_catalogo.html"
+
+    def cursor_activo(self):
+        return getattr(settings, "CATALOGO_PAGINACION", "offset") == "cursor"
+
+    def _clave_pagina(self):
+        if self.cursor_activo():
+            after = self.request.GET.get("after")
+            before = self.request.GET.get("before")
+            if before:
+                return f"b:{before}"
+            return f"a:{after}" if after else "a:"
+        return self.request.GET.get(self.page_kwarg) or 1
+
+    def get(self, request, *args, **kwargs):
+        clave = catalogo.clave_pagina(self._clave_pagina())
+        html = catalogo.obtener(clave)
+        if html is None:
+            # Queda cacheado bajo la versión actual: se lee de la primaria
+            with routers.primaria():
+                self.object_list = self.get_queryset()
+                # Sin request: el fragmento no debe llevar nada propio del usuario
+                html = render_to_string(self.fragment_template_name, self.get_context_data())
+            catalogo.guardar(clave, html)
+        return render(request, self.template_name, {"catalogo_html": mark_safe(html)})
+
+    def get_paginate_by(self, queryset):
+        return None if self.cursor_activo() else self.paginate_by
+
+    def get_context_data(self, **kwargs):
+        if self.cursor_activo():
+            pagina = paginar_por_cursor(
+                self.object_list,
+                after=self.request.GET.get("after"),
+                before=self.request.GET.get("before"),
+                por_pagina=self.paginate_by,
+            )
+            kwargs["object_list"] = pagina.object_list
+            kwargs["cursor"] = pagina
+        return super().get_context_data(**kwargs)
+
+
+class ProductoBusquedaView(ListView):
+    """
+    Búsqueda/filtrado del storefront (texto, rango de precio, solo con stock, orden).
+    El texto va contra el índice del motor (FTS5 en SQLite, tsvector/trigram en Postgres).
+    """
+    model = Producto
+    paginate_by = 12
+    template_name = "carrito/producto_busqueda.html"
+
+    def get_queryset(self):
+        self.form = BusquedaForm(self.request.GET or None)
+        qs = Producto.objects.all()
+        if not self.form.is_bound:
+            return qs
+        if not self.form.is_valid():
+            return qs.none()
+        datos = self.form.cleaned_data
+        return busqueda.buscar(
+            qs,
+            texto=datos["q"],
+            precio_min=datos["precio_min"],
+            precio_max=datos["precio_max"],
+            en_stock=datos["en_stock"],
+            orden=datos["orden"],
+        )
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["form"] = self.form
+        # Filtros actuales para los links de paginación del fragmento
+        params = self.request.GET.copy()
+        params.pop(self.page_kwarg, None)
+        ctx["query_base"] = params.urlencode() + "&" if params else ""
+        return ctx
 
 
 class ProductoDetalleView(DetailView):
+    """
+    Detalle con GET condicional y fragmento cacheado por producto.
+
+    ETag = Producto.version (+ la cookie CSRF, que va en el form de la página,
+    las unidades del carrito, que muestra el badge del navbar, y los
+    "comprados juntos" que se muestran, con su 'actualizado'): si el
+    navegador ya tiene esa versión responde 304 sin renderizar. La ficha
+    (imagen, precio, stock) se cachea por versión; el form con el token CSRF,
+    los "comprados juntos" (una query al índice, la misma para el ETag y la
+    página) y los mensajes se renderizan siempre.
+    Con mensajes pendientes no hay 304 ni validadores: hay que mostrarlos.
+    """
     model = Producto
     slug_field = "slug"
     template_name = "carrito/producto_detail.html"
+    fragment_template_name = "carrito/_producto_detalle.html"
+
+    def get_queryset(self):
+        # stock_total en la misma query (productos con stock fragmentado)
+        return Producto.objects.con_stock_total()
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        condicional = self.respuesta_condicional()
+        if condicional is not None:
+            return condicional
+
+        clave = catalogo.clave_detalle(self.object)
+        html = catalogo.obtener(clave)
+        if html is None:
+            html = self.render_ficha()
+            catalogo.guardar(clave, html)
+        return self.respuesta(html)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         # Form conoce el producto para validar stock en clean_cantidad
         ctx["form"] = AgregarAlCarritoForm(producto=self.object)
+        # Los que ya se leyeron para el ETag; si no (con mensajes), el queryset
+        relacionados = getattr(self, "_relacionados", None)
+        ctx["relacionados"] = recomendaciones.relacionados(self.object) if relacionados is None else relacionados
         return ctx
 
+    # --- GET condicional ---
+
+    def validadores(self):
+        """(etag, last_modified) o (None, None) si la página lleva mensajes."""
+        if len(messages.get_messages(self.request)):
+            return None, None
+        if getattr(self, "_relacionados", None) is None:
+            self._relacionados = list(recomendaciones.relacionados(self.object))
+        # Un relacionado que se agota sale de la lista; uno que cambia de precio mueve 'actualizado'
+        propio = "|".join([
+            self.request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+            str(len(Cart(self.request))),
+            *(f"{p.pk}:{p.actualizado.timestamp()}" for p in self._relacionados),
+        ])
+        etag = f'"{self.object.version}-{hashlib.md5(propio.encode()).hexdigest()[:8]}"'
+        # El stock de los fragmentos no mueve 'actualizado': para esos, solo ETag
+        if self.object.stock_fragmentado:
+            return etag, None
+        return etag, int(self.object.actualizado.timestamp())
+
+    def respuesta_condicional(self):
+        etag, last_modified = self.validadores()
+        if etag is None:
+            return None
+        return get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+
+    def render_ficha(self):
+        # Sin request: el fragmento no debe llevar nada propio del usuario
+        return render_to_string(self.fragment_template_name, {"object": self.object})
+
+    def respuesta(self, html):
+        response = self.render_to_response(self.get_context_data(detalle_html=mark_safe(html)))
+        etag, last_modified = self.validadores()
+        if etag:
+            response.headers["ETag"] = etag
+            if last_modified:
+                response.headers["Last-Modified"] = http_date(last_modified)
+        # Privada (token CSRF) y siempre revalidada: el 304 es lo que ahorra
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 
 class CarritoDetalleView(TemplateView):
     template_name = "carrito/carrito_detail.html"
@@ -54,7 +228,8 @@ class CarritoAgregarView(View):
         try:
             Cart(request).add(producto.id, form.cleaned_data["cantidad"])
             messages.success(request, f"Agregado «{producto.nombre}» al carrito.")
-        except StockInsuficienteError as e:
+        except CartError as e:
+            # Falta de stock o storage lleno (cookie)
             messages.error(request, str(e))
 
         return redirect("carrito:carrito-detalle")
@@ -77,11 +252,34 @@ class CheckoutSuccessView(TemplateView):
         return render(request, self.template_name, {"orden": orden})
 
 
+_CLAVE_IDEMPOTENCIA = re.compile(r"^[0-9a-f]{32}$")
+
+
+def clave_idempotencia(request):
+    """Clave del form de checkout (campo oculto); None si falta o no tiene el formato esperado."""
+    clave = request.POST.get("clave_idempotencia", "")
+    return clave if _CLAVE_IDEMPOTENCIA.match(clave) else None
+
+
 class CheckoutView(View):
     """
     GET: muestra resumen + formulario con datos del comprador.
     POST: valida form, crea orden + items, confirma (descuenta stock) y redirige a success/<pk>/.
+
+    El form lleva una clave de idempotencia que se guarda en la Orden (única):
+    un doble click o un reintento del proxy con la misma clave redirige a la
+    orden ya creada, sin volver a confirmar ni tocar el stock.
     """
+    # Con réplicas, todo el checkout (también el GET) lee de la primaria
+    usar_primaria = True
+
+    def contexto(self, cart, form, clave=None):
+        return {"cart": cart, "form": form, "clave_idempotencia": clave or uuid.uuid4().hex}
+
+    def orden_existente(self, clave):
+        if not clave:
+            return None
+        return Orden.objects.filter(clave_idempotencia=clave).values_list("pk", flat=True).first()
 
     def get(self, request):
         cart = Cart(request)
@@ -97,9 +295,14 @@ class CheckoutView(View):
         # Prefill si está logueado y tenés datos (opcional)
         initial = {}
         form = OrdenForm(initial=initial)
-        return render(request, "carrito/checkout.html", {"cart": cart, "form": form})
+        return render(request, "carrito/checkout.html", self.contexto(cart, form))
 
     def post(self, request):
+        # Reenvío de un checkout ya hecho: directo a la orden (el carrito ya está vacío)
+        existente = self.orden_existente(clave_idempotencia(request))
+        if existente:
+            return redirect("carrito:success", pk=existente)
+
         cart = Cart(request)
         if len(cart) == 0:
             messages.info(request, "Tu carrito está vacío.")
@@ -115,33 +318,48 @@ class CheckoutView(View):
                 messages.warning(request, a)
             return redirect("carrito:carrito-detalle")
 
+        return self.crear_orden(request, cart)
+
+    def crear_orden(self, request, cart):
+        """
+        Valida el form y confirma la orden en una transacción. Es sync a
+        propósito (transaction.atomic no es async): CheckoutAsyncView la corre
+        en un thread una vez validado el carrito.
+        """
+        clave = clave_idempotencia(request)
         form = OrdenForm(request.POST)
         if not form.is_valid():
             messages.error(request, "Revisá los datos del formulario.")
-            return render(request, "carrito/checkout.html", {"cart": cart, "form": form})
+            return render(request, "carrito/checkout.html", self.contexto(cart, form, clave))
 
         try:
             with transaction.atomic():
-                # Creamos la orden con los datos del comprador
+                # Creamos la orden con los datos del comprador. Es lo primero que
+                # se escribe: si otro request con la misma clave ganó, el INSERT
+                # choca con el índice único antes de tocar Producto.
                 orden: Orden = form.save(commit=False)
+                orden.clave_idempotencia = clave
                 if request.user.is_authenticated:
                     orden.usuario = request.user  # opcional
                 orden.save()
 
-                # Crear items
-                for item in cart:
-                    OrdenItem.objects.create(
+                # Crear items en un solo INSERT (precio ya viene del snapshot del carrito)
+                items = OrdenItem.objects.bulk_create([
+                    OrdenItem(
                         orden=orden,
                         producto=item["producto"],
                         cantidad=item["cantidad"],
                         precio=item["producto"].precio,
                     )
+                    for item in cart
+                ])
 
                 # Confirmar (descuenta stock, calcula total y marca estado)
-                orden.confirmar()
+                # Las reservas de esta sesión se convierten en el descuento
+                orden.confirmar(items=items, sesion=cart.clave_reserva(crear=False))
 
-                # Limpiar carrito
-                cart.clear()
+                # Limpiar carrito (las reservas ya se consumieron en confirmar)
+                cart.clear(liberar_reservas=False)
 
             messages.success(request, f"¡Gracias por tu compra! Orden #{orden.id} confirmada.")
             return redirect("carrito:success", pk=orden.pk)
@@ -149,3 +367,74 @@ class CheckoutView(View):
         except ValidationError as e:
             messages.error(request, e.message if hasattr(e, "message") else str(e))
             return redirect("carrito:carrito-detalle")
+
+        except IntegrityError:
+            existente = self.orden_existente(clave)
+            if existente is None:
+                raise
+            return redirect("carrito:success", pk=existente)
+
+
+@staff_member_required
+def instrumentacion_view(request):
+    """Estadísticas de SQL por vista acumuladas en este proceso (?reiniciar=1 las pone en cero)."""
+    datos = instrumentacion.estadisticas()
+    if request.GET.get("reiniciar"):
+        instrumentacion.reiniciar()
+    return JsonResponse(datos, json_dumps_params={"ensure_ascii": False, "indent": 2})
+
+
+@staff_member_required
+def pool_view(request):
+    """Conexiones del pool de Postgres de este proceso: en uso, esperando, latencia de conexión."""
+    return JsonResponse(instrumentacion.estadisticas_pools(), json_dumps_params={"ensure_ascii": False, "indent": 2})
+
+
+def _periodo(request):
+    """?desde=AAAA-MM-DD&hasta=AAAA-MM-DD; por defecto, el mes en curso."""
+    hoy = timezone.localdate()
+    desde = request.GET.get("desde")
+    hasta = request.GET.get("hasta")
+    return (
+        date.fromisoformat(desde) if desde else hoy.replace(day=1),
+        date.fromisoformat(hasta) if hasta else hoy,
+    )
+
+
+@staff_member_required
+def reporte_ventas_view(request):
+    """Resumen de ventas del período, leído de los agregados diarios (no de Orden)."""
+    try:
+        desde, hasta = _periodo(request)
+    except ValueError:
+        return HttpResponseBadRequest("Fechas inválidas (AAAA-MM-DD).")
+    datos = reportes.resumen(desde, hasta)
+    return JsonResponse(datos, json_dumps_params={"ensure_ascii": False, "indent": 2})
+
+
+class _Eco:
+    """'Archivo' que devuelve lo escrito: csv.writer arma cada línea y la rendimos."""
+
+    def write(self, valor):
+        return valor
+
+
+@staff_member_required
+def exportar_ordenes_view(request):
+    """CSV de órdenes + items del período, en streaming (ni el queryset ni el CSV quedan en memoria)."""
+    try:
+        desde, hasta = _periodo(request)
+    except ValueError:
+        return HttpResponseBadRequest("Fechas inválidas (AAAA-MM-DD).")
+    escritor = csv.writer(_Eco())
+    # Se elige ahora: el generador corre al enviar la respuesta, fuera del middleware
+    db = routers.db_lectura()
+
+    def filas():
+        yield escritor.writerow(reportes.CABECERA_ORDENES)
+        for fila in reportes.filas_ordenes(desde, hasta, estado=request.GET.get("estado"), using=db):
+            yield escritor.writerow(fila)
+
+    response = StreamingHttpResponse(filas(), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="ordenes-{desde}-{hasta}.csv"'
+    return response
@@ -0,0 +1,137 @@
+"""
+API JSON del carrito, para actualizar el badge del navbar y la página del
+carrito sin recargar todo.
+
+    GET    /api/carrito/                      -> carrito completo
+    POST   /api/carrito/                      -> lote: {"cambios": [...]}
+    PUT    /api/carrito/<producto_id>/        -> {"cantidad": n}   (Cart.set)
+    PATCH  /api/carrito/<producto_id>/        -> {"incremento": n} (Cart.increment; n < 0
+                                                 baja la línea, como Cart.decrement)
+    DELETE /api/carrito/<producto_id>/        -> quita la línea
+
+Cada cambio del lote es {"producto": id, "cantidad": n} o
+{"producto": id, "incremento": n}. Las modificaciones devuelven solo las
+líneas tocadas (cantidad 0 = se quitó) más los totales. Si una línea supera
+el disponible responde 409 con el motivo por línea y no aplica nada.
+
+Usa la cookie CSRF como cualquier POST del sitio (header X-CSRFToken).
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.views import View
+
+from .cart import Cart, CartError, StockInsuficienteError
+
+
+def _linea_json(item):
+    p = item["producto"]
+    return {
+        "producto": p.id,
+        "slug": p.slug,
+        "nombre": p.nombre,
+        "cantidad": item["cantidad"],
+        "precio": str(p.precio),
+        "subtotal": str(item["subtotal"]),
+        "stock_disponible": item["stock_disponible"],
+        "valido": item["valido"],
+    }
+
+
+def _respuesta(cart, claves=None, status=200, **extra):
+    """
+    Totales + líneas. Con 'claves' solo esas líneas; las que ya no están en
+    el carrito salen con cantidad 0 para que el front las saque.
+    """
+    items = {str(item["producto"].id): item for item in cart}
+    if claves is None:
+        lineas = [_linea_json(item) for item in items.values()]
+    else:
+        lineas = [
+            _linea_json(items[k]) if k in items else {"producto": int(k), "cantidad": 0}
+            for k in claves
+        ]
+    ok, problemas = cart.validar_stock_actual()
+    datos = {
+        "lineas": lineas,
+        "cantidad_total": len(cart),
+        "total": str(cart.total),
+        "valido": ok,
+        "problemas": problemas,
+        **extra,
+    }
+    return JsonResponse(datos, status=status, json_dumps_params={"ensure_ascii": False})
+
+
+def _error(mensaje, status=400, **extra):
+    return JsonResponse({"error": mensaje, **extra}, status=status, json_dumps_params={"ensure_ascii": False})
+
+
+class _CarritoApiView(View):
+    def _json(self, request):
+        try:
+            datos = json.loads(request.body or b"{}")
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("El cuerpo no es JSON válido.")
+        if not isinstance(datos, dict):
+            raise ValueError("Se esperaba un objeto JSON.")
+        return datos
+
+    def _aplicar(self, request, cambios):
+        cart = Cart(request)
+        try:
+            tocadas = cart.actualizar_lote(cambios)
+        except StockInsuficienteError as e:
+            # Estado actual de las líneas pedidas, para que el front corrija
+            claves = list(dict.fromkeys(str(int(pid)) for pid, _, _ in cambios))
+            return _respuesta(cart, claves, status=409, error=str(e), errores=e.errores)
+        except CartError as e:
+            return _error(str(e), errores=e.errores)
+        except ValidationError as e:
+            return _error(e.messages[0])
+        except (TypeError, ValueError):
+            return _error("Producto o cantidad inválidos.")
+        return _respuesta(cart, tocadas)
+
+
+class CarritoApiView(_CarritoApiView):
+    def get(self, request):
+        return _respuesta(Cart(request))
+
+    def post(self, request):
+        try:
+            cambios = []
+            for cambio in self._json(request).get("cambios", []):
+                if "cantidad" in cambio:
+                    cambios.append((cambio["producto"], cambio["cantidad"], True))
+                else:
+                    cambios.append((cambio["producto"], cambio.get("incremento", 1), False))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            return _error(str(e) if isinstance(e, ValueError) else "Cambio mal formado.")
+        if not cambios:
+            return _error("No hay cambios.")
+        return self._aplicar(request, cambios)
+
+
+class CarritoLineaApiView(_CarritoApiView):
+    http_method_names = ["put", "patch", "delete", "options"]
+
+    def put(self, request, producto_id):
+        try:
+            cantidad = int(self._json(request)["cantidad"])
+        except (ValueError, TypeError, KeyError):
+            return _error("Falta una 'cantidad' válida.")
+        if cantidad < 0:
+            return _error("La cantidad no puede ser negativa.")
+        return self._aplicar(request, [(producto_id, cantidad, True)])
+
+    def patch(self, request, producto_id):
+        try:
+            incremento = int(self._json(request).get("incremento", 1))
+        except (ValueError, TypeError):
+            return _error("Falta un 'incremento' válido.")
+        return self._aplicar(request, [(producto_id, incremento, False)])
+
+    def delete(self, request, producto_id):
+        return self._aplicar(request, [(producto_id, 0, True)])
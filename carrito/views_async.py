@@ -0,0 +1,156 @@
+"""
+Variantes async (ASGI) de las vistas del storefront.
+
+Mismo comportamiento, templates y URLs que las de views.py; se activan con
+CARRITO_VISTAS_ASYNC=True (ver carrito/urls.py) y sirviendo joyeria.asgi
+con uvicorn (ver README). Mientras una vista espera a la BD o al cache, el
+worker sigue atendiendo otros requests.
+
+Lo que no tiene API async en Django corre en un thread con sync_to_async:
+el render de los templates (lo hace el handler con las TemplateResponse),
+la paginación por cursor y la transacción del checkout.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.shortcuts import aget_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.utils.safestring import mark_safe
+from django.views.generic import TemplateView, View
+
+from . import catalogo, routers
+from .cart import Cart, CartError
+from .forms import AgregarAlCarritoForm, OrdenForm
+from .models import Orden, Producto
+from .views import CheckoutView, ProductoDetalleView, ProductoListaView, clave_idempotencia
+
+
+class ProductoListaAsyncView(ProductoListaView):
+    """Catálogo con el cache de fragmentos de ProductoListaView, consultado en async."""
+
+    async def get(self, request, *args, **kwargs):
+        clave = await catalogo.aclave_pagina(self._clave_pagina())
+        html = await catalogo.aobtener(clave)
+        if html is None:
+            with routers.primaria():
+                self.object_list = self.get_queryset()
+                if self.cursor_activo():
+                    contexto = await sync_to_async(self.get_context_data)()
+                else:
+                    contexto = await self._acontexto_paginado()
+                html = render_to_string(self.fragment_template_name, contexto)
+            await catalogo.aguardar(clave, html)
+        return TemplateResponse(request, self.template_name, {"catalogo_html": mark_safe(html)})
+
+    async def _acontexto_paginado(self):
+        """
+        Misma paginación que la vista sync, pero el COUNT va con acount() y la
+        página se materializa acá: el template ya no consulta nada al renderizar.
+        """
+        self._total = await self.object_list.acount()
+        contexto = self.get_context_data()
+        filas = [p async for p in contexto["page_obj"].object_list]
+        contexto["page_obj"].object_list = filas
+        contexto["object_list"] = filas
+        contexto[self.get_context_object_name(self.object_list)] = filas
+        return contexto
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        total = getattr(self, "_total", None)
+        if total is not None:
+            paginator.__dict__["count"] = total  # cached_property: evita el COUNT sync
+        return paginator
+
+
+class ProductoDetalleAsyncView(ProductoDetalleView):
+    async def get(self, request, *args, **kwargs):
+        self.object = await aget_object_or_404(self.get_queryset(), slug=kwargs[self.slug_url_kwarg])
+        # Los mensajes pueden estar en la sesión: la primera lectura va a un thread
+        condicional = await sync_to_async(self.respuesta_condicional)()
+        if condicional is not None:
+            return condicional
+
+        clave = catalogo.clave_detalle(self.object)
+        html = await catalogo.aobtener(clave)
+        if html is None:
+            html = self.render_ficha()
+            await catalogo.aguardar(clave, html)
+        return self.respuesta(html)
+
+
+class CarritoDetalleAsyncView(TemplateView):
+    template_name = "carrito/carrito_detail.html"
+
+    async def get(self, request, *args, **kwargs):
+        cart = await Cart.acrear(request)
+        # Carga el snapshot: el template itera el carrito y cart.total sin queries
+        ok, problemas = await cart.avalidar_stock_actual()
+        return self.render_to_response(
+            self.get_context_data(cart=cart, cart_valido=ok, cart_problemas=problemas)
+        )
+
+
+class CarritoAgregarAsyncView(View):
+    async def post(self, request, slug):
+        producto = await aget_object_or_404(Producto.objects.con_stock_total(), slug=slug)
+        form = AgregarAlCarritoForm(request.POST, producto=producto)
+        if not form.is_valid():
+            for field, errs in form.errors.items():
+                for e in errs:
+                    messages.error(request, e)
+            return redirect("carrito:producto-detalle", slug=producto.slug)
+
+        try:
+            cart = await Cart.acrear(request)
+            await cart.aadd(producto.id, form.cleaned_data["cantidad"])
+            messages.success(request, f"Agregado «{producto.nombre}» al carrito.")
+        except CartError as e:
+            messages.error(request, str(e))
+
+        return redirect("carrito:carrito-detalle")
+
+
+class CheckoutAsyncView(CheckoutView):
+    """
+    Carga y valida el carrito en async; solo la transacción de la orden
+    (CheckoutView.crear_orden) ocupa un thread.
+    """
+
+    async def get(self, request):
+        cart = await Cart.acrear(request)
+        if len(cart) == 0:
+            messages.info(request, "Tu carrito está vacío.")
+            return redirect("carrito:carrito-detalle")
+
+        ok, problemas = await cart.avalidar_stock_actual()
+        if not ok:
+            for p in problemas:
+                messages.warning(request, p)
+
+        return TemplateResponse(request, "carrito/checkout.html", self.contexto(cart, OrdenForm()))
+
+    async def post(self, request):
+        clave = clave_idempotencia(request)
+        if clave:
+            existente = await (
+                Orden.objects.filter(clave_idempotencia=clave).values_list("pk", flat=True).afirst()
+            )
+            if existente:
+                return redirect("carrito:success", pk=existente)
+
+        cart = await Cart.acrear(request)
+        if len(cart) == 0:
+            messages.info(request, "Tu carrito está vacío.")
+            return redirect("carrito:carrito-detalle")
+
+        ok, problemas = await cart.avalidar_stock_actual()
+        if not ok:
+            ajustes = await sync_to_async(cart.asegurar_maximo_disponible)()
+            for p in problemas:
+                messages.error(request, p)
+            for a in ajustes:
+                messages.warning(request, a)
+            return redirect("carrito:carrito-detalle")
+
+        return await sync_to_async(self.crear_orden)(request, cart)
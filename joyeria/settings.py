@@ -33,8 +33,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "carrito.middleware.WhiteNoiseAsyncMiddleware",  # WhiteNoise que no fuerza sync bajo ASGI
+    "carrito.middleware.QueryBudgetMiddleware",
+    "carrito.middleware.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "carrito.middleware.CartStorageMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -53,10 +56,16 @@ TEMPLATES = [{
         "django.template.context_processors.request",
         "django.contrib.auth.context_processors.auth",
         "django.contrib.messages.context_processors.messages",
+        "carrito.context_processors.carrito",
     ]},
 }]
 
 WSGI_APPLICATION = "joyeria.wsgi.application"
+ASGI_APPLICATION = "joyeria.asgi.application"
+
+# Vistas async del storefront (carrito/views_async.py). Pensado para servir
+# joyeria.asgi con uvicorn; ver "Deploy con ASGI" en el README.
+CARRITO_VISTAS_ASYNC = os.getenv("CARRITO_VISTAS_ASYNC", "False") == "True"
 
 # ----------------------------
 # BASE DE DATOS (SQLite persistente o Postgres si hay DATABASE_URL)
@@ -65,13 +74,154 @@ WSGI_APPLICATION = "joyeria.wsgi.application"
 # En local, al no tener esa env var, usa BASE_DIR/db.sqlite3
 DB_PATH = os.getenv("SQLITE_PATH", str(BASE_DIR / "db.sqlite3"))
 
+# Mantiene conexiones si usás Postgres. Bajo ASGI cada request abre la suya
+# en otro thread: ahí las conexiones persistentes se acumulan, mejor 0.
+DB_CONN_MAX_AGE = 0 if CARRITO_VISTAS_ASYNC else 600
+
+# Postgres: pool de conexiones de psycopg (psycopg[pool]) en lugar de conexiones
+# persistentes. Un pool por proceso, que se abre con la primera query: con
+# gunicorn --preload cada worker arma el suyo después del fork. El total de
+# conexiones es workers x DB_POOL_MAX (x réplicas): que entre en max_connections.
+DB_POOL = os.getenv("DB_POOL", "False") == "True"
+DB_POOL_OPCIONES = {
+    "min_size": int(os.getenv("DB_POOL_MIN", "2")),
+    "max_size": int(os.getenv("DB_POOL_MAX", "10")),
+    # Segundos que un request espera una conexión libre antes de fallar
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    # Cierra las ociosas de más y recicla las viejas (segundos)
+    "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+}
+
+
+def _configurar_postgres(db):
+    """Health check al tomar cada conexión y, con DB_POOL, el pool de psycopg."""
+    if not db["ENGINE"].endswith("postgresql"):
+        return
+    # Persistentes: se verifican al reusarlas. Pool: el pool las chequea al prestarlas.
+    db["CONN_HEALTH_CHECKS"] = True
+    if DB_POOL:
+        db["CONN_MAX_AGE"] = 0  # el pool reemplaza a las conexiones persistentes
+        db.setdefault("OPTIONS", {})["pool"] = dict(DB_POOL_OPCIONES)
+
+
 DATABASES = {
     "default": dj_database_url.config(
         default=f"sqlite:///{DB_PATH}",  # SQLite por defecto (persistente en Render si usás /data)
-        conn_max_age=600,                # mantiene conexiones si usás Postgres
+        conn_max_age=DB_CONN_MAX_AGE,
         # ssl_require=True,              # habilitalo si tu DATABASE_URL lo necesita explícitamente
     )
 }
+if DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+    # Tests en archivo y no en memoria: los de concurrencia abren varias
+    # conexiones a la vez y la BD en memoria compartida se bloquea por tabla.
+    DATABASES["default"]["TEST"] = {"NAME": str(BASE_DIR / "test_db.sqlite3")}
+_configurar_postgres(DATABASES["default"])
+
+# Perfil de producción para SQLite (varios workers de gunicorn sobre el mismo archivo):
+# - WAL: los lectores no bloquean al escritor ni al revés.
+# - synchronous=NORMAL: con WAL no pierde consistencia, solo (ante un corte de
+#   luz) las últimas transacciones confirmadas.
+# - timeout: cuánto espera una conexión al lock antes de "database is locked".
+# - IMMEDIATE: cada transacción toma el lock de escritura en el BEGIN. SQLite
+#   ignora select_for_update; así el checkout (leer stock, validar, descontar)
+#   queda serializado y el que espera lo hace en el BEGIN, respetando el
+#   timeout, en vez de fallar al pasar de lectura a escritura.
+SQLITE_PRODUCCION = os.getenv("SQLITE_PRODUCCION", "True") == "True"
+SQLITE_TIMEOUT = int(os.getenv("SQLITE_TIMEOUT", "20"))
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": os.getenv("SQLITE_CACHE_KB", "-20000"),  # negativo = KiB
+    "temp_store": "MEMORY",
+    "mmap_size": os.getenv("SQLITE_MMAP_BYTES", "134217728"),
+}
+if SQLITE_PRODUCCION and DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+    DATABASES["default"]["OPTIONS"] = {
+        "init_command": "; ".join(f"PRAGMA {k}={v}" for k, v in SQLITE_PRAGMAS.items()),
+        "transaction_mode": "IMMEDIATE",
+        "timeout": SQLITE_TIMEOUT,
+    }
+
+# Réplicas de lectura para catálogo y reportes (ver carrito/routers.py):
+#   DATABASE_REPLICA_URLS="postgres://...réplica1,postgres://...réplica2"
+# Quedan como replica1, replica2, ... En los tests apuntan a la BD de default.
+DATABASE_REPLICAS = []
+for _url in filter(None, (u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(","))):
+    _alias = f"replica{len(DATABASE_REPLICAS) + 1}"
+    DATABASES[_alias] = dj_database_url.parse(_url, conn_max_age=DB_CONN_MAX_AGE)
+    DATABASES[_alias]["TEST"] = {"MIRROR": "default"}
+    _configurar_postgres(DATABASES[_alias])
+    DATABASE_REPLICAS.append(_alias)
+DATABASE_ROUTERS = ["carrito.routers.ReplicaRouter"]
+# Segundos que un navegador lee de la primaria después de escribir (p.ej. tras comprar)
+REPLICAS_PEGADO_SEGUNDOS = int(os.getenv("REPLICAS_PEGADO_SEGUNDOS", "30"))
+
+# ----------------------------
+# CACHE (catálogo y demás)
+# ----------------------------
+# CACHE_URL elige el backend:
+#   locmem://                 -> memoria del proceso (default con DEBUG; los tests lo fuerzan
+#                                desde TEST_RUNNER)
+#   file:///ruta/a/carpeta    -> archivos (compartido entre workers del mismo server;
+#                                default en producción, en BASE_DIR/.cache)
+#   redis://host:6379/0       -> Redis o compatible (compartido entre servers)
+# La versión del catálogo y los carritos en cache tienen que verse desde todos
+# los workers: con locmem cada worker de gunicorn tiene la suya y sirve páginas
+# viejas hasta el timeout (manage.py check --deploy lo avisa).
+CACHE_URL = os.getenv("CACHE_URL", "locmem://" if DEBUG else "file://")
+
+if CACHE_URL.startswith(("redis://", "rediss://")):
+    _cache_default = {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": CACHE_URL}
+elif CACHE_URL.startswith("file://"):
+    _cache_default = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_URL[len("file://"):] or str(BASE_DIR / ".cache"),
+    }
+else:
+    _cache_default = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "joyeria"}
+
+CACHES = {"default": _cache_default}
+
+# manage.py test corre con el cache en memoria, sin importar CACHE_URL
+TEST_RUNNER = "joyeria.test_runner.TestRunner"
+
+# Segundos que vive una página del catálogo cacheada (igual se invalida al editar productos)
+CATALOGO_CACHE_SEGUNDOS = int(os.getenv("CATALOGO_CACHE_SEGUNDOS", "600"))
+
+# Paginación del catálogo: "offset" (?page=N, default) o "cursor" (?after=/?before=, keyset)
+CATALOGO_PAGINACION = os.getenv("CATALOGO_PAGINACION", "offset")
+
+# Dónde se guarda el carrito (ver carrito/cart_storage.py):
+#   carrito.cart_storage.SessionCartStorage       -> sesión de Django (default)
+#   carrito.cart_storage.SignedCookieCartStorage  -> cookie firmada, sin BD
+#   carrito.cart_storage.CacheCartStorage         -> cache (CACHE_URL), id en cookie
+CARRITO_STORAGE = os.getenv("CARRITO_STORAGE", "carrito.cart_storage.SessionCartStorage")
+CARRITO_COOKIE_NOMBRE = "carrito"
+CARRITO_COOKIE_DIAS = 30
+CARRITO_COOKIE_MAX_BYTES = 3000
+
+# Presupuesto de queries por vista (sin contar BEGIN/COMMIT ni SAVEPOINTs). Ver carrito/instrumentacion.py
+QUERY_BUDGETS = {
+    "carrito:home": 3,
+    "carrito:buscar": 3,
+    "carrito:producto-detalle": 3,  # producto + "comprados juntos"
+    "carrito:carrito-detalle": 3,
+    "carrito:carrito-agregar": 8,
+    "carrito:carrito-quitar": 6,
+    "carrito:api-carrito": 6,
+    "carrito:api-carrito-linea": 6,
+    "carrito:checkout": 13,  # incluye el INSERT del libro de movimientos
+    "carrito:success": 2,
+}
+# True: pasarse del presupuesto levanta excepción (lo activan los tests que miden presupuestos,
+# con override_settings). False: warning en el log y header X-DB-Presupuesto. Se chequea cuando
+# la vista ya confirmó: en desarrollo un checkout excedido daría 500 con la orden y el stock ya
+# guardados.
+QUERY_BUDGET_ESTRICTO = os.getenv("QUERY_BUDGET_ESTRICTO", "False") == "True"
+
+# Minutos que un carrito aparta stock (ver carrito.models.Reserva)
+RESERVA_MINUTOS = int(os.getenv("RESERVA_MINUTOS", "15"))
 
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -0,0 +1,22 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner con el cache en memoria: fuera de DEBUG el default es
+    file:// (.cache/), que sobrevive entre corridas y mezclaría páginas y
+    carritos de una base de test con la siguiente. Lo mismo que hace Django
+    con EMAIL_BACKEND.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache = override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"},
+        })
+        self._cache.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache.disable()
+        super().teardown_test_environment(**kwargs)